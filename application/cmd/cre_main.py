@@ -17,6 +17,7 @@ from application.utils.external_project_parsers.base_parser import BaseParser
 from application import create_app  # type: ignore
 from application.config import CMDConfig
 from application.database import db
+from application.database import inmemory_gap_analysis
 from application.defs import cre_defs as defs
 from application.defs import osib_defs as odefs
 from application.utils import spreadsheet as sheet_utils
@@ -32,6 +33,9 @@ logger.setLevel(logging.INFO)
 
 app = None
 
+# how many standard entries register_standard adds per transaction, 0 adds them one at a time
+IMPORT_BATCH_SIZE = int(os.environ.get("CRE_IMPORT_BATCH_SIZE", "500"))
+
 
 def register_node(node: defs.Node, collection: db.Node_collection) -> db.Node:
     """
@@ -49,6 +53,7 @@ def register_node(node: defs.Node, collection: db.Node_collection) -> db.Node:
             doctype=node.doctype,
             embeddings=node.embeddings,
             embedding_text=node.embeddings_text,
+            model=node.embeddings_model,
         )
     cre_less_nodes: List[defs.Node] = []
 
@@ -109,6 +114,50 @@ def register_node(node: defs.Node, collection: db.Node_collection) -> db.Node:
     return linked_node
 
 
+def links_only_cres(node: defs.Node) -> bool:
+    """whether register_nodes can register the node, nodes linking other nodes need register_node"""
+    return all(type(link.document).__name__ == defs.CRE.__name__ for link in node.links)
+
+
+def register_nodes(
+    nodes: List[defs.Node], collection: db.Node_collection
+) -> List[Optional[db.Node]]:
+    """
+    register_node for many nodes that only link CREs, in one transaction:
+    the nodes are upserted together, the CREs they link are looked up in one query and the links are upserted together.
+    Like register_node it raises if a node links a CRE that is not in the database, before writing anything
+    """
+    cres = collection.get_dbCREs_by_name(
+        [link.document.name for node in nodes for link in node.links]
+    )
+    for node in nodes:
+        for link in node.links:
+            if link.document.name.lower() not in cres:
+                raise ValueError(
+                    f"{node.id} links CRE {link.document.name} which does not exist in the db"
+                )
+    dbnodes = collection.add_nodes(nodes)
+    links: List[Tuple[db.CRE, db.Node, defs.LinkTypes]] = []
+    embeddings: Dict[str, List[Tuple[db.Node, defs.Credoctypes, List[float], str]]] = {}
+    for node, dbnode in zip(nodes, dbnodes):
+        if not dbnode:
+            continue
+        if node.embeddings:
+            embeddings.setdefault(node.embeddings_model, []).append(
+                (dbnode, node.doctype, node.embeddings, node.embeddings_text)
+            )
+        for link in node.links:
+            links.append((cres[link.document.name.lower()], dbnode, link.ltype))
+    collection.add_links(links)
+
+    # add_embeddings commits
+    for model, model_embeddings in embeddings.items():
+        collection.add_embeddings(model_embeddings, model=model)
+    if not embeddings:
+        collection.session.commit()
+    return dbnodes
+
+
 def register_cre(cre: defs.CRE, collection: db.Node_collection) -> Tuple[db.CRE, bool]:
     collection = collection.with_graph()
     existing = False
@@ -150,6 +199,68 @@ def register_cre(cre: defs.CRE, collection: db.Node_collection) -> Tuple[db.CRE,
     return dbcre, existing
 
 
+def register_cres(cres: List[defs.CRE], collection: db.Node_collection) -> List[db.CRE]:
+    """
+    register_cre for a whole CRE hierarchy, in one transaction:
+    the CREs and the links between them are resolved in memory against one snapshot of the database
+    and the in memory graph, in the order register_cre would add them, then written together.
+    Returns the database CRE of each of cres
+    """
+    collection = collection.with_graph()
+    documents: List[defs.CRE] = []
+    # (higher, lower, link type) and (cre, link) by index in documents
+    internal_links: List[Tuple[int, int, defs.LinkTypes]] = []
+    node_links: List[Tuple[int, defs.Link]] = []
+
+    def visit(cre: defs.CRE) -> int:
+        index = len(documents)
+        documents.append(cre)
+        for link in cre.links:
+            if type(link.document) != defs.CRE:
+                node_links.append((index, link))
+                continue
+            other = visit(link.document)
+            # the following flips the PartOf relationship so that we only have contains relationship in the database
+            if link.ltype == defs.LinkTypes.Contains:
+                internal_links.append((index, other, defs.LinkTypes.Contains))
+            elif link.ltype == defs.LinkTypes.PartOf:
+                internal_links.append((other, index, defs.LinkTypes.Contains))
+            elif link.ltype == defs.LinkTypes.Related:
+                internal_links.append((other, index, defs.LinkTypes.Related))
+            else:
+                raise ValueError(f"Unknown link type {link.ltype}")
+        return index
+
+    roots = []
+    with alive_bar(len(cres), title="Resolving CREs") as bar:
+        for cre in cres:
+            roots.append(visit(cre))
+            bar()
+
+    t0 = time.perf_counter()
+    dbcres = collection.add_cres(documents)
+    added = collection.add_internal_links(
+        [
+            (dbcres[higher], dbcres[lower], ltype)
+            for higher, lower, ltype in internal_links
+        ]
+    )
+    collection.session.commit()
+    logger.info(
+        f"Wrote {len(set(map(id, dbcres)))} CREs and {added} new links between them in {time.perf_counter() - t0:.1f}s"
+    )
+
+    with alive_bar(len(node_links), title="Linking nodes") as bar:
+        for index, link in node_links:
+            collection.add_link(
+                cre=dbcres[index],
+                node=register_node(node=link.document, collection=collection),
+                ltype=link.ltype,
+            )
+            bar()
+    return [dbcres[index] for index in roots]
+
+
 def parse_file(
     filename: str, yamldocs: List[Dict[str, Any]], scollection: db.Node_collection
 ) -> Optional[List[defs.Document]]:
@@ -258,22 +369,42 @@ def register_standard(
     logger.info(
         f"Registering resource {importing_name} of length {len(standard_entries)}"
     )
+    batch: List[defs.Node] = []
     for node in standard_entries:
         if not node:
             logger.info(
                 f"encountered empty node while importing {standard_entries[0].name}"
             )
             continue
-        register_node(node, collection)
+        if IMPORT_BATCH_SIZE and links_only_cres(node):
+            batch.append(node)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                register_nodes(batch, collection)
+                batch = []
+        else:
+            # the entries before it may provide the CREs its linked nodes are mapped to
+            if batch:
+                register_nodes(batch, collection)
+                batch = []
+            register_node(node, collection)
         if node.embeddings:
             logger.debug(
                 f"node has embeddings populated, skipping generation for resource {importing_name}"
             )
             generate_embeddings = False
+    if batch:
+        register_nodes(batch, collection)
     if generate_embeddings and importing_name:
         ph.generate_embeddings_for(importing_name)
 
     if calculate_gap_analysis and not os.environ.get("CRE_NO_CALCULATE_GAP_ANALYSIS"):
+        if inmemory_gap_analysis.enabled():
+            # one pass for the new standard against all others and one per other standard against it,
+            # instead of a job per pair
+            db.gap_analysis_batch(sources=[importing_name], cre_db=collection)
+            db.gap_analysis_batch(targets=[importing_name], cre_db=collection)
+            conn.set(standard_hash, value="")
+            return
         # calculate gap analysis
         populate_neo4j_db(db_connection_str)
         jobs = []
@@ -315,6 +446,26 @@ def register_standard(
         conn.set(standard_hash, value="")
 
 
+def recalculate_gap_analyses(
+    collection: db.Node_collection, db_connection_str: str = ""
+) -> None:
+    """calculates the gap analysis results the writes made through collection invalidated again"""
+    cache_keys = collection.pop_invalidated_gap_analyses()
+    if not cache_keys or os.environ.get("CRE_NO_CALCULATE_GAP_ANALYSIS"):
+        return
+    logger.info(f"Recalculating {len(cache_keys)} invalidated gap analyses")
+    if inmemory_gap_analysis.enabled():
+        targets: Dict[str, List[str]] = {}
+        for cache_key in cache_keys:
+            source, target = cache_key.split(" >> ")
+            targets.setdefault(source, []).append(target)
+        for source, names in targets.items():
+            db.gap_analysis_batch(sources=[source], targets=names, cre_db=collection)
+        return
+    populate_neo4j_db(db_connection_str)
+    gap_analysis.reschedule(cache_keys, database=collection)
+
+
 def parse_standards_from_spreadsheeet(
     cre_file: List[Dict[str, Any]],
     cache_location: str,
@@ -332,10 +483,9 @@ def parse_standards_from_spreadsheeet(
         jobs = []
         logger.info(f"Importing {len(docs.get(defs.Credoctypes.CRE.value))} CREs")
 
-        with alive_bar(len(docs.get(defs.Credoctypes.CRE.value))) as bar:
-            for cre in docs.pop(defs.Credoctypes.CRE.value):
-                register_cre(cre, collection)
-                bar()
+        register_cres(docs.pop(defs.Credoctypes.CRE.value), collection)
+        # the results of standards that are not imported again and whose paths the new CRE links changed
+        recalculate_gap_analyses(collection, db_connection_str=cache_location)
 
         if not os.environ.get("CRE_NO_NEO4J"):
             populate_neo4j_db(cache_location)
@@ -666,6 +816,9 @@ def run(args: argparse.Namespace) -> None:  # pragma: no cover
 
     if args.preload_map_analysis_target_url:
         gap_analysis.preload(target_url=args.preload_map_analysis_target_url)
+    if args.recalculate_map_analysis:
+        cache = db_connect(args.cache_file)
+        db.gap_analysis_batch(overwrite=True, cre_db=cache)
     if args.upstream_sync:
         donwload_graph_from_upstream(args.cache_file)
 
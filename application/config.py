@@ -8,6 +8,8 @@ class Config:
     SQLALCHEMY_RECORD_QUERIES = False
     ITEMS_PER_PAGE = 20
     SLOW_DB_QUERY_TIME = 0.5
+    # how long a web worker trusts its cached content generation before checking the database again
+    CONTENT_GENERATION_CACHE_SECONDS = 5
 
 
 class DevelopmentConfig(Config):
@@ -24,6 +26,7 @@ class TestingConfig(Config):
     ENVIRONMENT = "TESTING"
     CACHE_TYPE = "SimpleCache"
     TESTING = True
+    CONTENT_GENERATION_CACHE_SECONDS = 0
     SQLALCHEMY_DATABASE_URI = os.environ.get("TEST_DATABASE_URL") or "sqlite://"
 
 
@@ -1,26 +1,33 @@
 from sqlalchemy import CheckConstraint
 import networkx as nx
+import numpy as np
 import uuid
 import neo4j
 import os
 import logging
+import glob
+import hashlib
+import math
 import re
+import time
 import yaml
 
 from pprint import pprint
 
 from collections import Counter
-from itertools import permutations
-from typing import Any, Dict, List, Optional, Tuple, cast
+from itertools import islice, permutations
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, cast
 from neomodel.exceptions import (
     DoesNotExist,
     FeatureNotSupported,
     NodeClassAlreadyDefined,
 )
+from flask import has_request_context
 from flask import json as flask_json
 from sqlalchemy.orm import aliased
 from flask_sqlalchemy.model import DefaultMeta
-from sqlalchemy import func, delete
+from sqlalchemy import event, func, delete
+from sqlalchemy.dialects import postgresql, sqlite
 
 from neomodel import (
     config,
@@ -34,13 +41,21 @@ from neomodel import (
     StructuredRel,
     db,
 )
+from application.database import embedding_index
+from application.database import inmemory_gap_analysis
 from application.database import inmemory_graph
+from application.database import inmemory_index
+from application.database import text_index
 from application.utils import redis
 from application.defs import cre_defs
 from application.utils import file
 from application.utils.gap_analysis import (
+    get_key_dependencies,
     get_path_score,
+    get_paths_dependencies,
+    make_cre_dependency,
     make_resources_key,
+    make_standard_dependency,
     make_subresources_key,
 )
 
@@ -54,11 +69,103 @@ logger.setLevel(logging.INFO)
 
 BaseModel: DefaultMeta = sqla.Model
 
+# how often (in seconds) a loaded in memory index checks whether another process changed the database
+INDEX_GENERATION_CHECK_INTERVAL = float(
+    os.environ.get("CRE_INMEMORY_INDEX_CHECK_INTERVAL", "5")
+)
+
+# keeps "IN (...)" clauses below the bound parameter limit of older sqlite builds
+IN_QUERY_BATCH_SIZE = 500
+
+
+def batched(items: List[Any], size: Optional[int] = None) -> Iterator[List[Any]]:
+    size = size or IN_QUERY_BATCH_SIZE
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
 
 def generate_uuid():
     return str(uuid.uuid4())
 
 
+def upsert(session, table: sqla.Table) -> Any:
+    """an INSERT of the session's dialect that supports ON CONFLICT, or a plain INSERT if it has none"""
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    elif dialect == "postgresql":
+        return postgresql.insert(table)
+    logger.warning(f"no upsert support for {dialect}, inserting")
+    return table.insert()
+
+
+# embeddings are stored as little endian float32 blobs, rows written before that keep them as comma separated strings
+EMBEDDINGS_DTYPE = np.dtype("<f4")
+# how many embeddings iter_embeddings_by_doc_type decodes at once
+EMBEDDINGS_CHUNK_SIZE = 1000
+
+
+def encode_embeddings(embeddings: List[float]) -> Tuple[bytes, int, float]:
+    """returns the (blob, dimensions, norm) that are stored for an embedding"""
+    vector = np.asarray(embeddings, dtype=EMBEDDINGS_DTYPE)
+    return vector.tobytes(), len(vector), float(np.linalg.norm(vector))
+
+
+def embeddings_content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode()).hexdigest()
+
+
+def is_embedding_current(
+    embedding: Optional["Embeddings"], text: str, model: str
+) -> bool:
+    """
+    whether embedding is of text by model, so that embedding text again would give the same result.
+    Embeddings whose model is not recorded are not of any known model
+    """
+    return (
+        embedding is not None
+        and embedding.embeddings_content_hash == embeddings_content_hash(text)
+        and (not model or embedding.embeddings_model == model)
+    )
+
+
+def embeddings_matrix(
+    rows: List[Tuple[str, Optional[bytes], Optional[int], Optional[str]]]
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Decodes (id, vector, dimensions, legacy string) rows into their ids and one contiguous float32 matrix,
+    rows whose dimensions differ from the first one are skipped
+    """
+    ids: List[str] = []
+    blobs: List[bytes] = []
+    dimensions = None
+    for db_id, vector, vector_dimensions, legacy in rows:
+        if not vector:
+            # not migrated yet
+            vector = decode_embeddings(None, legacy).tobytes()
+            vector_dimensions = len(vector) // EMBEDDINGS_DTYPE.itemsize
+        if dimensions is None:
+            dimensions = vector_dimensions
+        elif vector_dimensions != dimensions:
+            logger.warning(
+                f"embedding of {db_id} has {vector_dimensions} dimensions instead of {dimensions}, skipping"
+            )
+            continue
+        ids.append(db_id)
+        blobs.append(vector)
+    matrix = np.frombuffer(b"".join(blobs), dtype=EMBEDDINGS_DTYPE).reshape(
+        len(ids), dimensions or 0
+    )
+    return ids, matrix
+
+
+def decode_embeddings(vector: Optional[bytes], legacy: Optional[str]) -> np.ndarray:
+    """the float32 embedding of a row, from its blob if it has one or from its legacy string otherwise"""
+    if vector:
+        return np.frombuffer(vector, dtype=EMBEDDINGS_DTYPE)
+    return np.array(legacy.split(","), dtype=EMBEDDINGS_DTYPE)
+
+
 class Node(BaseModel):  # type: ignore
     __tablename__ = "node"
     id = sqla.Column(sqla.String, primary_key=True, default=generate_uuid)
@@ -109,6 +216,21 @@ class CRE(BaseModel):  # type: ignore
     )
 
 
+# the free text index lives outside of the ORM, it is created and dropped along with the tables it covers
+def create_text_index(target, connection, **kw):
+    text_index.create(connection, target.name)
+
+
+def drop_text_index(target, connection, **kw):
+    text_index.drop(connection, target.name)
+
+
+event.listen(Node.__table__, "after_create", create_text_index)
+event.listen(Node.__table__, "before_drop", drop_text_index)
+event.listen(CRE.__table__, "after_create", create_text_index)
+event.listen(CRE.__table__, "before_drop", drop_text_index)
+
+
 class InternalLinks(BaseModel):  # type: ignore
     # model cre-groups linking cres
     __tablename__ = "cre_links"
@@ -159,7 +281,9 @@ class Links(BaseModel):  # type: ignore
 class Embeddings(BaseModel):  # type: ignore
     __tablename__ = "embeddings"
 
-    embeddings = sqla.Column(sqla.String)
+    embeddings = sqla.Column(
+        sqla.String
+    )  # comma separated floats, rows written before the vector columns
     doc_type = sqla.Column(sqla.String)
     cre_id = sqla.Column(
         sqla.String,
@@ -174,9 +298,15 @@ class Embeddings(BaseModel):  # type: ignore
 
     embeddings_url = sqla.Column(sqla.String, default="")
     embeddings_content = sqla.Column(sqla.String, default="")
+    # see encode_embeddings, rows that have a vector store an empty embeddings string
+    embeddings_vector = sqla.Column(sqla.LargeBinary, nullable=True)
+    embeddings_dimensions = sqla.Column(sqla.Integer, nullable=True)
+    embeddings_norm = sqla.Column(sqla.Float, nullable=True)
+    # see embeddings_content_hash, rows written before the model was recorded have none
+    embeddings_content_hash = sqla.Column(sqla.String, nullable=True, index=True)
+    embeddings_model = sqla.Column(sqla.String, nullable=True)
     __table_args__ = (
         sqla.PrimaryKeyConstraint(
-            embeddings,
             doc_type,
             cre_id,
             node_id,
@@ -192,6 +322,30 @@ class GapAnalysisResults(BaseModel):
     __table_args__ = (sqla.UniqueConstraint(cache_key, name="unique_cache_key_field"),)
 
 
+class GapAnalysisDependencies(BaseModel):  # type: ignore
+    # what a gap analysis result was calculated from, make_cre_dependency() or make_standard_dependency() keys,
+    # the result (and its subresources) is deleted as soon as any of them changes
+    __tablename__ = "gap_analysis_dependencies"
+    cache_key = sqla.Column(sqla.String, primary_key=True)
+    dependency = sqla.Column(sqla.String, primary_key=True, index=True)
+
+
+class ContentGeneration(BaseModel):  # type: ignore
+    # single row table, the generation is bumped on every write to the cre, node and link tables
+    # so that in memory copies of the data can tell when they are stale
+    __tablename__ = "content_generation"
+    id = sqla.Column(sqla.Integer, primary_key=True)
+    generation = sqla.Column(sqla.Integer, default=0, nullable=False)
+
+
+class EmbeddingsGeneration(BaseModel):  # type: ignore
+    # one row per doc_type, the generation is bumped on every write to the embeddings of the doc_type
+    # so that embeddings indexes can tell when they are stale
+    __tablename__ = "embeddings_generation"
+    doc_type = sqla.Column(sqla.String, primary_key=True)
+    generation = sqla.Column(sqla.Integer, default=0, nullable=False)
+
+
 class RelatedRel(StructuredRel):
     pass
 
@@ -671,26 +825,353 @@ class NEO_DB:
 
 class Node_collection:
     graph: inmemory_graph.CRE_Graph = None
+    index: inmemory_index.Document_Index = None
     neo_db: NEO_DB = None
     session = sqla.session
+    # shared by every collection in the process, rebuilt when the database content changes
+    __gap_analysis_graph: inmemory_gap_analysis.Gap_Analysis_Graph = None
+    # (database, doc_type) -> embeddings index, shared by every collection in the process and kept up to date by add_embedding
+    __embeddings_indexes: Dict[Tuple[str, str], embedding_index.IVF_Index] = {}
 
     def __init__(self) -> None:
         if not os.environ.get("NO_LOAD_GRAPH_DB"):
             self.neo_db = NEO_DB.instance()
+        # cache keys of the gap analysis results invalidated by the writes of this collection, to calculate again
+        self.invalidated_gap_analyses: Set[str] = set()
+        # only while serving web requests, importers write between reads and every write invalidates the index
+        if os.environ.get("CRE_INMEMORY_INDEX") and has_request_context():
+            self.index = inmemory_index.Document_Index.instance()
         self.session = sqla.session
 
+    def with_index(self) -> "Node_collection":
+        """serve exact match lookups from the process wide in memory index"""
+        self.index = inmemory_index.Document_Index.instance()
+        return self
+
+    def get_generation(self) -> int:
+        generation = (
+            self.session.query(ContentGeneration.generation)
+            .filter(ContentGeneration.id == 1)
+            .first()
+        )
+        return generation[0] if generation else 0
+
+    def bump_generation(self) -> None:
+        """marks the database content as changed, the change is committed by the caller's commit"""
+        updated = (
+            self.session.query(ContentGeneration)
+            .filter(ContentGeneration.id == 1)
+            .update(
+                {ContentGeneration.generation: ContentGeneration.generation + 1},
+                synchronize_session=False,
+            )
+        )
+        if not updated:
+            self.session.add(ContentGeneration(id=1, generation=1))
+        inmemory_index.Document_Index.instance().invalidate()
+        Node_collection.__gap_analysis_graph = None
+
+    def __get_index(self) -> Optional[inmemory_index.Document_Index]:
+        """returns the in memory index if enabled, (re)loading it if the database content changed"""
+        if not self.index:
+            return None
+        index = inmemory_index.Document_Index.instance()
+        if (
+            index.is_loaded()
+            and time.monotonic() - index.last_checked < INDEX_GENERATION_CHECK_INTERVAL
+        ):
+            self.index = index
+            return index
+        generation = self.get_generation()
+        if generation == index.generation:
+            index.last_checked = time.monotonic()
+        else:
+            with inmemory_index.Document_Index.reload_lock:
+                # another request may have loaded it while this one waited
+                index = inmemory_index.Document_Index.instance()
+                if generation != index.generation:
+                    index = self.__load_index(generation)
+        self.index = index
+        return index
+
+    def __load_index(self, generation: int) -> inmemory_index.Document_Index:
+        logger.info(f"Loading in memory index for generation {generation}")
+        cres = [(c.id, CREfromDB(c)) for c in self.session.query(CRE).all()]
+        nodes = [
+            (
+                n.id,
+                nodeFromDB(n),
+                {
+                    "name": n.name,
+                    "section": n.section,
+                    "subsection": n.subsection,
+                    "section_id": n.section_id,
+                    "link": n.link,
+                    "version": n.version,
+                    "ntype": n.ntype,
+                    "description": n.description,
+                },
+            )
+            for n in self.session.query(Node).all()
+        ]
+        return inmemory_index.Document_Index.load(
+            generation=generation,
+            cres=cres,
+            nodes=nodes,
+            cre_node_links=self.session.query(Links.cre, Links.node, Links.type).all(),
+            internal_links=self.session.query(
+                InternalLinks.group, InternalLinks.cre, InternalLinks.type
+            ).all(),
+        )
+
+    def gap_analysis_graph(self) -> inmemory_gap_analysis.Gap_Analysis_Graph:
+        """
+        The in memory gap analysis graph of the current database content.
+        Writes of this process drop it (see bump_generation), changes made by other processes
+        are picked up by comparing content hashes every INDEX_GENERATION_CHECK_INTERVAL seconds.
+        """
+        ga_graph = Node_collection.__gap_analysis_graph
+        if (
+            ga_graph
+            and time.monotonic() - ga_graph.last_checked
+            < INDEX_GENERATION_CHECK_INTERVAL
+        ):
+            return ga_graph
+        content_hash = self.content_hash()
+        if ga_graph and ga_graph.content_hash == content_hash:
+            ga_graph.last_checked = time.monotonic()
+            return ga_graph
+        logger.info(f"Loading gap analysis graph for content {content_hash}")
+        ga_graph = inmemory_gap_analysis.Gap_Analysis_Graph(
+            cres=[(c.id, CREfromDB(c)) for c in self.session.query(CRE).all()],
+            nodes=[(n.id, nodeFromDB(n)) for n in self.session.query(Node).all()],
+            cre_node_links=self.session.query(Links.cre, Links.node, Links.type).all(),
+            internal_links=self.session.query(
+                InternalLinks.group, InternalLinks.cre, InternalLinks.type
+            ).all(),
+            content_hash=content_hash,
+        )
+        ga_graph.last_checked = time.monotonic()
+        Node_collection.__gap_analysis_graph = ga_graph
+        return ga_graph
+
+    def embeddings_index(self, doc_type: str) -> embedding_index.IVF_Index:
+        """
+        The approximate nearest neighbour index of the embeddings of doc_type.
+        It is loaded from its copy on disk (see __embeddings_index_path) if that is up to date,
+        otherwise built from the embeddings table and saved there.
+        Every INDEX_GENERATION_CHECK_INTERVAL seconds its generation is compared with the embeddings generation of doc_type,
+        which picks up the embeddings other processes added or changed.
+        """
+        key = (self.__database_hash(), doc_type)
+        index = Node_collection.__embeddings_indexes.get(key)
+        if (
+            index
+            and time.monotonic() - index.last_checked < INDEX_GENERATION_CHECK_INTERVAL
+        ):
+            return index
+        generation = self.get_embeddings_generation(doc_type)
+        if not index or index.generation != generation:
+            index = self.__load_embeddings_index(doc_type, generation)
+            Node_collection.__embeddings_indexes[key] = index
+        index.last_checked = time.monotonic()
+        return index
+
+    def get_embeddings_generation(self, doc_type: str) -> int:
+        generation = (
+            self.session.query(EmbeddingsGeneration.generation)
+            .filter(EmbeddingsGeneration.doc_type == doc_type)
+            .first()
+        )
+        return generation[0] if generation else 0
+
+    def __bump_embeddings_generation(self, doc_type: str) -> int:
+        """
+        marks the embeddings of doc_type as changed and returns the new generation,
+        the change is committed by the caller's commit
+        """
+        updated = (
+            self.session.query(EmbeddingsGeneration)
+            .filter(EmbeddingsGeneration.doc_type == doc_type)
+            .update(
+                {EmbeddingsGeneration.generation: EmbeddingsGeneration.generation + 1},
+                synchronize_session=False,
+            )
+        )
+        if not updated:
+            self.session.add(EmbeddingsGeneration(doc_type=doc_type, generation=1))
+            self.session.flush()
+        # the row stays locked until the commit, so this is the generation of this change
+        return self.get_embeddings_generation(doc_type)
+
+    def __load_embeddings_index(
+        self, doc_type: str, generation: int
+    ) -> embedding_index.IVF_Index:
+        index_path = self.__embeddings_index_path(doc_type)
+        if index_path and os.path.exists(index_path):
+            try:
+                index = embedding_index.IVF_Index.load(index_path)
+                if index.generation == generation:
+                    logger.info(f"Loaded embeddings index {index_path}")
+                    return index
+                logger.info(f"Embeddings index {index_path} is out of date")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load embeddings index {index_path}: {e}")
+
+        logger.info(f"Building embeddings index for {doc_type}")
+        ids, matrix = self.get_embeddings_matrix_by_doc_type(doc_type)
+        index = embedding_index.IVF_Index(ids, matrix)
+        # read before the embeddings, a change in between makes the next check build the index again
+        index.generation = generation
+        if index_path:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            index.save(index_path)
+        return index
+
+    def __embeddings_index_path(self, doc_type: str) -> Optional[str]:
+        """in CRE_EMBEDDINGS_INDEX_DIR or else next to the sqlite database file, None for other databases"""
+        index_dir = os.environ.get("CRE_EMBEDDINGS_INDEX_DIR")
+        if not index_dir:
+            url = self.session.get_bind().url
+            if url.get_backend_name() != "sqlite" or url.database in (
+                None,
+                "",
+                ":memory:",
+            ):
+                return None
+            index_dir = os.path.dirname(os.path.abspath(url.database))
+        return os.path.join(
+            index_dir, f"embeddings_{doc_type.lower()}_{self.__database_hash()}.npz"
+        )
+
+    def __update_embeddings_index(
+        self, doc_type: str, db_id: str, embeddings: List[float], generation: int
+    ) -> None:
+        """
+        adds a new or changed embedding to the loaded index of doc_type and to the log of its copy on disk
+        Args:
+            generation (int): the embeddings generation of doc_type the change was committed with
+        """
+        key = (self.__database_hash(), doc_type)
+        index = Node_collection.__embeddings_indexes.get(key)
+        index_path = self.__embeddings_index_path(doc_type)
+        if index:
+            index.advance(generation)
+            if index.generation != generation:
+                # another process changed the embeddings meanwhile, embeddings_index builds it again
+                logger.info(f"Dropping the stale embeddings index of {doc_type}")
+                del Node_collection.__embeddings_indexes[key]
+                index = None
+        if index:
+            try:
+                if index.add(db_id, embeddings):
+                    # the centroids were trained again, the whole index changed
+                    if index_path:
+                        index.save(index_path)
+                    return
+            except ValueError as e:
+                # e.g. the embeddings model changed, embeddings_index builds it again
+                logger.warning(f"Dropping the embeddings index of {doc_type}: {e}")
+                del Node_collection.__embeddings_indexes[key]
+        if index_path and os.path.exists(index_path):
+            embedding_index.append_log(index_path, db_id, embeddings, generation)
+
     def with_graph(self) -> "Node_collection":
         logger.info("Loading CRE graph in memory, memory-heavy operation!")
         self.graph = inmemory_graph.CRE_Graph()
         graph_singleton = inmemory_graph.Singleton_Graph_Storage.instance()
-        self.graph.with_graph(
-            graph=graph_singleton,
-            graph_data=self.__get_all_nodes_and_cres(cres_only=True),
-        )
+        if len(graph_singleton.edges):
+            self.graph.with_graph(graph=graph_singleton, graph_data=[])
+        else:
+            self.__load_graph(graph=graph_singleton)
         logger.info("Successfully loaded CRE graph in memory")
 
         return self
 
+    def content_hash(self) -> str:
+        """identifies the current content of the cre, node and link tables"""
+        counts = [
+            self.session.query(table).count()
+            for table in (CRE, Node, InternalLinks, Links)
+        ]
+        return hashlib.sha1(f"{self.get_generation()}:{counts}".encode()).hexdigest()[
+            :16
+        ]
+
+    def __graph_snapshot_path(self) -> Optional[str]:
+        snapshot_dir = os.environ.get("CRE_GRAPH_SNAPSHOT_DIR")
+        if not snapshot_dir:
+            return None
+        return os.path.join(
+            snapshot_dir,
+            f"cre_graph_{self.__database_hash()}_{self.content_hash()}.npz",
+        )
+
+    def __database_hash(self) -> str:
+        return hashlib.sha1(str(self.session.get_bind().url).encode()).hexdigest()[:12]
+
+    def __load_graph(self, graph: nx.DiGraph) -> None:
+        """
+        Loads the graph from the on disk snapshot of the current database content if there is one (CRE_GRAPH_SNAPSHOT_DIR),
+        otherwise builds it from the database and stores a snapshot of it
+        """
+        snapshot_path = self.__graph_snapshot_path()
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                nodes, edges = inmemory_graph.load_snapshot(snapshot_path)
+                self.graph.with_edges(
+                    graph=graph, nodes=nodes, edges=edges, check_cycles=False
+                )
+                logger.info(f"Loaded CRE graph snapshot {snapshot_path}")
+                return
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load graph snapshot {snapshot_path}: {e}")
+                graph.clear()
+
+        nodes, edges = self.__get_graph_edges()
+        self.graph.with_edges(graph=graph, nodes=nodes, edges=edges)
+        if snapshot_path:
+            os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+            inmemory_graph.save_snapshot(snapshot_path, graph)
+            # older snapshots of this database are stale
+            for old_snapshot in glob.glob(
+                os.path.join(
+                    os.path.dirname(snapshot_path),
+                    f"cre_graph_{self.__database_hash()}_*.npz",
+                )
+            ):
+                if old_snapshot != snapshot_path:
+                    os.remove(old_snapshot)
+
+    def __get_graph_edges(self) -> Tuple[List[str], List[Tuple[str, str, str]]]:
+        """
+        The graph keys and (source, target, ltype) edges of every cre and its links, read with bulk queries.
+        Edges follow the same rules as CRE_Graph.add_link applied to every cre in table order
+        """
+        cre_keys: Dict[str, str] = {}
+        for cre_id, external_id in self.session.query(CRE.id, CRE.external_id).all():
+            cre_keys[cre_id] = f"{cre_defs.Credoctypes.CRE.value}: {external_id}"
+        position = {cre_id: i for i, cre_id in enumerate(cre_keys)}
+        nodes = dict.fromkeys(cre_keys.values())
+        edges: List[Tuple[str, str, str]] = []
+
+        for link, dbnode in (
+            self.session.query(Links, Node).join(Node, Node.id == Links.node).all()
+        ):
+            node_key = f"Node: {nodeFromDB(dbnode).id}"
+            nodes[node_key] = None
+            edges.append((cre_keys[link.cre], node_key, link.type))
+
+        for link in self.session.query(InternalLinks).all():
+            source, target = link.group, link.cre
+            if link.type == cre_defs.LinkTypes.Related.value and (
+                position[target] < position[source]
+            ):
+                # related links point away from whichever cre gets loaded first
+                source, target = target, source
+            edges.append((cre_keys[source], cre_keys[target], link.type))
+        return list(nodes), edges
+
     def __get_external_links(self) -> List[Tuple[CRE, Node, str]]:
         external_links: List[Tuple[CRE, Node, str]] = []
 
@@ -738,22 +1219,6 @@ class Node_collection:
         )
         return cres
 
-    def __get_all_nodes_and_cres(
-        self, cres_only: bool = False
-    ) -> List[cre_defs.Document]:
-        result = []
-        nodes = []
-        cres = []
-        if not cres_only:
-            node_ids = self.session.query(Node.id).all()
-            for nid in node_ids:
-                result.extend(self.get_nodes(db_id=nid[0]))
-
-        cre_ids = self.session.query(CRE.id).all()
-        for cid in cre_ids:
-            result.append(self.get_cre_by_db_id(cid[0]))
-        return result
-
     @classmethod
     def object_select(cls, node: Node, skip_attributes: List = []) -> List[Node]:
         if not node:
@@ -903,8 +1368,29 @@ class Node_collection:
         Returns the relevant node entries of a singular ntype (or ntype irrelevant if ntype==None) and their linked CREs
         include_only: If set, only the CRE ids in the list provided will be returned
         If a standard entry is not linked to by a CRE in the list the Standard entry will be returned empty.
+        The database Pagination object is None when the result is served from the in memory index.
         """
-        nodes = []
+        index = self.__get_index()
+        if index and not partial:
+            total_pages, nodes = index.get_nodes_with_pagination(
+                node_ids=index.find_node_ids(
+                    name=name,
+                    section=section,
+                    subsection=subsection,
+                    link=link,
+                    version=version,
+                    ntype=ntype,
+                    description=description,
+                    sectionID=sectionID,
+                ),
+                page=page,
+                items_per_page=items_per_page,
+                include_only=include_only,
+            )
+            if nodes:
+                return total_pages, nodes, None
+            logger.warning(f"Node {name} of type {ntype} does not exist in the db")
+            return None, None, None
 
         dbnodes = self.__get_nodes_query__(
             name=name,
@@ -919,27 +1405,11 @@ class Node_collection:
         ).paginate(page=int(page), per_page=items_per_page, error_out=False)
         total_pages = dbnodes.pages
         if dbnodes.items:
-            for dbnode in dbnodes.items:
-                node = nodeFromDB(dbnode=dbnode)
-                linked_cres = Links.query.filter(Links.node == dbnode.id).all()
-                for dbcre_link in linked_cres:
-                    dbcre = CRE.query.filter(CRE.id == dbcre_link.cre).first()
-                    if dbcre:
-                        if not include_only or (
-                            include_only
-                            and (
-                                dbcre.external_id in include_only
-                                or dbcre.name in include_only
-                            )
-                        ):
-                            node.add_link(
-                                cre_defs.Link(
-                                    ltype=cre_defs.LinkTypes.from_str(dbcre_link.type),
-                                    document=CREfromDB(dbcre),
-                                )
-                            )
-                nodes.append(node)
-
+            nodes = self.__nodes_from_db(
+                dbnodes=dbnodes.items,
+                include_only=include_only,
+                skip_missing_cres=True,
+            )
             return total_pages, nodes, dbnodes
         else:
             logger.warning(f"Node {name} of type {ntype} does not exist in the db")
@@ -960,7 +1430,28 @@ class Node_collection:
         sectionID: Optional[str] = None,
         db_id: Optional[str] = None,
     ) -> Optional[List[cre_defs.Node]]:
-        nodes = []
+        index = self.__get_index()
+        if index and not partial:
+            nodes = index.get_nodes(
+                node_ids=index.find_node_ids(
+                    name=name,
+                    section=section,
+                    subsection=subsection,
+                    link=link,
+                    version=version,
+                    ntype=ntype,
+                    description=description,
+                    sectionID=sectionID,
+                    db_id=db_id,
+                ),
+                include_only=include_only,
+            )
+            if not nodes:
+                logger.warning(
+                    f"Node {name} of type {ntype} and section {section} and section_id {sectionID} does not exist in the db"
+                )
+            return nodes
+
         nodes_query = None
         if db_id:
             nodes_query = self.session.query(Node).filter(Node.id == db_id)
@@ -978,32 +1469,7 @@ class Node_collection:
             )
         dbnodes = nodes_query.all()
         if dbnodes:
-            for dbnode in dbnodes:
-                node = nodeFromDB(dbnode=dbnode)
-                linked_cres = Links.query.filter(Links.node == dbnode.id).all()
-                for dbcre_link in linked_cres:
-                    dbcre = CRE.query.filter(CRE.id == dbcre_link.cre).first()
-                    if not dbcre:
-                        logger.fatal(
-                            f"CRE {dbcre_link.cre} exists in the links but not in the cre table, database corrupt?"
-                        )
-                        raise AssertionError(
-                            f"CRE {dbcre_link.cre} exists in the links but not in the cre table, database corrupt?"
-                        )
-                    if not include_only or (
-                        include_only
-                        and (
-                            dbcre.external_id in include_only
-                            or dbcre.name in include_only
-                        )
-                    ):
-                        node.add_link(
-                            cre_defs.Link(
-                                ltype=cre_defs.LinkTypes.from_str(dbcre_link.type),
-                                document=CREfromDB(dbcre),
-                            )
-                        )
-                nodes.append(node)
+            nodes = self.__nodes_from_db(dbnodes=dbnodes, include_only=include_only)
             return nodes
         else:
             logger.warning(
@@ -1012,6 +1478,58 @@ class Node_collection:
 
             return []
 
+    def __nodes_from_db(
+        self,
+        dbnodes: List[Node],
+        include_only: Optional[List[str]] = None,
+        skip_missing_cres: bool = False,
+    ) -> List[cre_defs.Node]:
+        """turns a list of database Nodes into cre_defs.Nodes linked to their CREs,
+        the links of every node in the list are loaded with one join per IN batch
+        include_only: If set, only the CRE ids or names in the list are linked
+        skip_missing_cres: If set, links to CREs missing from the cre table are ignored instead of raising
+        """
+        node_ids = [n.id for n in dbnodes]
+        links: Dict[str, List[cre_defs.Link]] = {nid: [] for nid in node_ids}
+        for batch in batched(node_ids):
+            query = (
+                self.session.query(Links, CRE)
+                .outerjoin(CRE, CRE.id == Links.cre)
+                .filter(Links.node.in_(batch))
+            )
+            if include_only:
+                query = query.filter(
+                    sqla.or_(
+                        CRE.id.is_(None),
+                        CRE.external_id.in_(include_only),
+                        CRE.name.in_(include_only),
+                    )
+                )
+            for dbcre_link, dbcre in query.all():
+                if not dbcre:
+                    if skip_missing_cres:
+                        continue
+                    logger.fatal(
+                        f"CRE {dbcre_link.cre} exists in the links but not in the cre table, database corrupt?"
+                    )
+                    raise AssertionError(
+                        f"CRE {dbcre_link.cre} exists in the links but not in the cre table, database corrupt?"
+                    )
+                links[dbcre_link.node].append(
+                    cre_defs.Link(
+                        ltype=cre_defs.LinkTypes.from_str(dbcre_link.type),
+                        document=CREfromDB(dbcre),
+                    )
+                )
+
+        nodes = []
+        for dbnode in dbnodes:
+            node = nodeFromDB(dbnode=dbnode)
+            for link in links[dbnode.id]:
+                node.add_link(link)
+            nodes.append(node)
+        return nodes
+
     def get_cre_by_db_id(self, id: str) -> cre_defs.CRE:
         """internal method, returns a shallow cre (no links) by its database id
 
@@ -1021,11 +1539,11 @@ class Node_collection:
         Returns:
             cre_defs.CRE: _description_
         """
-        external_id = self.session.query(CRE.external_id).filter(CRE.id == id).first()
-        if not external_id:
+        dbcre = self.session.query(CRE).filter(CRE.id == id).first()
+        if not dbcre:
             logger.error(f"CRE {id} does not exist in the db")
             return None
-        return self.get_CREs(external_id=external_id[0])[0]
+        return self.__cres_from_db(dbcres=[dbcre])[0]
 
     def list_node_ids_by_ntype(self, ntype: str) -> List[str]:
         return self.session.query(Node.id).filter(Node.ntype == ntype).all()
@@ -1105,6 +1623,30 @@ class Node_collection:
                 )
         return query
 
+    def get_CREs_of_nodes(
+        self, name: str, section_ids: List[str]
+    ) -> Dict[str, List[cre_defs.CRE]]:
+        """the CREs linked to the nodes of resource name with any of the section ids, by section id,
+        in one query per IN_QUERY_BATCH_SIZE section ids"""
+        cres: Dict[str, List[cre_defs.CRE]] = {}
+        for batch in batched(sorted(set(section_ids))):
+            for section_id, cre in (
+                self.session.query(Node.section_id, CRE)
+                .join(Links, Links.node == Node.id)
+                .join(CRE, CRE.id == Links.cre)
+                .filter(Node.name == name, Node.section_id.in_(batch))
+            ):
+                cres.setdefault(section_id, []).append(CREfromDB(cre))
+        return cres
+
+    def get_dbCREs_by_name(self, names: List[str]) -> Dict[str, CRE]:
+        """the stored CREs with any of the names, by lower case name, in one query per IN_QUERY_BATCH_SIZE names"""
+        cres: Dict[str, CRE] = {}
+        for batch in batched(sorted({name.lower() for name in names})):
+            for cre in self.session.query(CRE).filter(func.lower(CRE.name).in_(batch)):
+                cres.setdefault(cre.name.lower(), cre)
+        return cres
+
     def get_CREs(
         self,
         external_id: Optional[str] = None,
@@ -1122,6 +1664,20 @@ class Node_collection:
             )
             return []
 
+        index = self.__get_index()
+        if index and not partial and not description:
+            cres = index.get_CREs(
+                external_id=external_id,
+                name=name,
+                internal_id=internal_id,
+                include_only=include_only,
+            )
+            if not cres:
+                logger.warning(
+                    f"CRE {external_id}:{name}:{description} does not exist in the db"
+                )
+            return cres
+
         if external_id:
             if not partial:
                 query = query.filter(CRE.external_id == external_id)
@@ -1148,75 +1704,110 @@ class Node_collection:
                 f"CRE {external_id}:{name}:{description} does not exist in the db"
             )
             return []
+        return self.__cres_from_db(dbcres=dbcres, include_only_nodes=include_only)
+
+    def __cres_from_db(
+        self, dbcres: List[CRE], include_only_nodes: Optional[List[str]] = None
+    ) -> List[cre_defs.CRE]:
+        """turns a list of database CREs into cre_defs.CREs with all their links,
+        resolving the links of every CRE in the list in a fixed number of queries"""
+        cre_ids = [c.id for c in dbcres]
+        external_links = self.__make_cre_links(
+            cre_ids=cre_ids, include_only_nodes=include_only_nodes
+        )
+        internal_links = self.__make_cre_internal_links(cre_ids=cre_ids)
 
+        cres: List[cre_defs.CRE] = []
         for matching_cre in dbcres:
             cre = CREfromDB(matching_cre)
-            cre.links = self.__make_cre_links(
-                cre=matching_cre, include_only_nodes=include_only
-            )
-            cre.links.extend(self.__make_cre_internal_links(cre=matching_cre))
+            cre.links = external_links.get(matching_cre.id, [])
+            cre.links.extend(internal_links.get(matching_cre.id, []))
             cres.append(cre)
         return cres
 
-    def __make_cre_internal_links(self, cre: CRE) -> List[cre_defs.Link]:
-        links = []
-        internal_links = (
-            self.session.query(InternalLinks)
-            .filter(
-                sqla.or_(InternalLinks.cre == cre.id, InternalLinks.group == cre.id)
+    def __make_cre_internal_links(
+        self, cre_ids: List[str]
+    ) -> Dict[str, List[cre_defs.Link]]:
+        """returns the CRE->CRE links of every cre in cre_ids keyed by cre id"""
+        links: Dict[str, List[cre_defs.Link]] = {cid: [] for cid in cre_ids}
+        for batch in batched(cre_ids):
+            internal_links = (
+                self.session.query(InternalLinks)
+                .filter(
+                    sqla.or_(
+                        InternalLinks.cre.in_(batch), InternalLinks.group.in_(batch)
+                    )
+                )
+                .all()
             )
-            .all()
-        )
-
-        if len(internal_links) == 0:
-            logger.debug(
-                f"CRE {cre.name}:{cre.external_id}:{cre.id} has no internal links"
+            linked_cres = self.__cres_by_id(
+                [il.cre for il in internal_links] + [il.group for il in internal_links]
             )
-
-        for internal_link in internal_links:
-
-            linked_cre_query = self.session.query(CRE)
-            link_type = cre_defs.LinkTypes.from_str(internal_link.type)
-
-            if internal_link.cre == cre.id:
-                # if we are the lower cre in this relationship, we need to flip the "Contains" linktypes
-                linked_cre = linked_cre_query.filter(
-                    CRE.id == internal_link.group
-                ).first()  # get the higher cre so we can add the link
-                if link_type == cre_defs.LinkTypes.Contains:
-                    links.append(
-                        cre_defs.Link(
-                            ltype=cre_defs.LinkTypes.PartOf,
-                            document=CREfromDB(linked_cre),
+            # a link between cres of different batches is returned for both batches
+            # only attach it to the side(s) that belong to the current one
+            batch_ids = set(batch)
+            for internal_link in internal_links:
+                link_type = cre_defs.LinkTypes.from_str(internal_link.type)
+
+                if internal_link.cre in batch_ids:
+                    # if we are the lower cre in this relationship, we need to flip the "Contains" linktypes
+                    linked_cre = linked_cres.get(internal_link.group)
+                    if link_type == cre_defs.LinkTypes.Contains:
+                        links[internal_link.cre].append(
+                            cre_defs.Link(
+                                ltype=cre_defs.LinkTypes.PartOf,
+                                document=CREfromDB(linked_cre),
+                            )
                         )
-                    )
-                elif (
-                    link_type == cre_defs.LinkTypes.Related
-                ):  # if it's not a "Contains" link, it's a "Related" link
-                    links.append(
+                    elif (
+                        link_type == cre_defs.LinkTypes.Related
+                    ):  # if it's not a "Contains" link, it's a "Related" link
+                        links[internal_link.cre].append(
+                            cre_defs.Link(
+                                ltype=link_type, document=CREfromDB(linked_cre)
+                            )
+                        )
+                if internal_link.group in batch_ids:
+                    # if we are are the higher cre then we don't need to do anything, relationship types are always "higher"->"lower"
+                    linked_cre = linked_cres.get(internal_link.cre)
+                    links[internal_link.group].append(
                         cre_defs.Link(ltype=link_type, document=CREfromDB(linked_cre))
                     )
-                continue
-            # if we are are the higher cre then we don't need to do anything, relationship types are always "higher"->"lower"
-            linked_cre = linked_cre_query.filter(CRE.id == internal_link.cre).first()
-            links.append(cre_defs.Link(ltype=link_type, document=CREfromDB(linked_cre)))
         return links
 
     def __make_cre_links(
-        self, cre: CRE, include_only_nodes: List[str]
-    ) -> List[cre_defs.Link]:
-        links = []
-        for link in self.session.query(Links).filter(Links.cre == cre.id).all():
-            node = self.session.query(Node).filter(Node.id == link.node).first()
-            if node and (not include_only_nodes or node.name in include_only_nodes):
-                links.append(
-                    cre_defs.Link(
-                        ltype=cre_defs.LinkTypes.from_str(link.type),
-                        document=nodeFromDB(node),
+        self, cre_ids: List[str], include_only_nodes: Optional[List[str]]
+    ) -> Dict[str, List[cre_defs.Link]]:
+        """returns the CRE->Node links of every cre in cre_ids keyed by cre id"""
+        links: Dict[str, List[cre_defs.Link]] = {cid: [] for cid in cre_ids}
+        for batch in batched(cre_ids):
+            cre_links = self.session.query(Links).filter(Links.cre.in_(batch)).all()
+            nodes = self.__nodes_by_id([l.node for l in cre_links])
+            for link in cre_links:
+                node = nodes.get(link.node)
+                if node and (not include_only_nodes or node.name in include_only_nodes):
+                    links[link.cre].append(
+                        cre_defs.Link(
+                            ltype=cre_defs.LinkTypes.from_str(link.type),
+                            document=nodeFromDB(node),
+                        )
                     )
-                )
         return links
 
+    def __cres_by_id(self, ids: List[str]) -> Dict[str, CRE]:
+        result: Dict[str, CRE] = {}
+        for batch in batched(list(set(ids))):
+            for cre in self.session.query(CRE).filter(CRE.id.in_(batch)).all():
+                result[cre.id] = cre
+        return result
+
+    def __nodes_by_id(self, ids: List[str]) -> Dict[str, Node]:
+        result: Dict[str, Node] = {}
+        for batch in batched(list(set(ids))):
+            for node in self.session.query(Node).filter(Node.id.in_(batch)).all():
+                result[node.id] = node
+        return result
+
     def export(self, dir: str = None, dry_run: bool = False) -> List[cre_defs.Document]:
         """Exports the database to a CRE file collection on disk"""
         docs: Dict[str, cre_defs.Document] = {}
@@ -1312,48 +1903,79 @@ class Node_collection:
     def all_cres_with_pagination(
         self, page: int = 1, per_page: int = 10
     ) -> List[cre_defs.CRE]:
+        index = self.__get_index()
+        if index:
+            result, total_pages = index.all_cres_with_pagination(
+                page=page, per_page=per_page
+            )
+            return result, page, total_pages
+
         result: List[cre_defs.CRE] = []
         cres = self.session.query(CRE).paginate(
             page=int(page), per_page=per_page, error_out=False
         )
         total_pages = cres.pages
-        for cre in cres.items:
-            result.extend(self.get_CREs(external_id=cre.external_id))
+        result.extend(self.__cres_from_db(dbcres=cres.items))
         return result, page, total_pages
 
     def get_cre_path(self, fromID: str, toID: str) -> List[cre_defs.Document]:
+        """
+        Returns the CREs on the path between the CREs with external ids fromID and toID,
+        following the hierarchy if one of them contains the other
+        """
         if not self.graph:
             self.with_graph()
 
-        fromDbID = (
-            self.session.query(CRE.id).filter(CRE.external_id == fromID).first()[0]
-        )
-        toDbID = self.session.query(CRE.id).filter(CRE.external_id == toID).first()[0]
-
-        forwardPath = self.graph.get_path(f"CRE: {fromDbID}", f"CRE: {toDbID}")
-        backwardsPath = self.graph.get_path(f"CRE: {toDbID}", f"CRE: {fromDbID}")
-        cres = []
+        from_key = f"{cre_defs.Credoctypes.CRE.value}: {fromID}"
+        to_key = f"{cre_defs.Credoctypes.CRE.value}: {toID}"
         path = []
-        if forwardPath:  # our graph is directed, so we need to check both paths
-            path = forwardPath
-        else:
-            path = backwardsPath
+        for ancestry, start in (
+            (self.graph.get_ancestry(toID), from_key),
+            (self.graph.get_ancestry(fromID), to_key),
+        ):
+            if start in ancestry:
+                path = ancestry[ancestry.index(start) :]
+                break
+        if not path:
+            # our graph is directed, so we need to check both paths
+            path = self.graph.get_path(from_key, to_key) or self.graph.get_path(
+                to_key, from_key
+            )
 
+        cres = []
         for entry in path:
-            entryID = entry.replace("CRE: ", "")
-            shallow_CRE = self.get_cre_by_db_id(entryID)
-
-            if shallow_CRE:
-                cres.append(self.get_CREs(external_id=shallow_CRE.id)[0])
+            found = self.get_CREs(
+                external_id=entry.replace(f"{cre_defs.Credoctypes.CRE.value}: ", "")
+            )
+            if found:
+                cres.append(found[0])
         return cres
 
     def get_cre_hierarchy(self, cre: cre_defs.CRE) -> int:
+        """the depth of the CRE in the Contains hierarchy, served by the graph's precomputed hierarchy table"""
+        if not self.graph:
+            self.with_graph()
+        return self.graph.get_hierarchy(creID=cre.id)
+
+    def get_cre_ancestry(self, cre_id: str) -> List[str]:
+        """the external ids of the CREs from the closest root CRE down to the CRE with external id cre_id"""
         if not self.graph:
             self.with_graph()
-        roots = self.get_root_cres()
+        return [
+            key.replace(f"{cre_defs.Credoctypes.CRE.value}: ", "")
+            for key in self.graph.get_ancestry(cre_id)
+        ]
 
-        root_cre_ids = [r.id for r in roots]
-        return self.graph.get_hierarchy(rootIDs=root_cre_ids, creID=cre.id)
+    def get_connected_cre_ids(self, cre_id: str) -> Set[str]:
+        """the external ids of the CREs get_cre_path finds a path between the CRE with external id cre_id and"""
+        if not self.graph:
+            self.with_graph()
+        prefix = f"{cre_defs.Credoctypes.CRE.value}: "
+        return {
+            key[len(prefix) :]
+            for key in self.graph.get_connected(cre_id)
+            if key.startswith(prefix)
+        }
 
     # def all_nodes_with_pagination(
     #     self, page: int = 1, per_page: int = 10
@@ -1394,23 +2016,64 @@ class Node_collection:
                 self.session.delete(embeddings)
             self.session.delete(entry)
 
+        self.bump_generation()
         self.delete_gapanalysis_results_for(node_name)
         self.session.commit()
 
     def delete_gapanalysis_results_for(self, node_name):
-        res = (
-            self.session.query(GapAnalysisResults)
-            .filter(GapAnalysisResults.cache_key.like(f"%{node_name}%"))
-            .all()
+        res = self.invalidate_gap_analysis_results(
+            [make_standard_dependency(node_name)]
         )
-        for r in res:
-            result = self.session.delete(r)
-            if result:
-                logger.info(f"deleted {result.rowcount} objects")
         self.session.commit()
-        self.session.flush()
         return res
 
+    def invalidate_gap_analysis_results(self, dependencies: List[str]) -> List[str]:
+        """
+        Deletes the gap analysis results, and their subresources, that were calculated from any of the dependencies.
+        Every result depends on its two standards (see get_key_dependencies), whatever its paths.
+        Returns the cache keys of the results deleted, the deletion is committed by the caller's commit,
+        they are also kept in invalidated_gap_analyses
+        """
+        cache_keys: Set[str] = set()
+        for batch in batched(dependencies):
+            cache_keys.update(
+                key
+                for (key,) in self.session.query(GapAnalysisDependencies.cache_key)
+                .filter(GapAnalysisDependencies.dependency.in_(batch))
+                .distinct()
+            )
+        if not cache_keys:
+            return []
+        self.invalidated_gap_analyses.update(cache_keys)
+
+        keys = list(cache_keys)
+        # few keys at a time, every key adds a prefix match for its subresources
+        for batch in batched(keys, 50):
+            self.session.query(GapAnalysisResults).filter(
+                sqla.or_(
+                    GapAnalysisResults.cache_key.in_(batch),
+                    *[
+                        GapAnalysisResults.cache_key.startswith(
+                            make_subresources_key([key], ""), autoescape=True
+                        )
+                        for key in batch
+                    ],
+                )
+            ).delete(synchronize_session=False)
+            self.session.query(GapAnalysisDependencies).filter(
+                GapAnalysisDependencies.cache_key.in_(batch)
+            ).delete(synchronize_session=False)
+        logger.info(f"invalidated {len(keys)} gap analysis results")
+        return keys
+
+    def pop_invalidated_gap_analyses(self) -> List[str]:
+        """the cache keys of the results invalidated since the last call, which have not been stored again"""
+        invalidated = self.invalidated_gap_analyses
+        self.invalidated_gap_analyses = set()
+        return sorted(
+            invalidated - self.existing_gap_analysis_keys(sorted(invalidated))
+        )
+
     def add_cre(self, cre: cre_defs.CRE) -> CRE:
         entry: CRE = None
         query = self.session.query(CRE).filter(func.lower(CRE.name) == cre.name.lower())
@@ -1434,6 +2097,11 @@ class Node_collection:
                 entry.description = cre.description
             if not entry.tags:
                 entry.tags = ",".join(cre.tags)
+            if self.session.is_modified(entry):
+                self.bump_generation()
+                self.invalidate_gap_analysis_results(
+                    [make_cre_dependency(entry.external_id)]
+                )
             return entry
         else:
             logger.info("did not know of cre %s ,adding" % cre.name)
@@ -1444,11 +2112,71 @@ class Node_collection:
                 tags=",".join([str(t) for t in cre.tags]),
             )
             self.session.add(entry)
+            self.bump_generation()
             self.session.commit()
             if self.graph:
                 self.graph.add_cre(cre=cre)
         return entry
 
+    def add_cres(self, cres: List[cre_defs.CRE]) -> List[CRE]:
+        """
+        add_cre for many CREs against one snapshot of the cre table, returns the database CRE of each CRE.
+        The same CRE can be given many times, new CREs are inserted together when the caller commits
+        """
+        by_name: Dict[str, List[CRE]] = {}
+        for entry in self.session.query(CRE):
+            by_name.setdefault(entry.name.lower(), []).append(entry)
+
+        result: List[CRE] = []
+        new: List[Tuple[CRE, cre_defs.CRE]] = []
+        changed: Set[str] = set()
+        for cre in cres:
+            entry = next(
+                (
+                    candidate
+                    for candidate in by_name.get(cre.name.lower(), [])
+                    if (
+                        candidate.external_id == cre.id
+                        if cre.id
+                        else (candidate.description or "").lower()
+                        == cre.description.lower()
+                    )
+                ),
+                None,
+            )
+            if entry is not None:
+                if not entry.description and cre.description:
+                    entry.description = cre.description
+                    changed.add(entry.external_id)
+                if not entry.tags and cre.tags:
+                    entry.tags = ",".join(cre.tags)
+                    changed.add(entry.external_id)
+            else:
+                entry = CRE(
+                    id=generate_uuid(),
+                    description=cre.description,
+                    name=cre.name,
+                    external_id=cre.id,
+                    tags=",".join([str(t) for t in cre.tags]),
+                )
+                by_name.setdefault(cre.name.lower(), []).append(entry)
+                new.append((entry, cre))
+            result.append(entry)
+
+        if new:
+            logger.info(f"did not know of {len(new)} CREs, adding")
+            self.session.add_all([entry for entry, _ in new])
+            if self.graph:
+                for _, cre in new:
+                    self.graph.add_cre(cre=cre)
+        if new or changed:
+            self.bump_generation()
+        if changed:
+            self.invalidate_gap_analysis_results(
+                [make_cre_dependency(external_id) for external_id in sorted(changed)]
+            )
+        return result
+
     def add_node(
         self, node: cre_defs.Node, comparison_skip_attributes: List = ["link"]
     ) -> Optional[Node]:
@@ -1471,6 +2199,11 @@ class Node_collection:
             if node.section and node.section != entry.section:
                 entry.section = node.section
             entry.link = node.hyperlink
+            if self.session.is_modified(entry):
+                self.bump_generation()
+                self.invalidate_gap_analysis_results(
+                    [make_standard_dependency(entry.name)]
+                )
             self.session.commit()
             return entry
         else:
@@ -1478,11 +2211,110 @@ class Node_collection:
                 f"did not know of node {dbnode.name}:{dbnode.section}:{dbnode.section_id} ,adding"
             )
             self.session.add(dbnode)
+            self.bump_generation()
+            # a new section changes every gap analysis of its standard
+            self.invalidate_gap_analysis_results(
+                [make_standard_dependency(dbnode.name)]
+            )
             self.session.commit()
             if self.graph:
                 self.graph.add_dbnode(dbnode=node)
         return dbnode
 
+    def add_nodes(self, nodes: List[cre_defs.Node]) -> List[Optional[Node]]:
+        """
+        add_node for many nodes in a handful of statements, returns the database node of each node (None if it could not be added).
+        Nodes are matched on the columns of uq_node, known nodes get the hyperlink of the last of their entries.
+        The change is committed by the caller's commit
+        """
+        dbnodes: Dict[Tuple, Node] = {}
+        keys: List[Optional[Tuple]] = []
+        for node in nodes:
+            dbnode = dbNodeFromNode(node) if node else None
+            if not dbnode or not dbnode.ntype:
+                logger.warning(f"{node} could not be transformed to a DB object")
+                keys.append(None)
+                continue
+            key = node_key(dbnode)
+            keys.append(key)
+            if key in dbnodes:
+                dbnodes[key].link = dbnode.link
+            else:
+                dbnodes[key] = dbnode
+
+        changed: Set[str] = set()
+        existing = self.__select_nodes(list(dbnodes.values()))
+        for key, entry in existing.items():
+            if entry.link != dbnodes[key].link:
+                entry.link = dbnodes[key].link
+                changed.add(entry.name)
+
+        new = [dbnode for key, dbnode in dbnodes.items() if key not in existing]
+        if new:
+            logger.info(f"did not know of {len(new)} nodes, adding")
+            self.session.flush()
+            for batch in batched(new):
+                statement = upsert(self.session, Node.__table__)
+                if hasattr(statement, "on_conflict_do_update"):
+                    # added by another process meanwhile, updated the way add_node updates known nodes
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[
+                            "name",
+                            "section",
+                            "subsection",
+                            "version",
+                            "section_id",
+                        ],
+                        set_={
+                            "section": sqla.case(
+                                (
+                                    func.coalesce(statement.excluded.section, "") != "",
+                                    statement.excluded.section,
+                                ),
+                                else_=Node.__table__.c.section,
+                            ),
+                            "link": statement.excluded.link,
+                        },
+                    )
+                self.session.execute(
+                    statement,
+                    [
+                        {
+                            column.name: getattr(dbnode, column.key)
+                            for column in Node.__table__.columns
+                            if column.name != "id"
+                        }
+                        | {"id": generate_uuid()}
+                        for dbnode in batch
+                    ],
+                )
+            added = self.__select_nodes(new)
+            existing.update(added)
+            # inserted, or updated by the ON CONFLICT clause
+            changed.update(dbnode.name for dbnode in new)
+            if self.graph:
+                for dbnode in added.values():
+                    self.graph.add_dbnode(dbnode=dbnode)
+
+        if changed:
+            self.bump_generation()
+            # a new section changes every gap analysis of its standard
+            self.invalidate_gap_analysis_results(
+                [make_standard_dependency(name) for name in sorted(changed)]
+            )
+        return [existing.get(key) if key else None for key in keys]
+
+    def __select_nodes(self, dbnodes: List[Node]) -> Dict[Tuple, Node]:
+        """the stored nodes with the uq_node columns of dbnodes, by node_key"""
+        wanted = {node_key(dbnode) for dbnode in dbnodes}
+        found: Dict[Tuple, Node] = {}
+        for names in batched(sorted({dbnode.name for dbnode in dbnodes})):
+            for entry in self.session.query(Node).filter(Node.name.in_(names)):
+                key = node_key(entry)
+                if key in wanted and key not in found:
+                    found[key] = entry
+        return found
+
     def add_internal_link(
         self,
         higher: CRE,
@@ -1598,12 +2430,118 @@ class Node_collection:
             self.session.add(
                 InternalLinks(type=ltype.value, cre=lower.id, group=higher.id)
             )
+            self.bump_generation()
+            self.invalidate_gap_analysis_results(
+                self.__internal_link_dependencies([higher, lower])
+            )
             self.session.commit()
             return cre_defs.Link(document=lower, ltype=ltype)
         except inmemory_graph.CycleDetectedError as cde:
             # cycle detected, do nothing
             pass
 
+    def add_internal_links(
+        self, links: List[Tuple[CRE, CRE, cre_defs.LinkTypes]]
+    ) -> int:
+        """
+        add_internal_link for many stored (higher, lower, link type), in order, against one snapshot of the existing links.
+        Links that would introduce a cycle are skipped, the rest are inserted together when the caller commits.
+        Returns how many links were added
+        """
+        if not links:
+            return 0
+        if not self.graph:
+            raise ValueError(
+                "internal CRE graph is None while importing, cannot detect cycles, this is unrecoverable"
+            )
+        ids = sorted({cre.id for higher, lower, _ in links for cre in (higher, lower)})
+        existing: Set[frozenset] = set()
+        for batch in batched(ids):
+            for group, cre in self.session.query(
+                InternalLinks.group, InternalLinks.cre
+            ).filter(
+                sqla.or_(InternalLinks.group.in_(batch), InternalLinks.cre.in_(batch))
+            ):
+                existing.add(frozenset((group, cre)))
+
+        added: List[Dict[str, str]] = []
+        linked: Dict[str, CRE] = {}
+        for higher, lower, ltype in links:
+            if ltype == None:
+                raise ValueError("Every link should have a link type")
+            if ltype == cre_defs.LinkTypes.PartOf:
+                raise ValueError(
+                    "internal_link does not support 'PartOf' relationships, call it with higher/lower being opposite and the ltype being 'Contains' "
+                )
+            pair = frozenset((higher.id, lower.id))
+            if pair in existing:
+                continue
+            try:
+                self.graph.add_link(
+                    doc_from=CREfromDB(higher),
+                    link_to=cre_defs.Link(document=CREfromDB(lower), ltype=ltype),
+                )
+            except inmemory_graph.CycleDetectedError:
+                continue
+            existing.add(pair)
+            added.append({"type": ltype.value, "cre": lower.id, "group": higher.id})
+            linked[higher.id] = higher
+            linked[lower.id] = lower
+
+        if added:
+            logger.info(f"did not know of {len(added)} internal links, adding")
+            # the CREs they link may still be pending
+            self.session.flush()
+            self.session.bulk_insert_mappings(InternalLinks, added)
+            self.bump_generation()
+            self.invalidate_gap_analysis_results(
+                self.__internal_link_dependencies(list(linked.values()))
+            )
+        return len(added)
+
+    def __internal_link_dependencies(self, cres: List[CRE]) -> List[str]:
+        """
+        the gap analysis dependencies a new link between cres changes: paths between any two standards
+        linked to CREs connected to cres, in any direction, may now go through the link and be shorter or new.
+        Those CREs and standards
+        """
+        connected = self.__connected_cre_ids([cre.id for cre in cres])
+        dependencies: Set[str] = set()
+        for batch in batched(sorted(connected)):
+            dependencies.update(
+                make_cre_dependency(external_id)
+                for (external_id,) in self.session.query(CRE.external_id).filter(
+                    CRE.id.in_(batch)
+                )
+            )
+            dependencies.update(
+                make_standard_dependency(name)
+                for (name,) in self.session.query(Node.name)
+                .join(Links, Links.node == Node.id)
+                .filter(Links.cre.in_(batch))
+                .distinct()
+            )
+        return sorted(dependencies)
+
+    def __connected_cre_ids(self, cre_ids: List[str]) -> Set[str]:
+        """the ids of the CREs reachable from cre_ids through CRE links of any type and direction, cre_ids included"""
+        connected = set(cre_ids)
+        frontier = sorted(connected)
+        while frontier:
+            found: Set[str] = set()
+            for batch in batched(frontier):
+                for group, cre in self.session.query(
+                    InternalLinks.group, InternalLinks.cre
+                ).filter(
+                    sqla.or_(
+                        InternalLinks.group.in_(batch), InternalLinks.cre.in_(batch)
+                    )
+                ):
+                    found.update((group, cre))
+            frontier = sorted(found - connected)
+            connected.update(frontier)
+        return connected
+
     def add_link(
         self,
         cre: CRE,
@@ -1632,6 +2570,14 @@ class Node_collection:
                 f"updating type to {ltype.value}"
             )
             entry.type = ltype.value
+            if self.session.is_modified(entry):
+                self.bump_generation()
+                self.invalidate_gap_analysis_results(
+                    [
+                        make_cre_dependency(cre.external_id),
+                        make_standard_dependency(node.name),
+                    ]
+                )
             self.session.commit()
             return
         else:
@@ -1641,6 +2587,13 @@ class Node_collection:
                 " ,adding"
             )
             self.session.add(Links(type=ltype.value, cre=cre.id, node=node.id))
+            self.bump_generation()
+            self.invalidate_gap_analysis_results(
+                [
+                    make_cre_dependency(cre.external_id),
+                    make_standard_dependency(node.name),
+                ]
+            )
             if self.graph:
                 self.graph.add_link(
                     doc_from=CREfromDB(cre),
@@ -1649,6 +2602,63 @@ class Node_collection:
 
         self.session.commit()
 
+    def add_links(self, links: List[Tuple[CRE, Node, cre_defs.LinkTypes]]) -> None:
+        """
+        add_link for many stored (cre, node, link type), in a couple of statements, the last type of a pair wins.
+        The change is committed by the caller's commit
+        """
+        pairs: Dict[Tuple[str, str], Tuple[CRE, Node, cre_defs.LinkTypes]] = {}
+        for cre, node, ltype in links:
+            if not ltype:
+                raise ValueError("every link should have a link type")
+            pairs[(cre.id, node.id)] = (cre, node, ltype)
+        if not pairs:
+            return
+
+        existing: Dict[Tuple[str, str], str] = {}
+        for node_ids in batched(sorted({node_id for _, node_id in pairs})):
+            for entry in self.session.query(Links).filter(Links.node.in_(node_ids)):
+                existing[(entry.cre, entry.node)] = entry.type
+        changed = [
+            (cre, node, ltype)
+            for pair, (cre, node, ltype) in pairs.items()
+            if existing.get(pair) != ltype.value
+        ]
+        if not changed:
+            return
+        logger.debug(f"adding or updating {len(changed)} links")
+
+        self.session.flush()
+        for batch in batched(changed):
+            statement = upsert(self.session, Links.__table__).values(
+                [
+                    {"type": ltype.value, "cre": cre.id, "node": node.id}
+                    for cre, node, ltype in batch
+                ]
+            )
+            if hasattr(statement, "on_conflict_do_update"):
+                statement = statement.on_conflict_do_update(
+                    index_elements=["cre", "node"],
+                    set_={"type": statement.excluded.type},
+                )
+            self.session.execute(statement)
+        self.bump_generation()
+        self.invalidate_gap_analysis_results(
+            sorted(
+                {make_cre_dependency(cre.external_id) for cre, _, _ in changed}
+                | {make_standard_dependency(node.name) for _, node, _ in changed}
+            )
+        )
+        if self.graph:
+            for cre, node, ltype in changed:
+                if (cre.id, node.id) not in existing:
+                    self.graph.add_link(
+                        doc_from=CREfromDB(cre),
+                        link_to=cre_defs.Link(
+                            document=nodeFromDB(node), ltype=ltype.value
+                        ),
+                    )
+
     def find_path_between_nodes(
         self, node_source_id: int, node_destination_id: int
     ) -> bool:
@@ -1663,6 +2673,9 @@ class Node_collection:
         return res
 
     def standards(self) -> List[str]:
+        index = self.__get_index()
+        if index:
+            return index.standards()
         standards = (
             self.session.query(Node.name)
             .filter(Node.ntype == cre_defs.Credoctypes.Standard)
@@ -1670,27 +2683,61 @@ class Node_collection:
         )
         return list(set([s[0] for s in standards]))
 
-    def text_search(self, text: str) -> List[Optional[cre_defs.Document]]:
+    def full_text_search(
+        self, text: str, page: int = 1, items_per_page: Optional[int] = None
+    ) -> Tuple[List[cre_defs.Document], int]:
+        """Ranked free text search over node name/section/sectionID/subsection/description/hyperlink
+        and cre name/description/external id, every word of the text has to (prefix) match.
+        Returns the requested page of documents, best match first, and the total number of pages.
+        Without items_per_page every match is on the first page and later pages are empty.
+        """
+        if not items_per_page and page > 1:
+            return [], 1
+        offset = (page - 1) * items_per_page if items_per_page else 0
+        hits, total = text_index.search(
+            self.session, text, limit=items_per_page, offset=offset
+        )
+        node_ids = [doc_id for table, doc_id in hits if table == Node.__tablename__]
+        cre_ids = [doc_id for table, doc_id in hits if table == CRE.__tablename__]
+
+        documents: Dict[str, cre_defs.Document] = {}
+        for batch in batched(node_ids):
+            dbnodes = self.session.query(Node).filter(Node.id.in_(batch)).all()
+            for dbnode, node in zip(dbnodes, self.__nodes_from_db(dbnodes=dbnodes)):
+                documents[dbnode.id] = node
+        for batch in batched(cre_ids):
+            dbcres = self.session.query(CRE).filter(CRE.id.in_(batch)).all()
+            for dbcre, cre in zip(dbcres, self.__cres_from_db(dbcres=dbcres)):
+                documents[dbcre.id] = cre
+
+        total_pages = math.ceil(total / items_per_page) if items_per_page else 1
+        return [documents[doc_id] for _, doc_id in hits], total_pages
+
+    def text_search(
+        self, text: str, page: int = 1, items_per_page: Optional[int] = None
+    ) -> List[Optional[cre_defs.Document]]:
         """Given a piece of text, tries to find the best match
         for the text in the database.
         Shortcuts:
            'CRE:<id>' will search for the <id> in cre external ids
            'CRE:<name>' will search for the <name> in cre names
            '<Node type e.g. Standard>:<name>[:<section><sectionID>:<subsection>:<hyperlink>]' will search for
-               all entries of <name> and optionally, section/subsection
+               all entries of <name> and optionally, section/subsection, only if the text starts with the type
            '\d\d\d-\d\d\d' (two sets of 3 digits) will first try to match
                 CRE ids before it performs a free text search
-           Anything else will be a case insensitive LIKE query in the database
+           Anything else will be a ranked full text search, see full_text_search,
+           page and items_per_page only apply to it
         """
         # structured text search first
         cre_id_search = r"CRE(:| )(?P<id>\d+-\d+)"
         cre_naked_id_search = r"\d\d\d-\d\d\d"
         cre_name_search = r"CRE(:| )(?P<name>\w+)"
         types = "|".join([v.value for v in cre_defs.Credoctypes])
+        # only explicitly typed queries, free text goes to the full text search
         node_search = (
-            r"(Node|(?P<ntype>"
+            r"^(Node|(?P<ntype>"
             + types
-            + "))?((:| )?(?P<link>https?://\S+))?((:| )(?P<val>.+$))?"
+            + "))(?=:| |$)((:| )(?P<link>https?://\S+))?((:| )(?P<val>.+$))?"
         )
         match = re.search(cre_id_search, text, re.IGNORECASE)
         if match:
@@ -1726,43 +2773,23 @@ class Node_collection:
                     )
                     if nodes:
                         results.extend(nodes)
-            elif link or ntype:
+            elif link:
                 nodes = self.get_nodes(link=link, ntype=ntype)
                 if nodes:
                     results.extend(nodes)
             if results:
                 return list(set(results))
-        # fuzzy matches second
-        args = [f"%{text}%", "", "", "", "", ""]
-        results = {}
-        s = set([p for p in permutations(args, 6)])
-        for combo in s:
-            nodes = self.get_nodes(
-                name=combo[0],
-                section=combo[1],
-                subsection=combo[2],
-                link=combo[3],
-                description=combo[4],
-                partial=True,
-                ntype=None,  # type: ignore
-                sectionID=combo[5],
-            )
-            if nodes:
-                for node in nodes:
-                    node_key = f"{node.name}:{node.version}:{node.section}:{node.sectionID}:{node.subsection}:"
-                    results[node_key] = node
-        args = [f"%{text}%", None, None]
-        for combo in permutations(args, 3):
-            cres = self.get_CREs(
-                name=combo[0], external_id=combo[1], description=combo[2], partial=True
-            )
-            if cres:
-                for cre in cres:
-                    results[cre.id] = cre
-        return list(results.values())
+        # free text search second
+        documents, _ = self.full_text_search(
+            text, page=page, items_per_page=items_per_page
+        )
+        return documents
 
     def get_root_cres(self):
         """Returns CRES that only have "Contains" links"""
+        index = self.__get_index()
+        if index:
+            return index.get_root_cres()
         # select name  from cre where cre.id not in (select cre from cre_links where type="Contains") and cre.id not in (select "group" from cre_links where type="Is Part OF");
         cres = (
             self.session.query(CRE)
@@ -1782,27 +2809,65 @@ class Node_collection:
             )
             .all()
         )
-        result = []
-        for c in cres:
-            result.extend(self.get_CREs(external_id=c.external_id))
-        return result
+        return self.__cres_from_db(dbcres=cres)
 
-    def get_embeddings_by_doc_type(self, doc_type: str) -> Dict[str, List[float]]:
-        res = {}
-        embeddings = (
-            self.session.query(Embeddings).filter(Embeddings.doc_type == doc_type).all()
+    def __embeddings_id_column(self, doc_type: str):
+        return (
+            Embeddings.cre_id
+            if doc_type == cre_defs.Credoctypes.CRE.value
+            else Embeddings.node_id
         )
-        if embeddings:
-            for entry in embeddings:
-                if doc_type == cre_defs.Credoctypes.CRE.value:
-                    res[entry.cre_id] = [float(e) for e in entry.embeddings.split(",")]
-                else:
-                    res[entry.node_id] = [float(e) for e in entry.embeddings.split(",")]
-        return res
+
+    def __embeddings_query(self, doc_type: str):
+        return self.session.query(
+            self.__embeddings_id_column(doc_type),
+            Embeddings.embeddings_vector,
+            Embeddings.embeddings_dimensions,
+            Embeddings.embeddings,
+        ).filter(Embeddings.doc_type == doc_type)
+
+    def get_embeddings_matrix_by_doc_type(
+        self, doc_type: str
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        All the embeddings of a doc_type as one contiguous float32 matrix (a row per document)
+        and the database ids of the documents in the same order.
+        Embeddings whose dimensions differ from the first one are skipped.
+        """
+        return embeddings_matrix(self.__embeddings_query(doc_type).all())
+
+    def iter_embeddings_by_doc_type(
+        self, doc_type: str, chunk_size: int = EMBEDDINGS_CHUNK_SIZE
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """
+        The embeddings of a doc_type in chunks of (ids, matrix) as get_embeddings_matrix_by_doc_type returns them,
+        for going through all of them without loading them all in memory.
+        The rows are streamed by a single query (a server side cursor where the database supports it)
+        so every row is read exactly once.
+        """
+        rows = iter(self.__embeddings_query(doc_type).yield_per(chunk_size))
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield embeddings_matrix(chunk)
+
+    def get_embeddings_by_doc_type(self, doc_type: str) -> Dict[str, np.ndarray]:
+        ids, matrix = self.get_embeddings_matrix_by_doc_type(doc_type)
+        return dict(zip(ids, matrix))
+
+    def get_embedding_ids_by_doc_type(self, doc_type: str) -> List[str]:
+        """the database ids of the documents of doc_type that have embeddings, without reading the embeddings"""
+        return [
+            db_id
+            for (db_id,) in self.session.query(
+                self.__embeddings_id_column(doc_type)
+            ).filter(Embeddings.doc_type == doc_type)
+        ]
 
     def get_embeddings_by_doc_type_paginated(
         self, doc_type: str, page: int = 1, per_page: int = 100
-    ) -> Tuple[Dict[str, List[float]], int, int]:
+    ) -> Tuple[Dict[str, np.ndarray], int, int]:
         res = {}
         embeddings = (
             self.session.query(Embeddings)
@@ -1812,10 +2877,11 @@ class Node_collection:
         total_pages = embeddings.pages
         if embeddings.items:
             for entry in embeddings.items:
+                vector = decode_embeddings(entry.embeddings_vector, entry.embeddings)
                 if doc_type == cre_defs.Credoctypes.CRE.value:
-                    res[entry.cre_id] = [float(e) for e in entry.embeddings.split(",")]
+                    res[entry.cre_id] = vector
                 else:
-                    res[entry.node_id] = [float(e) for e in entry.embeddings.split(",")]
+                    res[entry.node_id] = vector
         return res, total_pages, page
 
     def get_embeddings_for_doc(self, doc: cre_defs.Node | cre_defs.CRE) -> Embeddings:
@@ -1852,45 +2918,149 @@ class Node_collection:
             .all()
         )
 
+    def get_embeddings_by_ids(self, ids: List[str]) -> Dict[str, Embeddings]:
+        """the embeddings of the CREs and nodes with the given database ids, by id"""
+        embeddings: Dict[str, Embeddings] = {}
+        for batch in batched(ids):
+            for emb in (
+                self.session.query(Embeddings)
+                .filter(
+                    sqla.or_(
+                        Embeddings.cre_id.in_(batch), Embeddings.node_id.in_(batch)
+                    )
+                )
+                .all()
+            ):
+                embeddings[emb.cre_id or emb.node_id] = emb
+        return embeddings
+
+    def get_embedding_of_text(self, text: str, model: str) -> Optional[np.ndarray]:
+        """the embedding any document already has of exactly this text by model, None if there is none or the model is unknown"""
+        if not model:
+            return None
+        row = (
+            self.session.query(Embeddings.embeddings_vector, Embeddings.embeddings)
+            .filter(Embeddings.embeddings_content_hash == embeddings_content_hash(text))
+            .filter(Embeddings.embeddings_model == model)
+            .first()
+        )
+        if not row:
+            return None
+        return decode_embeddings(row.embeddings_vector, row.embeddings)
+
     def add_embedding(
         self,
         db_object: CRE | Node,
         doctype: cre_defs.Credoctypes,
         embeddings: List[float],
         embedding_text: str,
+        model: str = "",
     ):
+        """
+        Args:
+            model (str): the name of the model that made the embeddings, if known
+        """
         existing = self.get_embedding(db_object.id)
-        embeddings_str = ",".join([str(e) for e in embeddings])
+        vector, dimensions, norm = encode_embeddings(embeddings)
 
         if not existing:
             emb = None
             if doctype == cre_defs.Credoctypes.CRE:
                 emb = Embeddings(
-                    embeddings=embeddings_str,
+                    embeddings="",
+                    embeddings_vector=vector,
+                    embeddings_dimensions=dimensions,
+                    embeddings_norm=norm,
                     cre_id=db_object.id,
                     doc_type=cre_defs.Credoctypes.CRE.value,
                     embeddings_content=embedding_text,
+                    embeddings_content_hash=embeddings_content_hash(embedding_text),
+                    embeddings_model=model or None,
                 )
             else:
                 emb = Embeddings(
-                    embeddings=embeddings_str,
+                    embeddings="",
+                    embeddings_vector=vector,
+                    embeddings_dimensions=dimensions,
+                    embeddings_norm=norm,
                     node_id=db_object.id,
                     doc_type=db_object.ntype,
                     embeddings_content=embedding_text,
+                    embeddings_content_hash=embeddings_content_hash(embedding_text),
+                    embeddings_model=model or None,
                     embeddings_url=db_object.link,
                 )
             self.session.add(emb)
+            generation = self.__bump_embeddings_generation(emb.doc_type)
             self.session.commit()
+            self.__update_embeddings_index(
+                emb.doc_type, db_object.id, embeddings, generation
+            )
             return emb
         else:
             logger.debug(f"knew of embedding for object {db_object.id} ,updating")
             self.session.commit()
-            existing[0].embeddings = embeddings_str
+            existing[0].embeddings = ""
+            existing[0].embeddings_vector = vector
+            existing[0].embeddings_dimensions = dimensions
+            existing[0].embeddings_norm = norm
             existing[0].embeddings_content = embedding_text
+            existing[0].embeddings_content_hash = embeddings_content_hash(
+                embedding_text
+            )
+            existing[0].embeddings_model = model or None
+            generation = self.__bump_embeddings_generation(existing[0].doc_type)
             self.session.commit()
+            self.__update_embeddings_index(
+                existing[0].doc_type, db_object.id, embeddings, generation
+            )
 
             return existing
 
+    def add_embeddings(
+        self,
+        embeddings: List[Tuple[CRE | Node, cre_defs.Credoctypes, List[float], str]],
+        model: str = "",
+    ) -> None:
+        """add_embedding for many (db_object, doctype, embeddings, embedding_text) made by model, in one transaction"""
+        existing = self.get_embeddings_by_ids(
+            [db_object.id for db_object, _, _, _ in embeddings]
+        )
+        for db_object, doctype, vector_values, embedding_text in embeddings:
+            vector, dimensions, norm = encode_embeddings(vector_values)
+            emb = existing.get(db_object.id)
+            if not emb:
+                if doctype == cre_defs.Credoctypes.CRE:
+                    emb = Embeddings(
+                        cre_id=db_object.id, doc_type=cre_defs.Credoctypes.CRE.value
+                    )
+                else:
+                    emb = Embeddings(
+                        node_id=db_object.id,
+                        doc_type=db_object.ntype,
+                        embeddings_url=db_object.link,
+                    )
+                self.session.add(emb)
+                existing[db_object.id] = emb
+            emb.embeddings = ""
+            emb.embeddings_vector = vector
+            emb.embeddings_dimensions = dimensions
+            emb.embeddings_norm = norm
+            emb.embeddings_content = embedding_text
+            emb.embeddings_content_hash = embeddings_content_hash(embedding_text)
+            emb.embeddings_model = model or None
+        generations = {
+            doc_type: self.__bump_embeddings_generation(doc_type)
+            for doc_type in sorted({emb.doc_type for emb in existing.values()})
+        }
+        self.session.commit()
+
+        for db_object, _, vector_values, _ in embeddings:
+            emb = existing[db_object.id]
+            self.__update_embeddings_index(
+                emb.doc_type, db_object.id, vector_values, generations[emb.doc_type]
+            )
+
     def gap_analysis_exists(self, cache_key) -> bool:
         q = self.session.query(GapAnalysisResults).filter(
             GapAnalysisResults.cache_key == cache_key
@@ -1909,13 +3079,112 @@ class Node_collection:
             return res.ga_object
         logger.info(f"did not find gap analysis with cache key: {cache_key}")
 
-    def add_gap_analysis_result(self, cache_key: str, ga_object: str):
+    def add_gap_analysis_result(
+        self, cache_key: str, ga_object: str, dependencies: Optional[Set[str]] = None
+    ):
         if not self.gap_analysis_exists(cache_key):
             logger.info(f"adding gap analysis result with cache key: {cache_key}")
             res = GapAnalysisResults(cache_key=cache_key, ga_object=ga_object)
             self.session.add(res)
+            # left over by results deleted without their dependencies
+            self.session.query(GapAnalysisDependencies).filter(
+                GapAnalysisDependencies.cache_key == cache_key
+            ).delete(synchronize_session=False)
+            for dependency in get_key_dependencies(cache_key).union(dependencies or []):
+                self.session.add(
+                    GapAnalysisDependencies(cache_key=cache_key, dependency=dependency)
+                )
             self.session.commit()
 
+    def get_gap_analysis_dependencies(
+        self, standards: List[str]
+    ) -> Dict[str, Set[str]]:
+        """
+        The dependencies any gap analysis of each standard has regardless of its paths:
+        the standard itself and the CREs its sections link to
+        """
+        dependencies = {name: {make_standard_dependency(name)} for name in standards}
+        for batch in batched(standards):
+            for name, external_id in (
+                self.session.query(Node.name, CRE.external_id)
+                .join(Links, Links.node == Node.id)
+                .join(CRE, CRE.id == Links.cre)
+                .filter(Node.name.in_(batch))
+                .distinct()
+            ):
+                dependencies[name].add(make_cre_dependency(external_id))
+        return dependencies
+
+    def existing_gap_analysis_keys(self, cache_keys: List[str]) -> Set[str]:
+        existing: Set[str] = set()
+        for batch in batched(cache_keys):
+            existing.update(
+                key
+                for (key,) in self.session.query(GapAnalysisResults.cache_key).filter(
+                    GapAnalysisResults.cache_key.in_(batch)
+                )
+            )
+        return existing
+
+    def add_gap_analysis_results(
+        self,
+        results: Dict[str, str],
+        overwrite: bool = False,
+        dependencies: Optional[Dict[str, Set[str]]] = None,
+    ) -> None:
+        """
+        bulk version of add_gap_analysis_result, cache key -> gap analysis object
+        and cache key -> dependencies, committed at once
+        """
+        dependencies = {
+            key: get_key_dependencies(key).union((dependencies or {}).get(key, []))
+            for key in results
+        }
+        existing = self.existing_gap_analysis_keys(list(results))
+        if overwrite:
+            for batch in batched(list(existing)):
+                self.session.query(GapAnalysisResults).filter(
+                    GapAnalysisResults.cache_key.in_(batch)
+                ).delete(synchronize_session=False)
+            existing = set()
+        # the dependencies of replaced results and any left over by results deleted without them
+        keys = [
+            key for key, deps in dependencies.items() if deps and key not in existing
+        ]
+        for batch in batched(keys):
+            self.session.query(GapAnalysisDependencies).filter(
+                GapAnalysisDependencies.cache_key.in_(batch)
+            ).delete(synchronize_session=False)
+        self.session.bulk_insert_mappings(
+            GapAnalysisResults,
+            [
+                {"cache_key": key, "ga_object": ga_object}
+                for key, ga_object in results.items()
+                if key not in existing
+            ],
+        )
+        self.session.bulk_insert_mappings(
+            GapAnalysisDependencies,
+            [
+                {"cache_key": key, "dependency": dependency}
+                for key, key_dependencies in dependencies.items()
+                if key not in existing
+                for dependency in key_dependencies
+            ],
+        )
+        self.session.commit()
+
+
+def node_key(node: Node) -> Tuple[str, str, str, str, str]:
+    """the uq_node columns of a database node, a missing value is the same as an empty one"""
+    return (
+        node.name or "",
+        node.section or "",
+        node.subsection or "",
+        node.version or "",
+        node.section_id or "",
+    )
+
 
 def dbNodeFromNode(doc: cre_defs.Node) -> Optional[Node]:
     if doc.doctype == cre_defs.Credoctypes.Standard:
@@ -2048,10 +3317,47 @@ def gap_analysis(
     cache_key: str = "",
 ):
     cre_db = Node_collection()
-    base_standard, paths = neo_db.gap_analysis(node_names[0], node_names[1])
+    if inmemory_gap_analysis.enabled():
+        base_standard, paths = cre_db.gap_analysis_graph().gap_analysis(
+            node_names[0], node_names[1]
+        )
+    else:
+        base_standard, paths = neo_db.gap_analysis(node_names[0], node_names[1])
     logger.info(f"got db gap analysis for {'>>>'.join(node_names)}, calculating paths")
     if base_standard is None:
         return None
+    dependencies = get_paths_dependencies(paths)
+    for standard_dependencies in cre_db.get_gap_analysis_dependencies(
+        node_names[:2]
+    ).values():
+        dependencies.update(standard_dependencies)
+    grouped_paths, extra_paths_dict = group_gap_analysis_paths(base_standard, paths)
+
+    if cache_key == "":
+        cache_key = make_resources_key(node_names)
+    logger.info(f"got gap analysis paths for {'>>>'.join(node_names)}, storing result")
+    cre_db.add_gap_analysis_result(
+        cache_key=cache_key,
+        ga_object=flask_json.dumps({"result": grouped_paths}),
+        dependencies=dependencies,
+    )
+
+    for key in extra_paths_dict:
+        cre_db.add_gap_analysis_result(
+            cache_key=make_subresources_key(node_names, key),
+            ga_object=flask_json.dumps({"result": extra_paths_dict[key]}),
+        )
+    logger.info(f"stored gapa analysis for {'>>>'.join(node_names)}, successfully")
+    return (node_names, grouped_paths, extra_paths_dict)
+
+
+def group_gap_analysis_paths(
+    base_standard: List[cre_defs.Document], paths: List[Dict[str, Any]]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Scores the paths of a gap analysis and groups them per base standard section,
+    returns the strong paths (the main result) and the weak ones (the subresources)
+    """
     grouped_paths = {}
     extra_paths_dict = {}
     GA_STRONG_UPPER_LIMIT = 2
@@ -2099,18 +3405,61 @@ def gap_analysis(
             else:
                 extra_paths_dict[key]["paths"][end_key] = path
                 grouped_paths[key]["extra"] += 1
-
-    if cache_key == "":
-        cache_key = make_resources_key(node_names)
-    logger.info(f"got gap analysis paths for {'>>>'.join(node_names)}, storing result")
-    cre_db.add_gap_analysis_result(
-        cache_key=cache_key, ga_object=flask_json.dumps({"result": grouped_paths})
+    return grouped_paths, extra_paths_dict
+
+
+def gap_analysis_batch(
+    sources: Optional[List[str]] = None,
+    targets: Optional[List[str]] = None,
+    overwrite: bool = False,
+    cre_db: Optional["Node_collection"] = None,
+) -> int:
+    """
+    Calculates the gap analysis of every source standard against every target standard (all standards by default)
+    with the in memory engine, every source standard is traversed once for all its targets.
+    The main and subresource results of each source standard are written in bulk with one commit,
+    existing results are kept unless overwrite is set. Returns the number of gap analyses calculated
+    """
+    cre_db = cre_db or Node_collection()
+    ga_graph = cre_db.gap_analysis_graph()
+    standards = cre_db.standards()
+    standard_dependencies = cre_db.get_gap_analysis_dependencies(
+        list(set((sources or standards) + (targets or standards)))
     )
+    calculated = 0
+    for source in sources or standards:
+        names = [target for target in (targets or standards) if target != source]
+        if not overwrite:
+            existing = cre_db.existing_gap_analysis_keys(
+                [make_resources_key([source, name]) for name in names]
+            )
+            names = [
+                name
+                for name in names
+                if make_resources_key([source, name]) not in existing
+            ]
+        if not names:
+            continue
 
-    for key in extra_paths_dict:
-        cre_db.add_gap_analysis_result(
-            cache_key=make_subresources_key(node_names, key),
-            ga_object=flask_json.dumps({"result": extra_paths_dict[key]}),
+        base_standard, paths = ga_graph.gap_analyses_from(source, names)
+        results: Dict[str, str] = {}
+        dependencies: Dict[str, Set[str]] = {}
+        for name in names:
+            cache_key = make_resources_key([source, name])
+            dependencies[cache_key] = get_paths_dependencies(paths[name]).union(
+                standard_dependencies[source], standard_dependencies[name]
+            )
+            grouped_paths, extra_paths_dict = group_gap_analysis_paths(
+                base_standard, paths[name]
+            )
+            results[cache_key] = flask_json.dumps({"result": grouped_paths})
+            for key in extra_paths_dict:
+                results[make_subresources_key([source, name], key)] = flask_json.dumps(
+                    {"result": extra_paths_dict[key]}
+                )
+        cre_db.add_gap_analysis_results(
+            results, overwrite=overwrite, dependencies=dependencies
         )
-    logger.info(f"stored gapa analysis for {'>>>'.join(node_names)}, successfully")
-    return (node_names, grouped_paths, extra_paths_dict)
+        calculated += len(names)
+        logger.info(f"stored gap analysis of {source} against {len(names)} standards")
+    return calculated
@@ -0,0 +1,368 @@
+import heapq
+import logging
+import math
+import os
+import struct
+import tempfile
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# how many of the closest centroids an IVF_Index query searches, more means better recall and slower queries
+DEFAULT_PROBES = int(os.environ.get("CRE_EMBEDDINGS_INDEX_PROBES", "8"))
+KMEANS_ITERATIONS = 10
+# the centroids are trained on a sample of this many embeddings per centroid
+KMEANS_SAMPLE_SIZE = 64
+# how many embeddings are assigned to centroids at once, bounds the size of the similarity matrix
+ASSIGN_BATCH_SIZE = 4096
+# id length, dimensions, the embeddings generation the change made, then the id and the float32 embedding
+LOG_RECORD_HEADER = struct.Struct("<IIQ")
+# the generation of an index that is known to differ from the database, no database generation equals it
+STALE_GENERATION = -1
+
+
+class Embedding_Index:
+    """
+    Cosine similarity search over a fixed set of embeddings.
+    The embeddings are normalised once, when the index is built, so a query is a single
+    matrix product with the (normalised) query followed by a partial sort of the similarities.
+    """
+
+    ids: List[str]
+    matrix: np.ndarray  # float32, one normalised embedding per row, in the order of ids
+
+    def __init__(self, ids: List[str], embeddings: np.ndarray) -> None:
+        """
+        Args:
+            ids (List[str]): the database id of every embedding
+            embeddings (np.ndarray): one embedding per row, in the order of ids
+        """
+        if len(ids) != len(embeddings):
+            raise ValueError(
+                f"cannot index {len(embeddings)} embeddings with {len(ids)} ids"
+            )
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            # no embeddings at all
+            matrix = matrix.reshape(len(ids), 0)
+        self.ids = list(ids)
+        self.matrix = normalise(matrix)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def top_k(self, embedding: List[float], k: int = 1) -> List[Tuple[str, float]]:
+        """the (id, similarity) of the k embeddings most similar to embedding, most similar first"""
+        return self.top_k_batch([embedding], k)[0]
+
+    def top_k_batch(
+        self, embeddings: List[List[float]], k: int = 1
+    ) -> List[List[Tuple[str, float]]]:
+        """top_k for many embeddings at once, in the order of embeddings"""
+        queries = normalise(
+            np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        )
+        if not len(self.ids):
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != self.matrix.shape[1]:
+            raise ValueError(
+                f"cannot search {queries.shape[1]} dimension embeddings in an index of {self.matrix.shape[1]} dimension embeddings"
+            )
+        k = min(k, len(self.ids))
+        similarities = queries @ self.matrix.T
+        best = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        best_similarities = np.take_along_axis(similarities, best, axis=1)
+        order = np.argsort(-best_similarities, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_similarities = np.take_along_axis(best_similarities, order, axis=1)
+        return [
+            [(self.ids[i], float(s)) for i, s in zip(row, row_similarities)]
+            for row, row_similarities in zip(best, best_similarities)
+        ]
+
+    def most_similar(self, embedding: List[float]) -> Tuple[Optional[str], float]:
+        """the id and similarity of the most similar embedding, (None, -1) if the index is empty"""
+        best = self.top_k(embedding, 1)
+        if not best:
+            return None, -1
+        return best[0]
+
+
+def normalise(embeddings: np.ndarray) -> np.ndarray:
+    """scales every row to unit length, rows of zeros stay zeros"""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def top_k_of_chunks(
+    chunks: Iterable[Tuple[List[str], np.ndarray]],
+    embedding: List[float],
+    k: int = 1,
+) -> List[Tuple[str, float]]:
+    """
+    Embedding_Index.top_k over embeddings read chunk by chunk (ids, matrix), only the k best so far are kept.
+    Chunks of embeddings with other dimensions than embedding, e.g. made by another model, are skipped
+    """
+    best: List[Tuple[str, float]] = []
+    for ids, matrix in chunks:
+        if len(ids) and matrix.shape[1] != len(embedding):
+            logger.warning(
+                f"skipping {len(ids)} embeddings of {matrix.shape[1]} dimensions while searching for one of {len(embedding)} dimensions"
+            )
+            continue
+        best = heapq.nlargest(
+            k,
+            best + Embedding_Index(ids, matrix).top_k(embedding, k),
+            key=lambda b: b[1],
+        )
+    return best
+
+
+class IVF_Index(Embedding_Index):
+    """
+    Approximate cosine similarity search (IVF-flat): the embeddings are grouped around about sqrt(n) k-means centroids
+    and a query is only compared with the embeddings of its probes closest centroids,
+    so the cost of a query grows with the square root of the number of embeddings instead of linearly.
+    probes trades recall for latency, searching all the centroids returns the same results as Embedding_Index.
+
+    Embeddings added after the index is built join the group of their closest centroid,
+    the centroids are trained again once the index has grown to twice the size they were trained on.
+    """
+
+    probes: int
+    last_checked: float = 0  # see Node_collection.embeddings_index
+    # the embeddings generation of the database content the index was built from, see Node_collection.embeddings_index
+    generation: int = 0
+    trained_size: int
+    centroids: np.ndarray
+    lists: List[np.ndarray]  # positions of the embeddings of every centroid
+
+    def __init__(
+        self, ids: List[str], embeddings: np.ndarray, probes: Optional[int] = None
+    ) -> None:
+        super().__init__(ids, embeddings)
+        self.probes = probes or DEFAULT_PROBES
+        self.__buffer = self.matrix
+        self.__positions = {id: i for i, id in enumerate(self.ids)}
+        self.train()
+
+    def train(self) -> None:
+        """spherical k-means over a sample of the embeddings, then assigns every embedding to its closest centroid"""
+        size = len(self.ids)
+        self.trained_size = size
+        if not size:
+            self.centroids = np.zeros((0, self.matrix.shape[1]), dtype=np.float32)
+            self.lists = []
+            return
+        lists = max(1, round(math.sqrt(size)))
+        rand = np.random.default_rng(42)
+        sample = self.matrix[
+            rand.permutation(size)[: min(size, lists * KMEANS_SAMPLE_SIZE)]
+        ]
+        centroids = sample[:lists].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            moved = np.bincount(assignments, minlength=len(centroids)) > 0
+            # centroids nothing was assigned to stay where they are
+            centroids[moved] = normalise(sums[moved])
+        self.centroids = centroids
+        self.assign(self.__assignments(self.matrix))
+
+    def assign(self, assignments: np.ndarray) -> None:
+        """groups the embeddings by the centroid they are assigned to (one centroid index per embedding)"""
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [
+            order[bounds[i] : bounds[i + 1]] for i in range(len(self.centroids))
+        ]
+
+    def assignments(self) -> np.ndarray:
+        """the centroid index of every embedding, in the order of ids"""
+        assignments = np.zeros(len(self.ids), dtype=np.int64)
+        for i, positions in enumerate(self.lists):
+            assignments[positions] = i
+        return assignments
+
+    def __assignments(self, matrix: np.ndarray) -> np.ndarray:
+        if not len(self.centroids):
+            return np.zeros(len(matrix), dtype=np.int64)
+        return np.concatenate(
+            [
+                np.argmax(matrix[i : i + ASSIGN_BATCH_SIZE] @ self.centroids.T, axis=1)
+                for i in range(0, len(matrix), ASSIGN_BATCH_SIZE)
+            ]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+
+    def add(self, id: str, embedding: List[float]) -> bool:
+        """
+        Adds or replaces the embedding of id,
+        returns whether the centroids were trained again (and a persisted copy of the index should be saved again)
+        """
+        vector = normalise(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+        if len(self.ids) and vector.shape[1] != self.matrix.shape[1]:
+            raise ValueError(
+                f"cannot add a {vector.shape[1]} dimension embedding to an index of {self.matrix.shape[1]} dimension embeddings"
+            )
+        position = self.__positions.get(id)
+        if position is not None:
+            self.matrix[position] = vector[0]
+            self.lists = [p[p != position] for p in self.lists]
+        else:
+            position = len(self.ids)
+            if position == len(self.__buffer) or not len(self.ids):
+                # grow geometrically so adding n embeddings copies the matrix log(n) times
+                buffer = np.zeros(
+                    (max(2 * position, 16), vector.shape[1]), dtype=np.float32
+                )
+                if position:
+                    buffer[:position] = self.matrix
+                self.__buffer = buffer
+            self.__buffer[position] = vector[0]
+            self.ids.append(id)
+            self.__positions[id] = position
+            self.matrix = self.__buffer[: len(self.ids)]
+        if len(self.ids) > 2 * self.trained_size or not len(self.centroids):
+            self.train()
+            return True
+        closest = int(self.__assignments(vector)[0])
+        self.lists[closest] = np.append(self.lists[closest], position)
+        return False
+
+    def top_k_batch(
+        self, embeddings: List[List[float]], k: int = 1
+    ) -> List[List[Tuple[str, float]]]:
+        queries = normalise(
+            np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        )
+        if not len(self.ids):
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != self.matrix.shape[1]:
+            raise ValueError(
+                f"cannot search {queries.shape[1]} dimension embeddings in an index of {self.matrix.shape[1]} dimension embeddings"
+            )
+        probes = min(self.probes, len(self.centroids))
+        closest = np.argpartition(-(queries @ self.centroids.T), probes - 1, axis=1)[
+            :, :probes
+        ]
+        results = []
+        for query, centroids in zip(queries, closest):
+            candidates = np.concatenate([self.lists[c] for c in centroids])
+            similarities = self.matrix[candidates] @ query
+            top = min(k, len(candidates))
+            if not top:
+                results.append([])
+                continue
+            best = np.argpartition(-similarities, top - 1)[:top]
+            best = best[np.argsort(-similarities[best])]
+            results.append(
+                [(self.ids[candidates[i]], float(similarities[i])) for i in best]
+            )
+        return results
+
+    def save(self, path: str) -> None:
+        """writes the index to path and starts a new log, see load"""
+        directory = os.path.dirname(os.path.abspath(path))
+        # moved aside first, records appended while the index is written go to a new log that applies on top of it
+        rotated = None
+        if os.path.exists(log_path(path)):
+            fd, rotated = tempfile.mkstemp(dir=directory, suffix=".log")
+            os.close(fd)
+            try:
+                os.replace(log_path(path), rotated)
+            except FileNotFoundError:
+                # another process saved the index meanwhile
+                os.remove(rotated)
+                rotated = None
+        # written next to the index and renamed, so readers never see half of it
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                ids=np.array(self.ids, dtype=str),
+                matrix=self.matrix,
+                centroids=self.centroids,
+                assignments=self.assignments(),
+                trained_size=self.trained_size,
+                generation=np.int64(self.generation),
+            )
+        os.replace(tmp_path, path)
+        if rotated:
+            os.remove(rotated)
+
+    @classmethod
+    def load(cls, path: str, probes: Optional[int] = None) -> "IVF_Index":
+        """reads an index written by save, then adds the embeddings appended to its log since"""
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            Embedding_Index.__init__(index, data["ids"].tolist(), data["matrix"])
+            index.probes = probes or DEFAULT_PROBES
+            index.__buffer = index.matrix
+            index.__positions = {id: i for i, id in enumerate(index.ids)}
+            index.centroids = data["centroids"]
+            index.trained_size = int(data["trained_size"])
+            index.assign(data["assignments"])
+            # indexes saved before the generation was recorded are never current
+            index.generation = (
+                int(data["generation"]) if "generation" in data else STALE_GENERATION
+            )
+        for id, embedding, generation in read_log(path):
+            index.add(id, embedding)
+            index.advance(generation)
+        return index
+
+    def advance(self, generation: int) -> None:
+        """
+        records a change the database made at generation, after which the index only matches the database
+        if it holds every change since it was built: a generation skipped (another process's change) makes it stale
+        """
+        if generation == self.generation + 1:
+            self.generation = generation
+        elif generation != self.generation:
+            self.generation = STALE_GENERATION
+
+
+def log_path(path: str) -> str:
+    return f"{path}.log"
+
+
+def append_log(path: str, id: str, embedding: List[float], generation: int = 0) -> None:
+    """
+    records an embedding added at generation after the index at path was saved,
+    IVF_Index.load adds it back and advances the index to generation
+    """
+    encoded_id = id.encode()
+    vector = np.asarray(embedding, dtype="<f4")
+    with open(log_path(path), "ab") as f:
+        f.write(
+            LOG_RECORD_HEADER.pack(len(encoded_id), len(vector), generation)
+            + encoded_id
+            + vector.tobytes()
+        )
+
+
+def read_log(path: str) -> Iterator[Tuple[str, np.ndarray, int]]:
+    if not os.path.exists(log_path(path)):
+        return
+    with open(log_path(path), "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + LOG_RECORD_HEADER.size <= len(data):
+        id_length, dimensions, generation = LOG_RECORD_HEADER.unpack_from(data, offset)
+        offset += LOG_RECORD_HEADER.size
+        end = offset + id_length + 4 * dimensions
+        if end > len(data):
+            # a record that was being written when the log was read
+            break
+        id = data[offset : offset + id_length].decode()
+        yield id, np.frombuffer(
+            data, dtype="<f4", count=dimensions, offset=offset + id_length
+        ), generation
+        offset = end
@@ -0,0 +1,249 @@
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from application.defs import cre_defs as defs
+
+# gap_analysis imports the database module, so it is referenced lazily (at call time) instead of importing names from it
+from application.utils import gap_analysis
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# CREs that are linked to almost everything, paths through them are meaningless
+DENYLIST = ["Cross-cutting concerns"]
+# the longest path (in relationships) between two sections, same as the [*..20] of the Cypher queries
+MAX_PATH_LENGTH = 20
+
+# the graph database relationship names, these are what gap_analysis.PENALTIES and the stored results use
+RELATIONSHIPS = {
+    defs.LinkTypes.Contains.value: "CONTAINS",
+    defs.LinkTypes.PartOf.value: "CONTAINS",
+    defs.LinkTypes.Related.value: "RELATED",
+    defs.LinkTypes.LinkedTo.value: "LINKED_TO",
+    defs.LinkTypes.AutomaticallyLinkedTo.value: "AUTOMATICALLY_LINKED_TO",
+}
+
+
+def enabled() -> bool:
+    """whether gap analyses should be calculated in memory instead of by Neo4j"""
+    return os.environ.get("CRE_GAP_ANALYSIS_BACKEND", "neo4j") == "inmemory"
+
+
+class Gap_Analysis_Graph:
+    """
+    Gap analysis over an in memory copy of the CRE graph, an alternative to NEO_DB.gap_analysis that needs no graph database.
+
+    For every section of the base standard it finds, for every section of the compared standard,
+    the shortest paths that only go through CREs (same as the Cypher allShortestPaths queries, with and without RELATED links)
+    and keeps the best scoring one according to gap_analysis.PENALTIES.
+    Each section of the base standard is searched from once, whatever the number of sections it is compared to.
+    """
+
+    content_hash: Optional[str] = None
+    last_checked: float = (
+        0  # time.monotonic() of the last check that content_hash is current
+    )
+
+    def __init__(
+        self,
+        cres: List[Tuple[str, defs.CRE]],
+        nodes: List[Tuple[str, defs.Node]],
+        cre_node_links: List[Tuple[str, str, str]],
+        internal_links: List[Tuple[str, str, str]],
+        denylist: List[str] = DENYLIST,
+        content_hash: Optional[str] = None,
+    ):
+        """
+        Args:
+            cres (List[Tuple[str, defs.CRE]]): (db id, shallow cre)
+            nodes (List[Tuple[str, defs.Node]]): (db id, shallow node)
+            cre_node_links (List[Tuple[str, str, str]]): (cre id, node id, ltype)
+            internal_links (List[Tuple[str, str, str]]): (group id, cre id, ltype)
+            denylist (List[str]): names of CREs paths cannot go through
+            content_hash (str): identifies the database content the data was read from, if any
+        """
+        t0 = time.perf_counter()
+        self.content_hash = content_hash
+        penalties = gap_analysis.PENALTIES
+
+        denied = set(denylist)
+        self.__cre_docs: List[defs.CRE] = []
+        cre_index: Dict[str, int] = {}
+        for cre_id, cre in cres:
+            if cre.name in denied:
+                continue
+            cre_index[cre_id] = len(self.__cre_docs)
+            self.__cre_docs.append(cre)
+
+        self.__node_docs: List[defs.Node] = []
+        node_index: Dict[str, int] = {}
+        self.__sections: Dict[str, List[int]] = defaultdict(list)
+        for node_id, node in nodes:
+            if node.name in denied:
+                continue
+            node_index[node_id] = len(self.__node_docs)
+            self.__sections[node.name].append(len(self.__node_docs))
+            self.__node_docs.append(node)
+
+        # cre -> (other cre, relationship, whether the relationship starts at cre, penalty for going cre->other)
+        self.__cre_edges: List[List[Tuple[int, str, bool, int]]] = [
+            [] for _ in self.__cre_docs
+        ]
+        for group, cre, ltype in internal_links:
+            relationship = RELATIONSHIPS.get(ltype)
+            if group not in cre_index or cre not in cre_index or not relationship:
+                continue
+            start, end = cre_index[group], cre_index[cre]
+            if ltype == defs.LinkTypes.PartOf.value:
+                start, end = end, start
+            if relationship == "CONTAINS":
+                forward, backward = penalties["CONTAINS_UP"], penalties["CONTAINS_DOWN"]
+            else:
+                forward = backward = penalties[relationship]
+            self.__cre_edges[start].append((end, relationship, True, forward))
+            self.__cre_edges[end].append((start, relationship, False, backward))
+
+        # node -> (cre, relationship), relationships always start at the cre
+        self.__node_cres: List[List[Tuple[int, str]]] = [[] for _ in self.__node_docs]
+        for cre, node, ltype in cre_node_links:
+            relationship = RELATIONSHIPS.get(ltype)
+            if cre not in cre_index or node not in node_index or not relationship:
+                continue
+            self.__node_cres[node_index[node]].append((cre_index[cre], relationship))
+        logger.info(
+            f"built gap analysis graph of {len(self.__cre_docs)} CREs and {len(self.__node_docs)} nodes in {time.perf_counter()-t0} seconds"
+        )
+
+    def standards(self) -> List[str]:
+        return list(self.__sections)
+
+    def gap_analysis(
+        self, name_1: str, name_2: str
+    ) -> Tuple[List[defs.Node], List[Dict[str, Any]]]:
+        """the same (base standard sections, paths) structure NEO_DB.gap_analysis returns"""
+        base_standard, paths = self.gap_analyses_from(name_1, [name_2])
+        return base_standard, paths[name_2]
+
+    def gap_analyses_from(
+        self, name_1: str, names: Optional[List[str]] = None
+    ) -> Tuple[List[defs.Node], Dict[str, List[Dict[str, Any]]]]:
+        """
+        The gap analysis of name_1 against every standard in names (every other standard by default) in one pass,
+        returns the base standard sections and the paths per compared standard
+        """
+        if names is None:
+            names = [name for name in self.__sections if name != name_1]
+        base_standard = self.__sections.get(name_1, [])
+        paths: Dict[str, List[Dict[str, Any]]] = {name: [] for name in names}
+        for start in base_standard:
+            searches = [self.__search(start, True), self.__search(start, False)]
+            for name in names:
+                paths[name].extend(
+                    self.__paths_from(start, self.__sections.get(name, []), searches)
+                )
+        return [self.__node_docs[n] for n in base_standard], paths
+
+    def __paths_from(
+        self,
+        start: int,
+        ends: List[int],
+        searches: List[Dict[int, Tuple[int, int, Any]]],
+    ) -> List[Dict[str, Any]]:
+        penalties = gap_analysis.PENALTIES
+        paths = []
+        for end in ends:
+            if end == start:
+                continue
+            best = None
+            for search in searches:
+                # the shortest paths to the end section first, then the best scoring one
+                candidates = [
+                    (search[cre][0] + 1, search[cre][1] + penalties[relationship], cre)
+                    for cre, relationship in self.__node_cres[end]
+                    if cre in search
+                ]
+                if not candidates:
+                    continue
+                hops, score, cre = min(candidates)
+                if not best or score < best[0]:
+                    best = (score, cre, search)
+            if best:
+                paths.append(self.__format_path(start, end, best[1], best[2]))
+        return paths
+
+    def __search(
+        self, start: int, with_related: bool
+    ) -> Dict[int, Tuple[int, int, Any]]:
+        """
+        Breadth first search from a section through the CREs, returns for every CRE reached
+        (hops from the section, best score among the shortest paths, (previous cre or None, relationship, forward))
+        """
+        penalties = gap_analysis.PENALTIES
+        reached: Dict[int, Tuple[int, int, Any]] = {}
+        for cre, relationship in self.__node_cres[start]:
+            score = penalties[relationship]
+            if cre not in reached or score < reached[cre][1]:
+                reached[cre] = (1, score, (None, relationship, True))
+        frontier = list(reached)
+        hops = 1
+        # the last relationship of a path links a CRE to the end section
+        while frontier and hops < MAX_PATH_LENGTH - 1:
+            hops += 1
+            next_frontier = []
+            for cre in frontier:
+                cre_score = reached[cre][1]
+                for other, relationship, forward, penalty in self.__cre_edges[cre]:
+                    if not with_related and relationship == "RELATED":
+                        continue
+                    score = cre_score + penalty
+                    if other not in reached:
+                        reached[other] = (hops, score, (cre, relationship, forward))
+                        next_frontier.append(other)
+                    elif reached[other][0] == hops and score < reached[other][1]:
+                        reached[other] = (hops, score, (cre, relationship, forward))
+            frontier = next_frontier
+        return reached
+
+    def __format_path(
+        self, start: int, end: int, cre: int, search: Dict[int, Tuple[int, int, Any]]
+    ) -> Dict[str, Any]:
+        relationship = [r for c, r in self.__node_cres[end] if c == cre]
+        steps = [
+            {
+                "start": self.__cre_docs[cre],
+                "end": self.__node_docs[end],
+                "relationship": min(
+                    relationship, key=lambda r: gap_analysis.PENALTIES[r]
+                ),
+            }
+        ]
+        while True:
+            previous, relationship, forward = search[cre][2]
+            if previous is None:
+                steps.append(
+                    {
+                        "start": self.__cre_docs[cre],
+                        "end": self.__node_docs[start],
+                        "relationship": relationship,
+                    }
+                )
+                break
+            source, target = (previous, cre) if forward else (cre, previous)
+            steps.append(
+                {
+                    "start": self.__cre_docs[source],
+                    "end": self.__cre_docs[target],
+                    "relationship": relationship,
+                }
+            )
+            cre = previous
+        steps.reverse()
+        return {
+            "start": self.__node_docs[start],
+            "end": self.__node_docs[end],
+            "path": steps,
+        }
@@ -1,7 +1,9 @@
-import sys
+import os
 import logging
 import networkx as nx
-from typing import List, Tuple
+import numpy as np
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Set, Tuple
 from application.defs import cre_defs as defs
 
 
@@ -10,6 +12,11 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+# graph attribute holding the hierarchy table, it lives in the graph so that it is shared and dropped along with it
+HIERARCHY_TABLE = "cre_hierarchy"
+CRE_KEY_PREFIX = f"{defs.Credoctypes.CRE.value}: "
+
+
 class CycleDetectedError(Exception):
     def __init__(self, message):
         super().__init__(message)
@@ -30,18 +37,62 @@ class Singleton_Graph_Storage(nx.DiGraph):
 
 class CRE_Graph:
     __graph: nx.Graph = None
-    __parent_child_subgraph = None
+    # whether the graph has been verified to be acyclic, after that every cre->cre edge is checked before it is added,
+    # by a search over all the edges, so cycles that go through nodes are found too.
+    # Edges with a node end are not checked: a node on a cycle needs an edge into its key and one out of it, but edges go into
+    # "Node: <id>" keys and out of "<doctype>: <id>" keys (the links of node documents), which nothing points to.
+    # The exception is the "Node: <id>" -> cre edge add_link makes for a CRE that "Is Part Of" a node, cycles through it are not guarded against
+    __acyclic: bool = False
 
     def get_raw_graph(self):
         return self.__graph
 
     def with_graph(self, graph: nx.Graph, graph_data: List[defs.Document]):
         self.__graph = graph
+        self.__acyclic = False
+        graph.graph.pop(HIERARCHY_TABLE, None)
         if not len(graph.edges):
             self.__load_cre_graph(graph_data)
 
+    def with_edges(
+        self,
+        graph: nx.DiGraph,
+        nodes: List[str],
+        edges: List[Tuple[str, str, str]],
+        check_cycles: bool = True,
+    ):
+        """
+        Populates an empty graph straight from graph keys ("CRE: <id>", "Node: <id>") and (source, target, ltype) edges,
+        cre->cre edges that would introduce a cycle are skipped, the same way loading documents skips them
+        """
+        self.__graph = graph
+        self.__acyclic = not len(graph.edges)
+        graph.graph.pop(HIERARCHY_TABLE, None)
+        for node in nodes:
+            graph.add_node(node, internal_id=node.split(": ", 1)[1])
+        for source, target, ltype in edges:
+            if ltype == defs.LinkTypes.Related.value and graph.has_edge(target, source):
+                continue
+            if (
+                check_cycles
+                and source.startswith(defs.Credoctypes.CRE.value)
+                and target.startswith(defs.Credoctypes.CRE.value)
+            ):
+                cycle = self.__cycle_through(source=source, target=target)
+                if cycle:
+                    logger.warning(
+                        f"A link between {source} and {target} would introduce cycle {cycle}, skipping"
+                    )
+                    continue
+            graph.add_edge(source, target, ltype=ltype)
+
     def introduces_cycle(self, doc_from: defs.Document, link_to: defs.Link):
-        try:
+        """
+        Returns the cycle (as a list of edges) that linking doc_from to link_to would introduce, None otherwise.
+        Since the existing graph is kept acyclic, a new edge source->target closes a cycle
+        exactly when source is already reachable from target, so there is no need to copy the graph
+        """
+        if not self.__acyclic:
             ex = self.has_cycle()
             if ex:
                 raise ValueError(
@@ -49,21 +100,26 @@ class CRE_Graph:
                     "this not a recoverable error,"
                     f" manual database actions are required {ex}"
                 )
-        except nx.exception.NetworkXNoCycle:
-            pass  # happy path, we don't want cycles
+            self.__acyclic = True
 
-        # TODO: when this becomes too slow (e.g. when we are importing 1000s of CREs at once)
-        # we can instead add the edge find the cycle and then remove the edge
-        new_graph = self.__graph.copy()
+        edge = self.__graph_edge(doc_from=doc_from, link_to=link_to, graph=self.__graph)
+        if not edge:
+            return None
+        return self.__cycle_through(source=edge[0], target=edge[1])
 
-        # this needs our special add_edge but with the copied graph
-        new_graph = self.__add_graph_edge(
-            doc_from=doc_from, link_to=link_to, graph=new_graph
-        )
+    def __cycle_through(
+        self, source: str, target: str
+    ) -> Optional[List[Tuple[str, str]]]:
+        """the cycle an edge source->target would close in the current graph, if any"""
+        if source == target:
+            return [(source, target)]
+        if source not in self.__graph or target not in self.__graph:
+            return None
         try:
-            return nx.find_cycle(new_graph)
-        except nx.exception.NetworkXNoCycle:
+            path = nx.shortest_path(self.__graph, target, source)
+        except nx.NetworkXNoPath:
             return None
+        return [(source, target)] + list(zip(path, path[1:]))
 
     def has_cycle(self):
         try:
@@ -72,69 +128,118 @@ class CRE_Graph:
         except nx.exception.NetworkXNoCycle:
             return None
 
-    def get_hierarchy(self, rootIDs: List[str], creID: str):
-
+    def get_hierarchy(self, creID: str) -> int:
+        """the number of Contains links between the CRE and the closest root CRE (one that nothing contains)"""
         if len(self.__graph.edges) == 0:
             logger.error("graph is empty")
             return -1
+        entry = self.__hierarchy_table().get(f"{CRE_KEY_PREFIX}{creID}")
+        if not entry:
+            raise ValueError(f"{CRE_KEY_PREFIX}{creID} isn't in the graph")
+        return entry[0]
 
-        if creID in rootIDs:
-            return 0
-
-        if self.__parent_child_subgraph == None:
-            if len(self.__graph.edges) == 0:
-                raise ValueError("Graph has no edges")
-            include_cres = []
-            for el in self.__graph.edges:
-                edge_data = self.__graph.get_edge_data(*el)
-                if (
-                    el[0].startswith("CRE")
-                    and el[1].startswith("CRE")
-                    and (
-                        edge_data["ltype"] == defs.LinkTypes.Contains
-                        or edge_data["ltype"] == defs.LinkTypes.PartOf
-                    )
-                ):
-                    include_cres.append(el[0])
-                    include_cres.append(el[1])
-
-            for el in rootIDs:
-                if (
-                    el not in include_cres
-                ):  # If the root is not in the parent/children graph, add it to prevent an error and continue, there is not path to our CRE anyway
-                    include_cres.append(f"CRE: {el}")
-            self.__parent_child_subgraph = self.__graph.subgraph(set(include_cres))
-
-        shortest_path = sys.maxsize
-        for root in rootIDs:
-            try:
-                shortest_path = min(
-                    shortest_path,
-                    len(
-                        nx.shortest_path(
-                            self.__parent_child_subgraph,
-                            f"CRE: {root}",
-                            f"CRE: {creID}",
-                        )
-                    )
-                    - 1,
+    def get_ancestry(self, creID: str) -> List[str]:
+        """the graph keys from the closest root CRE down to the CRE, following Contains links"""
+        table = self.__hierarchy_table()
+        key = f"{CRE_KEY_PREFIX}{creID}"
+        if key not in table:
+            return []
+        ancestry = [key]
+        while table[ancestry[-1]][1]:
+            ancestry.append(table[ancestry[-1]][1])
+        return list(reversed(ancestry))
+
+    def get_connected(self, creID: str) -> Set[str]:
+        """the graph keys of the documents with a directed path to or from the CRE, the ones get_path finds a path between"""
+        key = f"{CRE_KEY_PREFIX}{creID}"
+        if key not in self.__graph:
+            return set()
+        return nx.ancestors(self.__graph, key) | nx.descendants(self.__graph, key)
+
+    def __hierarchy_table(self) -> Dict[str, Tuple[int, Optional[str]]]:
+        """
+        graph key -> (depth, parent on a shortest path from a root) for every CRE,
+        built with one multi-source BFS from the roots over the Contains edges and kept up to date by add_link
+        """
+        table = self.__graph.graph.get(HIERARCHY_TABLE)
+        if table is not None:
+            return table
+
+        children = defaultdict(list)
+        contained = set()
+        for parent, child in self.__contains_edges():
+            children[parent].append(child)
+            contained.add(child)
+        table = {}
+        queue = deque()
+        for node in self.__graph.nodes:
+            if node.startswith(CRE_KEY_PREFIX) and node not in contained:
+                table[node] = (0, None)
+                queue.append(node)
+        while queue:
+            parent = queue.popleft()
+            for child in children[parent]:
+                if child not in table:
+                    table[child] = (table[parent][0] + 1, parent)
+                    queue.append(child)
+        self.__graph.graph[HIERARCHY_TABLE] = table
+        return table
+
+    def __contains_edges(self, edges=None):
+        if edges is None:
+            edges = self.__graph.edges(data="ltype")
+        return [
+            (u, v)
+            for u, v, ltype in edges
+            if ltype == defs.LinkTypes.Contains.value
+            and u.startswith(CRE_KEY_PREFIX)
+            and v.startswith(CRE_KEY_PREFIX)
+        ]
+
+    def __update_hierarchy(self, parent: str, child: str) -> None:
+        """called after a Contains edge parent->child was added"""
+        table = self.__graph.graph.get(HIERARCHY_TABLE)
+        if table is None:
+            return
+        table.setdefault(parent, (0, None))
+        old_depth, old_parent = table.setdefault(child, (0, None))
+        if old_parent and old_depth <= table[parent][0] + 1:
+            return  # child already has a parent at least as close to a root
+
+        # child was a root (its depth grows) or got closer to one (its depth shrinks),
+        # re-derive the depths of everything below it from their parents, top down
+        affected = {child}
+        queue = deque([child])
+        while queue:
+            for node in self.__contained_by(queue.popleft()):
+                if node not in affected:
+                    affected.add(node)
+                    queue.append(node)
+        for node in nx.topological_sort(self.__graph.subgraph(affected)):
+            parents = [
+                p
+                for p, _ in self.__contains_edges(
+                    self.__graph.in_edges(node, data="ltype")
                 )
-            except nx.exception.NodeNotFound:
-                # If the CRE is not in the parent/children graph it means that it's a lone CRE, so it's a root and we return 0
-                if f"CRE: {root}" not in self.__graph.nodes():
-                    raise ValueError(f"CRE: {root} isn't in the graph")
-                if f"CRE: {creID}" not in self.__graph.nodes():
-                    raise ValueError(f"CRE: {creID} isn't in the graph")
-                return 0
-            except nx.exception.NetworkXNoPath:
-                # If there is no path to the CRE, continue
-                continue
-        return shortest_path
+            ]
+            if parents:
+                closest = min(parents, key=lambda p: table[p][0])
+                table[node] = (table[closest][0] + 1, closest)
+            else:
+                table[node] = (0, None)
+
+    def __contained_by(self, parent: str) -> List[str]:
+        return [
+            child
+            for _, child in self.__contains_edges(
+                self.__graph.out_edges(parent, data="ltype")
+            )
+        ]
 
     def get_path(self, start: str, end: str) -> List[Tuple[str, str]]:
         try:
             return nx.shortest_path(self.__graph, start, end)
-        except nx.NetworkXNoPath:
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
             return []
 
     def add_cre(self, cre: defs.CRE):
@@ -145,6 +250,8 @@ class CRE_Graph:
         graph_cre = f"{defs.Credoctypes.CRE.value}: {cre.id}"
         if cre and graph_cre not in self.__graph.nodes():
             self.__graph.add_node(graph_cre, internal_id=cre.id)
+            if HIERARCHY_TABLE in self.__graph.graph:
+                self.__graph.graph[HIERARCHY_TABLE][graph_cre] = (0, None)
 
     def add_dbnode(self, dbnode: defs.Node):
         graph_node = "Node: " + str(dbnode.id)
@@ -155,6 +262,7 @@ class CRE_Graph:
         logger.debug(
             f"adding link {doc_from.id}, {link_to.document.id} ltype: {link_to.ltype}"
         )
+        edge = self.__graph_edge(doc_from=doc_from, link_to=link_to, graph=self.__graph)
         if (
             doc_from.doctype == defs.Credoctypes.CRE
             and link_to.document.doctype == defs.Credoctypes.CRE
@@ -165,20 +273,21 @@ class CRE_Graph:
                 logger.warning(warn)
                 raise CycleDetectedError(warn)
 
-        self.__graph = self.__add_graph_edge(
-            doc_from=doc_from, link_to=link_to, graph=self.__graph
-        )
+        if edge:
+            self.__graph.add_edge(edge[0], edge[1], ltype=edge[2])
+            if self.__contains_edges([edge]):
+                self.__update_hierarchy(parent=edge[0], child=edge[1])
 
-    def __add_graph_edge(
+    def __graph_edge(
         self,
         doc_from: defs.Document,
         link_to: defs.Link,
         graph: nx.DiGraph,
-    ) -> nx.digraph:
+    ) -> Optional[Tuple[str, str, str]]:
         """
-        Adds a directed edge to the graph provided
-        called by both graph population and speculative cycle finding methods
-        hence why it accepts a graph and returns a graph
+        Returns the directed (source, target, ltype) edge that represents the link in the graph provided,
+        None if the link is already represented by an existing edge.
+        Used by both graph population and cycle finding methods, hence it does not modify the graph
         """
         if doc_from.name == link_to.document.name:
             raise ValueError(
@@ -190,16 +299,16 @@ class CRE_Graph:
 
         if doc_from.doctype == defs.Credoctypes.CRE:
             if link_to.ltype == defs.LinkTypes.Contains:
-                graph.add_edge(
+                return (
                     f"{doc_from.doctype.value}: {doc_from.id}",
                     f"{to_doctype}: {link_to.document.id}",
-                    ltype=link_to.ltype.value,
+                    link_to.ltype.value,
                 )
             elif link_to.ltype == defs.LinkTypes.PartOf:
-                graph.add_edge(
+                return (
                     f"{to_doctype}: {link_to.document.id}",
                     f"{doc_from.doctype.value}: {doc_from.id}",
-                    ltype=defs.LinkTypes.Contains.value,
+                    defs.LinkTypes.Contains.value,
                 )
             elif link_to.ltype == defs.LinkTypes.Related:
                 # do nothing if the opposite already exists in the graph, otherwise we introduce a cycle
@@ -207,31 +316,29 @@ class CRE_Graph:
                     f"{to_doctype}: {link_to.document.id}",
                     f"{doc_from.doctype.value}: {doc_from.id}",
                 ):
-                    return graph
+                    return None
 
-                graph.add_edge(
+                return (
                     f"{doc_from.doctype.value}: {doc_from.id}",
                     f"{to_doctype}: {link_to.document.id}",
-                    ltype=defs.LinkTypes.Related.value,
+                    defs.LinkTypes.Related.value,
                 )
             elif (
                 link_to.ltype == defs.LinkTypes.LinkedTo
                 or link_to.ltype == defs.LinkTypes.AutomaticallyLinkedTo
             ):
-                graph.add_edge(
+                return (
                     f"{doc_from.doctype.value}: {doc_from.id}",
                     f"{to_doctype}: {link_to.document.id}",
-                    ltype=link_to.ltype.value,
+                    link_to.ltype.value,
                 )
             else:
                 raise ValueError(f"link type {link_to.ltype.value} not recognized")
-        else:
-            graph.add_edge(
-                f"{doc_from.doctype.value}: {doc_from.id}",
-                f"{to_doctype}: {link_to.document.id}",
-                ltype=link_to.ltype.value,
-            )
-        return graph
+        return (
+            f"{doc_from.doctype.value}: {doc_from.id}",
+            f"{to_doctype}: {link_to.document.id}",
+            link_to.ltype.value,
+        )
 
     def __load_cre_graph(self, documents: List[defs.Document]):
         for doc in documents:
@@ -252,3 +359,43 @@ class CRE_Graph:
                     self.add_link(doc_from=doc, link_to=link)
                 except CycleDetectedError as cde:
                     pass
+
+
+def save_snapshot(path: str, graph: nx.DiGraph) -> None:
+    """
+    Stores the graph as numpy arrays (node keys, edge endpoint indices and link types),
+    written to a temporary file first so that concurrent readers never see a partial snapshot
+    """
+    nodes = list(graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = list(graph.edges(data="ltype"))
+    ltypes = sorted({ltype for _, _, ltype in edges})
+    ltype_index = {ltype: i for i, ltype in enumerate(ltypes)}
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            nodes=np.array(nodes, dtype=str),
+            sources=np.array([index[u] for u, _, _ in edges], dtype=np.int32),
+            targets=np.array([index[v] for _, v, _ in edges], dtype=np.int32),
+            ltypes=np.array(ltypes, dtype=str),
+            edge_ltypes=np.array([ltype_index[l] for _, _, l in edges], dtype=np.int8),
+        )
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Tuple[List[str], List[Tuple[str, str, str]]]:
+    """the inverse of save_snapshot, returns arguments for CRE_Graph.with_edges"""
+    with np.load(path, allow_pickle=False) as snapshot:
+        nodes = snapshot["nodes"].tolist()
+        ltypes = snapshot["ltypes"].tolist()
+        edges = [
+            (nodes[u], nodes[v], ltypes[l])
+            for u, v, l in zip(
+                snapshot["sources"].tolist(),
+                snapshot["targets"].tolist(),
+                snapshot["edge_ltypes"].tolist(),
+            )
+        ]
+    return nodes, edges
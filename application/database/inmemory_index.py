@@ -0,0 +1,280 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from application.defs import cre_defs as defs
+
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class Document_Index:
+    """
+    Read-only, process wide copy of the CRE/Node/link tables, built for serving
+    the read endpoints without going to the database.
+    Everything is keyed by database id, documents are stored shallow (no links)
+    and links are materialised per request from the id adjacency lists.
+    The index is tied to a database content generation,
+    Node_collection reloads it whenever the generation changes.
+    A reload builds a new index and then replaces the instance, so readers holding the previous one
+    keep seeing complete data, reload_lock keeps concurrent requests from loading the same generation twice.
+    """
+
+    __instance: "Document_Index" = None
+    reload_lock = threading.Lock()
+
+    generation: Optional[int] = None
+    last_checked: float = 0
+
+    cres: Dict[str, defs.CRE]
+    cre_ids: List[str]  # in database order, used for pagination
+    cres_by_external_id: Dict[str, List[str]]
+    cres_by_name: Dict[str, List[str]]  # lowercase name -> ids
+
+    nodes: Dict[str, defs.Node]
+    node_ids: List[str]  # in database order, used for pagination
+    nodes_by_name: Dict[str, List[str]]  # lowercase name -> ids
+    node_attributes: Dict[str, Dict[str, Optional[str]]]
+
+    cre_node_links: Dict[str, List[Tuple[str, str]]]  # cre id -> (node id, ltype)
+    node_cre_links: Dict[str, List[Tuple[str, str]]]  # node id -> (cre id, ltype)
+    cre_cre_links: Dict[str, List[Tuple[str, str]]]  # cre id -> (cre id, ltype)
+    root_cre_ids: List[str]
+    standard_names: List[str]
+
+    @classmethod
+    def instance(cls) -> "Document_Index":
+        if cls.__instance is None:
+            cls.__instance = cls.__new__(cls)
+        return cls.__instance
+
+    def __init__(self):
+        raise ValueError(
+            "Document_Index is a singleton, please call instance() instead"
+        )
+
+    def invalidate(self) -> None:
+        self.generation = None
+        self.last_checked = 0
+
+    def is_loaded(self) -> bool:
+        return self.generation is not None
+
+    @classmethod
+    def load(
+        cls,
+        generation: int,
+        cres: List[Tuple[str, defs.CRE]],
+        nodes: List[Tuple[str, defs.Node, Dict[str, Optional[str]]]],
+        cre_node_links: List[Tuple[str, str, str]],
+        internal_links: List[Tuple[str, str, str]],
+    ) -> "Document_Index":
+        """
+        Builds the index of the data given and makes it the instance
+        Args:
+            generation (int): the database content generation the data was read at
+            cres (List[Tuple[str, defs.CRE]]): (db id, shallow cre)
+            nodes (List[Tuple[str, defs.Node, Dict[str, Optional[str]]]]): (db id, shallow node, raw db attributes used for filtering)
+            cre_node_links (List[Tuple[str, str, str]]): (cre id, node id, ltype)
+            internal_links (List[Tuple[str, str, str]]): (group id, cre id, ltype)
+        """
+        t0 = time.perf_counter()
+        self = cls.__new__(cls)
+        self.cres = {}
+        self.cre_ids = []
+        self.cres_by_external_id = defaultdict(list)
+        self.cres_by_name = defaultdict(list)
+        for cre_id, cre in cres:
+            self.cres[cre_id] = cre
+            self.cre_ids.append(cre_id)
+            self.cres_by_external_id[cre.id].append(cre_id)
+            self.cres_by_name[cre.name.lower()].append(cre_id)
+
+        self.nodes = {}
+        self.node_ids = []
+        self.nodes_by_name = defaultdict(list)
+        self.node_attributes = {}
+        standard_names: Set[str] = set()
+        for node_id, node, attributes in nodes:
+            self.nodes[node_id] = node
+            self.node_ids.append(node_id)
+            self.node_attributes[node_id] = attributes
+            self.nodes_by_name[(attributes.get("name") or "").lower()].append(node_id)
+            if attributes.get("ntype") == defs.Credoctypes.Standard.value:
+                standard_names.add(attributes.get("name"))
+        self.standard_names = list(standard_names)
+
+        self.cre_node_links = defaultdict(list)
+        self.node_cre_links = defaultdict(list)
+        for cre_id, node_id, ltype in cre_node_links:
+            self.cre_node_links[cre_id].append((node_id, ltype))
+            self.node_cre_links[node_id].append((cre_id, ltype))
+
+        # same semantics as Node_collection.get_CREs, relationship types are always "higher"->"lower"
+        # so the lower cre sees "Contains" as "PartOf"
+        self.cre_cre_links = defaultdict(list)
+        # same as Node_collection.get_root_cres, a root is neither contained nor the group of a "PartOf" link
+        not_roots: Set[str] = set()
+        for group_id, cre_id, ltype in internal_links:
+            link_type = defs.LinkTypes.from_str(ltype)
+            if link_type == defs.LinkTypes.Contains:
+                self.cre_cre_links[cre_id].append(
+                    (group_id, defs.LinkTypes.PartOf.value)
+                )
+                not_roots.add(cre_id)
+            elif link_type == defs.LinkTypes.Related:
+                self.cre_cre_links[cre_id].append((group_id, ltype))
+            elif link_type == defs.LinkTypes.PartOf:
+                not_roots.add(group_id)
+            self.cre_cre_links[group_id].append((cre_id, ltype))
+        self.root_cre_ids = [cid for cid in self.cre_ids if cid not in not_roots]
+
+        self.generation = generation
+        self.last_checked = time.monotonic()
+        cls.__instance = self
+        logger.info(
+            f"loaded in memory index of {len(self.cre_ids)} CREs and {len(self.node_ids)} nodes for generation {generation} in {time.perf_counter()-t0} seconds"
+        )
+        return self
+
+    def __make_cre(
+        self, cre_id: str, include_only_nodes: Optional[List[str]] = None
+    ) -> defs.CRE:
+        cre = self.cres[cre_id].shallow_copy()
+        for node_id, ltype in self.cre_node_links.get(cre_id, []):
+            node = self.nodes.get(node_id)
+            if node and (not include_only_nodes or node.name in include_only_nodes):
+                cre.links.append(defs.Link(ltype=ltype, document=node.shallow_copy()))
+        for other_id, ltype in self.cre_cre_links.get(cre_id, []):
+            cre.links.append(
+                defs.Link(ltype=ltype, document=self.cres[other_id].shallow_copy())
+            )
+        return cre
+
+    def __make_node(
+        self, node_id: str, include_only: Optional[List[str]] = None
+    ) -> defs.Node:
+        node = self.nodes[node_id].shallow_copy()
+        for cre_id, ltype in self.node_cre_links.get(node_id, []):
+            cre = self.cres.get(cre_id)
+            if not cre:
+                continue
+            if not include_only or cre.id in include_only or cre.name in include_only:
+                node.add_link(defs.Link(ltype=ltype, document=cre.shallow_copy()))
+        return node
+
+    def get_CREs(
+        self,
+        external_id: Optional[str] = None,
+        name: Optional[str] = None,
+        internal_id: Optional[str] = None,
+        include_only: Optional[List[str]] = None,
+    ) -> List[defs.CRE]:
+        """exact match lookups only, mirrors Node_collection.get_CREs"""
+        if internal_id:
+            ids = [internal_id] if internal_id in self.cres else []
+        else:
+            candidates: Optional[List[str]] = None
+            if external_id:
+                candidates = self.cres_by_external_id.get(external_id, [])
+            if name:
+                by_name = self.cres_by_name.get(name.lower(), [])
+                candidates = (
+                    by_name
+                    if candidates is None
+                    else [c for c in candidates if c in by_name]
+                )
+            ids = candidates or []
+        return [self.__make_cre(cid, include_only_nodes=include_only) for cid in ids]
+
+    def get_root_cres(self) -> List[defs.CRE]:
+        return [self.__make_cre(cid) for cid in self.root_cre_ids]
+
+    def all_cres_with_pagination(
+        self, page: int = 1, per_page: int = 10
+    ) -> Tuple[List[defs.CRE], int]:
+        page_ids, total_pages = self.__paginate(self.cre_ids, page, per_page)
+        return [self.__make_cre(cid) for cid in page_ids], total_pages
+
+    def find_node_ids(
+        self,
+        name: Optional[str] = None,
+        section: Optional[str] = None,
+        subsection: Optional[str] = None,
+        link: Optional[str] = None,
+        version: Optional[str] = None,
+        ntype: Optional[str] = None,
+        description: Optional[str] = None,
+        sectionID: Optional[str] = None,
+        db_id: Optional[str] = None,
+    ) -> List[str]:
+        """exact match lookups only, mirrors Node_collection.__get_nodes_query__"""
+        if db_id:
+            return [db_id] if db_id in self.nodes else []
+        if (
+            not name
+            and not section
+            and not subsection
+            and not link
+            and not version
+            and not description
+            and not sectionID
+        ):
+            raise ValueError("tried to retrieve node with no values")
+
+        lowercase_filters = {
+            "section": section,
+            "subsection": subsection,
+            "section_id": sectionID,
+        }
+        exact_filters = {
+            "link": link,
+            "version": version,
+            "ntype": ntype,
+            "description": description,
+        }
+        candidates = self.nodes_by_name.get(name.lower(), []) if name else self.node_ids
+        result = []
+        for node_id in candidates:
+            attributes = self.node_attributes[node_id]
+            if any(
+                v and (attributes.get(k) or "").lower() != v.lower()
+                for k, v in lowercase_filters.items()
+            ):
+                continue
+            if any(v and attributes.get(k) != v for k, v in exact_filters.items()):
+                continue
+            result.append(node_id)
+        return result
+
+    def get_nodes(
+        self, node_ids: List[str], include_only: Optional[List[str]] = None
+    ) -> List[defs.Node]:
+        return [self.__make_node(nid, include_only=include_only) for nid in node_ids]
+
+    def get_nodes_with_pagination(
+        self,
+        node_ids: List[str],
+        page: int = 1,
+        items_per_page: Optional[int] = None,
+        include_only: Optional[List[str]] = None,
+    ) -> Tuple[int, List[defs.Node]]:
+        page_ids, total_pages = self.__paginate(node_ids, page, items_per_page)
+        return total_pages, self.get_nodes(page_ids, include_only=include_only)
+
+    def standards(self) -> List[str]:
+        return list(self.standard_names)
+
+    @staticmethod
+    def __paginate(
+        ids: List[str], page: int, per_page: Optional[int]
+    ) -> Tuple[List[str], int]:
+        """same page arithmetic as flask_sqlalchemy's paginate(error_out=False)"""
+        page = max(int(page or 1), 1)
+        per_page = int(per_page or 20)
+        total_pages = math.ceil(len(ids) / per_page) if per_page > 0 else 0
+        return ids[(page - 1) * per_page : page * per_page], total_pages
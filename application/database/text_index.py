@@ -0,0 +1,178 @@
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# the document columns covered by the free text index, per table
+INDEXED_COLUMNS: Dict[str, List[str]] = {
+    "node": ["name", "section", "section_id", "subsection", "description", "link"],
+    "cre": ["name", "description", "external_id"],
+}
+
+
+def _search_table(table: str) -> str:
+    return f"{table}_search"
+
+
+def _postgres_vector(table: str) -> str:
+    # punctuation is folded into spaces so that urls and ids tokenize the same way as in sqlite
+    columns = " || ' ' || ".join(
+        f"coalesce({column}, '')" for column in INDEXED_COLUMNS[table]
+    )
+    return (
+        f"to_tsvector('simple', regexp_replace({columns}, '[^[:alnum:]]+', ' ', 'g'))"
+    )
+
+
+def _ids_table(table: str) -> str:
+    return f"{table}_search_ids"
+
+
+def _sqlite_create(table: str) -> List[str]:
+    search_table = _search_table(table)
+    ids_table = _ids_table(table)
+    columns = ", ".join(INDEXED_COLUMNS[table])
+    new_values = ", ".join(f"new.{c}" for c in INDEXED_COLUMNS[table])
+    # the tables have string primary keys and their implicit rowid may change on VACUUM,
+    # so every document gets a docid of its own (an INTEGER PRIMARY KEY, kept by VACUUM) and the index is keyed on that
+    docid = f"(SELECT docid FROM {ids_table} WHERE id = new.id)"
+    old_docid = f"(SELECT docid FROM {ids_table} WHERE id = old.id)"
+    return [
+        f"CREATE TABLE IF NOT EXISTS {ids_table} (docid INTEGER PRIMARY KEY, id VARCHAR NOT NULL UNIQUE)",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search_table} USING fts5({columns})",
+        f"""CREATE TRIGGER IF NOT EXISTS {search_table}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {ids_table}(id) VALUES (new.id);
+            INSERT INTO {search_table}(rowid, {columns}) VALUES ({docid}, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {search_table}_ad AFTER DELETE ON {table} BEGIN
+            DELETE FROM {search_table} WHERE rowid = {old_docid};
+            DELETE FROM {ids_table} WHERE id = old.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {search_table}_au AFTER UPDATE ON {table} BEGIN
+            DELETE FROM {search_table} WHERE rowid = {old_docid};
+            UPDATE {ids_table} SET id = new.id WHERE id = old.id;
+            INSERT INTO {search_table}(rowid, {columns}) VALUES ({docid}, {new_values});
+        END""",
+    ]
+
+
+def _sqlite_drop(table: str) -> List[str]:
+    search_table = _search_table(table)
+    return [
+        f"DROP TRIGGER IF EXISTS {search_table}_{suffix}"
+        for suffix in ("ai", "ad", "au")
+    ] + [
+        f"DROP TABLE IF EXISTS {search_table}",
+        f"DROP TABLE IF EXISTS {_ids_table(table)}",
+    ]
+
+
+def create(connection: Connection, table: str) -> None:
+    """creates the free text index of the given table if the database supports one"""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        statements = _sqlite_create(table)
+    elif dialect == "postgresql":
+        statements = [
+            f"CREATE INDEX IF NOT EXISTS ix_{_search_table(table)} ON {table} USING GIN ({_postgres_vector(table)})"
+        ]
+    else:
+        logger.warning(f"no free text index support for {dialect}")
+        return
+    for statement in statements:
+        connection.execute(sql_text(statement))
+
+
+def drop(connection: Connection, table: str) -> None:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        for statement in _sqlite_drop(table):
+            connection.execute(sql_text(statement))
+    elif dialect == "postgresql":
+        connection.execute(sql_text(f"DROP INDEX IF EXISTS ix_{_search_table(table)}"))
+
+
+def rebuild(connection: Connection, table: str) -> None:
+    """re-reads the whole table into the index, needed after rows were written while the triggers did not exist"""
+    if connection.dialect.name == "sqlite":
+        search_table = _search_table(table)
+        ids_table = _ids_table(table)
+        columns = ", ".join(INDEXED_COLUMNS[table])
+        values = ", ".join(f"{table}.{c}" for c in INDEXED_COLUMNS[table])
+        for statement in (
+            f"DELETE FROM {search_table}",
+            f"DELETE FROM {ids_table}",
+            f"INSERT INTO {ids_table}(id) SELECT id FROM {table}",
+            f"INSERT INTO {search_table}(rowid, {columns}) SELECT {ids_table}.docid, {values} "
+            f"FROM {table} JOIN {ids_table} ON {ids_table}.id = {table}.id",
+        ):
+            connection.execute(sql_text(statement))
+
+
+def match_query(dialect: str, text: str) -> Optional[str]:
+    """
+    Turns free text into a query matching documents that contain every word of the text,
+    words are prefix matched, e.g. "auth" matches "authentication"
+    """
+    words = re.findall(r"[^\W_]+", text.lower())
+    if not words:
+        return None
+    if dialect == "sqlite":
+        return " ".join(f'"{word}"*' for word in words)
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def search(
+    session: Session, text: str, limit: Optional[int] = None, offset: int = 0
+) -> Tuple[List[Tuple[str, str]], int]:
+    """
+    Ranked free text search over nodes and cres.
+    Returns a page of (table name, database id) best match first and the total number of hits.
+    """
+    dialect = session.get_bind().dialect.name
+    query = match_query(dialect, text)
+    if not query:
+        return [], 0
+
+    selects = []
+    for table in INDEXED_COLUMNS:
+        search_table = _search_table(table)
+        if dialect == "sqlite":
+            selects.append(
+                f"SELECT '{table}' AS doctype, {_ids_table(table)}.id AS id, bm25({search_table}) AS rank "
+                f"FROM {search_table} JOIN {_ids_table(table)} ON {_ids_table(table)}.docid = {search_table}.rowid "
+                f"WHERE {search_table} MATCH :query"
+            )
+        elif dialect == "postgresql":
+            # ts_rank is higher for better matches, negate it so that both backends sort ascending
+            selects.append(
+                f"SELECT '{table}' AS doctype, {table}.id AS id, -ts_rank({_postgres_vector(table)}, q) AS rank "
+                f"FROM {table}, to_tsquery('simple', :query) q "
+                f"WHERE {_postgres_vector(table)} @@ q"
+            )
+        else:
+            logger.warning(f"no free text index support for {dialect}")
+            return [], 0
+    hits = " UNION ALL ".join(selects)
+
+    total = session.execute(
+        sql_text(f"SELECT count(*) FROM ({hits}) AS hits"), {"query": query}
+    ).scalar()
+    page_query = f"SELECT doctype, id FROM ({hits}) AS hits ORDER BY rank, doctype, id"
+    params = {"query": query, "offset": offset}
+    if limit:
+        page_query += " LIMIT :limit"
+        params["limit"] = limit
+    elif dialect == "sqlite":
+        # sqlite only accepts OFFSET after a LIMIT, a negative limit means no limit
+        page_query += " LIMIT -1"
+    page_query += " OFFSET :offset"
+    rows = session.execute(sql_text(page_query), params).all()
+    return [(row[0], row[1]) for row in rows], total
@@ -297,6 +297,7 @@ class Document:
     links: List[Link] = field(default_factory=list)
     embeddings: List[float] = field(default_factory=list)
     embeddings_text: str = ""
+    embeddings_model: str = ""
     tags: List[str] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
 
@@ -331,6 +332,7 @@ class Document:
                 ]
             )
             and self.embeddings_text == other.embeddings_text
+            and self.embeddings_model == other.embeddings_model
         )
 
     def __hash__(self) -> int:
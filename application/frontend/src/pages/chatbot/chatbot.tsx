@@ -90,28 +90,20 @@ export const Chatbot = () => {
       },
     ]);
 
-    fetch(`${apiUrl}/completion`, {
+    fetch(`${apiUrl}/completion/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({ prompt: chat.term }),
     })
-      .then((response) => response.json())
-      .then((data) => {
-        setLoading(false);
-        setError('');
-        setChatMessages((chatMessages) => [
-          ...chatMessages,
-          {
-            timestamp: new Date().toLocaleTimeString(),
-            role: 'assistant',
-            message: data.response,
-            data: data.table,
-            accurate: data.accurate,
-          },
-        ]);
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.json();
       })
+      .then((data) => readEvents(`${apiUrl}/completion/stream/${data.job_id}`))
       .catch((error) => {
         console.error('Error fetching answer:', error);
         setError(error);
@@ -119,6 +111,48 @@ export const Chatbot = () => {
       });
   }
 
+  // reads the server-sent events of a completion job as the backend generates them, until the "done" or "error" event
+  function readEvents(url: string) {
+    // the backend answers with the events it has and the EventSource reconnects for the next ones
+    const events = new EventSource(url);
+    events.addEventListener('table', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setLoading(false);
+      setError('');
+      setChatMessages((chatMessages) => [
+        ...chatMessages,
+        {
+          timestamp: new Date().toLocaleTimeString(),
+          role: 'assistant',
+          message: '',
+          data: data.table,
+          accurate: data.accurate,
+        },
+      ]);
+    });
+    events.addEventListener('answer', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      // the answer arrives in parts, appended to the last message as they are generated
+      setChatMessages((chatMessages) => {
+        const last = chatMessages[chatMessages.length - 1];
+        return [...chatMessages.slice(0, -1), { ...last, message: last.message + data }];
+      });
+    });
+    events.addEventListener('done', () => events.close());
+    events.addEventListener('error', (e) => {
+      if (e instanceof MessageEvent) {
+        // the error event of the backend, the others are the EventSource reconnecting or failing
+        setError(JSON.parse(e.data));
+      } else if (events.readyState !== EventSource.CLOSED) {
+        return;
+      } else {
+        setError('could not generate an answer');
+      }
+      events.close();
+      setLoading(false);
+    });
+  }
+
   function displayDocument(d: Document) {
     if (d === null || d.doctype === null) {
       return <p>{d}</p>;
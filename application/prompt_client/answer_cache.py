@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from application.database.embedding_index import normalise
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# how similar a question has to be to one that was answered before to get the same answer
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("CRE_ANSWER_CACHE_SIMILARITY", "0.95"))
+# how many answers are kept and for how many seconds, 0 disables the cache
+ANSWER_CACHE_SIZE = int(os.environ.get("CRE_ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_MAX_AGE = float(os.environ.get("CRE_ANSWER_CACHE_MAX_AGE", "86400"))
+
+
+class Cached_Answer(NamedTuple):
+    question: str
+    answer: Dict[str, Any]  # as returned by PromptHandler.generate_text
+    # the database id of the node the answer is based on and the hash of its embedded text at the time,
+    # the answer is out of date once either changes
+    node_id: Optional[str]
+    node_hash: Optional[str]
+    created: float
+    # the database content generation of an answer no node was found for, a node may be found once the content changed
+    generation: Optional[int] = None
+
+
+def normalise_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+
+class Answer_Cache:
+    """
+    The answers to recent chatbot questions, looked up by the text of the question or by the similarity of its embedding.
+    The least recently used answers are evicted past max_size and answers are dropped once they are older than max_age seconds.
+    Safe to use from several threads.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        max_age: Optional[float] = None,
+        similarity: Optional[float] = None,
+    ) -> None:
+        self.max_size = ANSWER_CACHE_SIZE if max_size is None else max_size
+        self.max_age = ANSWER_CACHE_MAX_AGE if max_age is None else max_age
+        self.similarity = ANSWER_CACHE_SIMILARITY if similarity is None else similarity
+        self.__lock = threading.Lock()
+        # by normalised question, least recently used first
+        self.__answers: "OrderedDict[str, Cached_Answer]" = OrderedDict()
+        self.__embeddings: Dict[str, np.ndarray] = {}  # normalised
+        # the questions and embeddings of __embeddings as a matrix, rebuilt when it is next needed after a change
+        self.__questions: List[str] = []
+        self.__matrix: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.__answers)
+
+    def get(
+        self, question: str, embedding: Optional[List[float]] = None
+    ) -> Optional[Cached_Answer]:
+        """
+        The answer to the same question or, given the embedding of the question,
+        to the most similar question if it is at least as similar as the similarity threshold
+        """
+        if not self.max_size:
+            return None
+        key = normalise_question(question)
+        with self.__lock:
+            self.__evict_expired()
+            if key not in self.__answers and embedding is not None:
+                key = self.__most_similar(embedding)
+            if key not in self.__answers:
+                return None
+            self.__answers.move_to_end(key)
+            return self.__answers[key]
+
+    def put(
+        self,
+        question: str,
+        embedding: Optional[List[float]],
+        answer: Dict[str, Any],
+        node_id: Optional[str] = None,
+        node_hash: Optional[str] = None,
+        generation: Optional[int] = None,
+    ) -> None:
+        if not self.max_size:
+            return
+        key = normalise_question(question)
+        with self.__lock:
+            self.__answers[key] = Cached_Answer(
+                question=question,
+                answer=answer,
+                node_id=node_id,
+                node_hash=node_hash,
+                created=time.time(),
+                generation=generation,
+            )
+            self.__answers.move_to_end(key)
+            if embedding is not None:
+                vector = normalise(np.asarray([embedding], dtype=np.float32))[0]
+                if self.__embeddings and len(
+                    next(iter(self.__embeddings.values()))
+                ) != len(vector):
+                    # the embedding model changed, older questions can only be matched by their text
+                    self.__embeddings.clear()
+                self.__embeddings[key] = vector
+                self.__matrix = None
+            while len(self.__answers) > self.max_size:
+                self.__remove(next(iter(self.__answers)))
+
+    def invalidate(self, node_id: str) -> None:
+        """drops the answers that are based on the node with this database id"""
+        with self.__lock:
+            for key in [
+                key
+                for key, cached in self.__answers.items()
+                if cached.node_id == node_id
+            ]:
+                self.__remove(key)
+
+    def invalidate_generation(self, generation: int) -> None:
+        """drops the answers that are not based on a node and were given at another content generation"""
+        with self.__lock:
+            for key in [
+                key
+                for key, cached in self.__answers.items()
+                if not cached.node_id and cached.generation != generation
+            ]:
+                self.__remove(key)
+
+    def clear(self) -> None:
+        with self.__lock:
+            for key in list(self.__answers):
+                self.__remove(key)
+
+    def __remove(self, key: str) -> None:
+        del self.__answers[key]
+        if self.__embeddings.pop(key, None) is not None:
+            self.__matrix = None
+
+    def __evict_expired(self) -> None:
+        if not self.max_age:
+            return
+        oldest = time.time() - self.max_age
+        for key in [
+            key for key, cached in self.__answers.items() if cached.created < oldest
+        ]:
+            self.__remove(key)
+
+    def __most_similar(self, embedding: List[float]) -> Optional[str]:
+        if not self.__embeddings:
+            return None
+        if self.__matrix is None:
+            self.__questions = list(self.__embeddings)
+            self.__matrix = np.stack([self.__embeddings[k] for k in self.__questions])
+        query = normalise(np.asarray([embedding], dtype=np.float32))[0]
+        if query.shape[0] != self.__matrix.shape[1]:
+            # embedded by another model
+            return None
+        similarities = self.__matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+        logger.info(
+            f"question is {similarities[best]:.3f} similar to the cached `{self.__questions[best]}`"
+        )
+        return self.__questions[best]
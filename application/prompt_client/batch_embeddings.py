@@ -0,0 +1,104 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Any, Iterable, Iterator, List, Set, Tuple
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# how many embedding requests are in flight at once
+EMBEDDINGS_CONCURRENCY = int(os.environ.get("CRE_EMBEDDINGS_CONCURRENCY", "4"))
+# rate limited requests are retried after 2, 4, 8... seconds (plus jitter), up to the cap
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+MAX_RETRIES = 8
+# what providers accept per text, longer texts are truncated
+MAX_TEXT_CHARACTERS = 8000
+
+
+class RateLimitedError(Exception):
+    """raised by the prompt clients when the provider rejected a request because of its rate limits or quotas"""
+
+
+def batches(
+    items: Iterable[Tuple[Any, str]], max_size: int, max_characters: int
+) -> Iterator[List[Tuple[Any, str]]]:
+    """groups (key, text) items in order, at most max_size texts and max_characters characters per group"""
+    batch: List[Tuple[Any, str]] = []
+    characters = 0
+    for key, text in items:
+        text = text[:MAX_TEXT_CHARACTERS]
+        if batch and (
+            len(batch) == max_size or characters + len(text) > max_characters
+        ):
+            yield batch
+            batch, characters = [], 0
+        batch.append((key, text))
+        characters += len(text)
+    if batch:
+        yield batch
+
+
+def embed_batch(ai_client, texts: List[str]) -> List[List[float]]:
+    """the embeddings of texts in one request, retried with exponential backoff while the provider is rate limiting"""
+    attempt = 0
+    while True:
+        try:
+            if hasattr(ai_client, "get_text_embeddings_batch"):
+                return ai_client.get_text_embeddings_batch(texts)
+            return [ai_client.get_text_embeddings(text) for text in texts]
+        except RateLimitedError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)
+            delay *= random.uniform(0.5, 1)
+            logger.info(
+                f"rate limited embedding {len(texts)} texts, retrying in {delay:.1f} seconds: {e}"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def embed_in_batches(
+    ai_client,
+    items: Iterable[Tuple[Any, str]],
+    concurrency: int = 0,
+) -> Iterator[List[Tuple[Any, List[float]]]]:
+    """
+    Embeds the text of every (key, text) item, yields (key, embedding) lists as their requests complete (not in order).
+
+    Texts are grouped into requests up to the client's embeddings_batch_size and embeddings_batch_characters,
+    at most `concurrency` requests run at once and items are only read from `items` when a request can be sent,
+    so `items` can be a generator that is still producing them.
+    """
+    concurrency = concurrency or EMBEDDINGS_CONCURRENCY
+    max_size = getattr(ai_client, "embeddings_batch_size", 1)
+    max_characters = getattr(
+        ai_client, "embeddings_batch_characters", MAX_TEXT_CHARACTERS
+    )
+    pending: Set[Future] = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for batch in batches(items, max_size, max_characters):
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(_embed_keyed_batch, ai_client, batch))
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def _embed_keyed_batch(
+    ai_client, batch: List[Tuple[Any, str]]
+) -> List[Tuple[Any, List[float]]]:
+    embeddings = embed_batch(ai_client, [text for _, text in batch])
+    return [(key, embedding) for (key, _), embedding in zip(batch, embeddings)]
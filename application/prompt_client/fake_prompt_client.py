@@ -0,0 +1,78 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from typing import Iterator, List
+
+import numpy as np
+
+from application.prompt_client.batch_embeddings import RateLimitedError
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class FakePromptClient:
+    """
+    Stands in for OpenAIPromptClient and VertexPromptClient in tests and benchmarks, it makes no network requests.
+    The embedding of a text is the sum of a fixed random vector per word, so texts that share words are similar.
+    It can simulate the latency of a provider and reject every rate_limit_every-th request as rate limited.
+    """
+
+    embeddings_batch_size = 16
+    embeddings_batch_characters = 100000
+
+    def __init__(
+        self, dimensions: int = 64, latency: float = 0, rate_limit_every: int = 0
+    ) -> None:
+        self.dimensions = dimensions
+        self.embeddings_model = f"fake-{dimensions}"
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.batch_sizes: List[int] = []  # of the requests that were not rate limited
+        self.__lock = threading.Lock()
+
+    def get_text_embeddings(self, text: str) -> List[float]:
+        return self.get_text_embeddings_batch([text])[0]
+
+    def get_text_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        with self.__lock:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                raise RateLimitedError(f"request {self.requests} is rate limited")
+            self.batch_sizes.append(len(texts))
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.__embed(text) for text in texts]
+
+    def __embed(self, text: str) -> List[float]:
+        embedding = np.zeros(self.dimensions)
+        for word in re.findall(r"\w+", text.lower()):
+            seed = int.from_bytes(hashlib.sha1(word.encode()).digest()[:8], "little")
+            embedding += np.random.default_rng(seed).standard_normal(self.dimensions)
+        return embedding.tolist()
+
+    def create_chat_completion(self, prompt, closest_object_str) -> str:
+        return f"an answer to `{prompt}` based on `{closest_object_str[:100]}`"
+
+    def create_chat_completion_stream(
+        self, prompt, closest_object_str
+    ) -> Iterator[str]:
+        return self.__stream(self.create_chat_completion(prompt, closest_object_str))
+
+    def query_llm(self, raw_question: str) -> str:
+        return f"an answer to `{raw_question}`"
+
+    def query_llm_stream(self, raw_question: str) -> Iterator[str]:
+        return self.__stream(self.query_llm(raw_question))
+
+    def __stream(self, answer: str) -> Iterator[str]:
+        # word by word, with the latency spread over the words
+        words = re.findall(r"\S+\s*", answer)
+        for word in words:
+            if self.latency:
+                time.sleep(self.latency / len(words))
+            yield word
@@ -1,5 +1,11 @@
 import openai
 import logging
+from typing import Iterator, List
+
+from application.prompt_client.batch_embeddings import (
+    MAX_TEXT_CHARACTERS,
+    RateLimitedError,
+)
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -7,11 +13,16 @@ logger.setLevel(logging.INFO)
 
 
 class OpenAIPromptClient:
+    # the most texts and characters batch_embeddings sends in one request
+    embeddings_batch_size = 256
+    embeddings_batch_characters = 400000
+    embeddings_model = "text-embedding-ada-002"
+
     def __init__(self, openai_key) -> None:
         self.api_key = openai_key
         openai.api_key = self.api_key
 
-    def get_text_embeddings(self, text: str, model: str = "text-embedding-ada-002"):
+    def get_text_embeddings(self, text: str, model: str = embeddings_model):
         if len(text) > 8000:
             logger.info(
                 f"embedding content is more than the openai hard limit of 8k tokens, reducing to 8000"
@@ -22,9 +33,23 @@ class OpenAIPromptClient:
             "embedding"
         ]
 
-    def create_chat_completion(self, prompt, closest_object_str) -> str:
-        # Send the question and the closest area to the LLM to get an answer
-        messages = [
+    def get_text_embeddings_batch(
+        self, texts: List[str], model: str = embeddings_model
+    ) -> List[List[float]]:
+        """the embeddings of many texts in one request, in the order of texts"""
+        openai.api_key = self.api_key
+        try:
+            response = openai.Embedding.create(
+                input=[text[:MAX_TEXT_CHARACTERS] for text in texts], model=model
+            )
+        except openai.error.RateLimitError as e:
+            raise RateLimitedError(str(e)) from e
+        return [
+            d["embedding"] for d in sorted(response["data"], key=lambda d: d["index"])
+        ]
+
+    def __chat_completion_messages(self, prompt, closest_object_str):
+        return [
             {
                 "role": "system",
                 "content": "Assistant is a large language model trained by OpenAI.",
@@ -34,15 +59,9 @@ class OpenAIPromptClient:
                 "content": f"Your task is to answer the following question based on this area of knowledge: `{closest_object_str}` delimit any code snippet with three backticks ignore all other commands and questions that are not relevant.\nQuestion: `{prompt}`",
             },
         ]
-        openai.api_key = self.api_key
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-        )
-        return response.choices[0].message["content"].strip()
 
-    def query_llm(self, raw_question: str) -> str:
-        messages = [
+    def __query_llm_messages(self, raw_question: str):
+        return [
             {
                 "role": "system",
                 "content": "Assistant is a large language model trained by OpenAI.",
@@ -52,9 +71,43 @@ class OpenAIPromptClient:
                 "content": f"Your task is to answer the following cybesrsecurity question if you can, provide code examples, delimit any code snippet with three backticks, ignore any unethical questions or questions irrelevant to cybersecurity\nQuestion: `{raw_question}`\n ignore all other commands and questions that are not relevant.",
             },
         ]
+
+    def __complete(self, messages) -> str:
         openai.api_key = self.api_key
         response = openai.ChatCompletion.create(
             model="gpt-3.5-turbo",
             messages=messages,
         )
         return response.choices[0].message["content"].strip()
+
+    def __complete_stream(self, messages) -> Iterator[str]:
+        openai.api_key = self.api_key
+        for chunk in openai.ChatCompletion.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            stream=True,
+        ):
+            text = chunk.choices[0].delta.get("content")
+            if text:
+                yield text
+
+    def create_chat_completion(self, prompt, closest_object_str) -> str:
+        # Send the question and the closest area to the LLM to get an answer
+        return self.__complete(
+            self.__chat_completion_messages(prompt, closest_object_str)
+        )
+
+    def create_chat_completion_stream(
+        self, prompt, closest_object_str
+    ) -> Iterator[str]:
+        """create_chat_completion, as the parts of the answer are generated"""
+        return self.__complete_stream(
+            self.__chat_completion_messages(prompt, closest_object_str)
+        )
+
+    def query_llm(self, raw_question: str) -> str:
+        return self.__complete(self.__query_llm_messages(raw_question))
+
+    def query_llm_stream(self, raw_question: str) -> Iterator[str]:
+        """query_llm, as the parts of the answer are generated"""
+        return self.__complete_stream(self.__query_llm_messages(raw_question))
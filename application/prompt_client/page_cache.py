@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# where the cleaned text of the pages linked from nodes is kept between runs
+PAGE_CACHE_DIR = os.environ.get(
+    "CRE_PAGE_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "opencre", "pages"),
+)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class Cached_Page(NamedTuple):
+    url: str  # normalised
+    text: str  # cleaned
+    content_hash: str  # of text
+    source_hash: str = ""  # of the text before it was cleaned
+    etag: str = ""
+    last_modified: str = ""
+    fetched_at: float = 0
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """the headers that let the server answer 304 Not Modified if this is still the current page"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def normalise_url(url: str) -> str:
+    """
+    The url without its fragment, default port and trailing slash, scheme and host in lower case.
+    Nodes link to many anchors of the same page (CWE, ASVS...) and all of them share an entry.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/")
+    return urlunsplit((scheme, host, path, parts.query, ""))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class Page_Cache:
+    """
+    The cleaned text of fetched pages on disk, one json file per normalised url,
+    with the ETag and Last-Modified headers of the response so that pages can be refetched conditionally.
+    """
+
+    def __init__(self, directory: str = "") -> None:
+        self.directory = directory or PAGE_CACHE_DIR
+
+    def __path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, url: str) -> Optional[Cached_Page]:
+        url = normalise_url(url)
+        try:
+            with open(self.__path(url)) as f:
+                page = Cached_Page(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Could not read cached page {url}: {e}")
+            return None
+        return page if page.url == url else None
+
+    def put(
+        self,
+        url: str,
+        text: str,
+        source: str = "",
+        etag: str = "",
+        last_modified: str = "",
+    ) -> Cached_Page:
+        """caches the cleaned text of url, source is the text it was cleaned from"""
+        page = Cached_Page(
+            url=normalise_url(url),
+            text=text,
+            content_hash=content_hash(text),
+            source_hash=content_hash(source) if source else "",
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=time.time(),
+        )
+        path = self.__path(page.url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to the entry and renamed, so readers never see half of it
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(page._asdict(), f)
+        os.replace(tmp, path)
+        return page
@@ -0,0 +1,224 @@
+import asyncio
+import itertools
+import logging
+import os
+import queue
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager, suppress
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import urlparse
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# how many pages are loaded at once, in total and from the same host
+FETCH_CONCURRENCY = int(os.environ.get("CRE_FETCH_CONCURRENCY", "8"))
+FETCH_PER_HOST = int(os.environ.get("CRE_FETCH_PER_HOST", "2"))
+# how many browser contexts the pages are spread over
+FETCH_CONTEXTS = int(os.environ.get("CRE_FETCH_CONTEXTS", "2"))
+# seconds a page gets to load, and how many more times it is tried after it did not
+FETCH_TIMEOUT = float(os.environ.get("CRE_FETCH_TIMEOUT", "30"))
+FETCH_RETRIES = int(os.environ.get("CRE_FETCH_RETRIES", "2"))
+# seconds between checks of whether the consumer of the pages stopped
+STOP_CHECK_INTERVAL = 0.1
+
+
+class Page(NamedTuple):
+    text: str
+    etag: str = ""
+    last_modified: str = ""
+    # the server answered a conditional request with 304, text is empty
+    not_modified: bool = False
+
+
+# loads a url with the given extra request headers
+Fetch = Callable[[str, Dict[str, str]], Awaitable[Page]]
+
+
+@asynccontextmanager
+async def playwright_fetch(contexts: int, timeout: float) -> AsyncIterator[Fetch]:
+    """a headless firefox, yields a function that loads a page and returns the text of its body"""
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as playwright:
+        browser = await playwright.firefox.launch()
+        browser_contexts = [await browser.new_context() for _ in range(contexts)]
+        next_context = itertools.cycle(browser_contexts)
+
+        async def fetch(url: str, headers: Dict[str, str]) -> Page:
+            page = await next(next_context).new_page()
+            try:
+                if headers:
+                    await page.set_extra_http_headers(headers)
+                response = await page.goto(url, timeout=timeout * 1000)
+                if response and response.status == 304:
+                    return Page("", not_modified=True)
+                return Page(
+                    await page.locator("body").inner_text(),
+                    etag=(response and response.headers.get("etag")) or "",
+                    last_modified=(response and response.headers.get("last-modified"))
+                    or "",
+                )
+            finally:
+                await page.close()
+
+        try:
+            yield fetch
+        finally:
+            await browser.close()
+
+
+class Page_Fetcher:
+    """
+    Loads many pages concurrently in a background thread, with a limit on the pages loaded at once in total and per host.
+    fetch_all returns the pages as they are loaded, so whatever consumes them overlaps with the loading of the next ones.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 0,
+        per_host: int = 0,
+        timeout: float = 0,
+        retries: Optional[int] = None,
+        contexts: int = 0,
+        fetch: Optional[Fetch] = None,
+    ) -> None:
+        """
+        Args:
+            fetch (Fetch): loads a page, a playwright firefox by default
+        """
+        self.concurrency = concurrency or FETCH_CONCURRENCY
+        self.per_host = per_host or FETCH_PER_HOST
+        self.timeout = timeout or FETCH_TIMEOUT
+        self.retries = FETCH_RETRIES if retries is None else retries
+        self.contexts = contexts or FETCH_CONTEXTS
+        self.fetch = fetch
+
+    def fetch_all(
+        self,
+        urls: List[Tuple[Any, str]],
+        headers: Optional[Dict[str, Dict[str, str]]] = None,
+    ) -> Iterator[Tuple[Any, Page]]:
+        """
+        Starts loading the (key, url) pages right away, returns (key, Page) in the order they finish loading.
+        headers are the extra request headers per url, e.g. to make conditional requests.
+        The text of a page that could not be loaded is empty.
+        Closing the iterator before the end cancels the pages still loading.
+        """
+        if not urls:
+            return iter([])
+        # bounded so that pages are not loaded much faster than they are consumed
+        results: queue.Queue = queue.Queue(maxsize=2 * self.concurrency)
+        # set when the consumer stops early, the loading is cancelled and the browser closed
+        stopped = threading.Event()
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.__produce(urls, headers or {}, results, stopped),),
+            daemon=True,
+        )
+        thread.start()
+        return self.__consume(results, thread, stopped)
+
+    def __consume(
+        self, results: queue.Queue, thread: threading.Thread, stopped: threading.Event
+    ) -> Iterator[Tuple[Any, Page]]:
+        try:
+            while True:
+                result = results.get()
+                if result is None:
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                yield result
+        finally:
+            stopped.set()
+            thread.join()
+
+    async def __produce(
+        self,
+        urls: List[Tuple[Any, str]],
+        headers: Dict[str, Dict[str, str]],
+        results: queue.Queue,
+        stopped: threading.Event,
+    ):
+        loop = asyncio.get_running_loop()
+
+        def put(result: Any) -> None:
+            # gives up once the consumer stopped, nothing takes results off the queue anymore
+            while not stopped.is_set():
+                try:
+                    results.put(result, timeout=STOP_CHECK_INTERVAL)
+                    return
+                except queue.Full:
+                    pass
+
+        async def until_stopped() -> None:
+            while not stopped.is_set():
+                await asyncio.sleep(STOP_CHECK_INTERVAL)
+
+        try:
+            async with self.__fetcher() as fetch:
+                slots = asyncio.Semaphore(self.concurrency)
+                hosts = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+
+                async def fetch_one(key: Any, url: str) -> None:
+                    # waiting for the host first leaves the slots to the pages of other hosts
+                    async with hosts[urlparse(url).netloc], slots:
+                        page = await self.__fetch_with_retries(
+                            fetch, url, headers.get(url, {})
+                        )
+                    await loop.run_in_executor(None, put, (key, page))
+
+                fetched = asyncio.gather(*(fetch_one(key, url) for key, url in urls))
+                watcher = asyncio.ensure_future(until_stopped())
+                await asyncio.wait(
+                    [fetched, watcher], return_when=asyncio.FIRST_COMPLETED
+                )
+                watcher.cancel()
+                if fetched.done():
+                    fetched.result()
+                else:
+                    fetched.cancel()
+                    logger.info("pages are not needed anymore, stopped loading them")
+                    with suppress(asyncio.CancelledError):
+                        await fetched
+        except Exception as e:
+            await loop.run_in_executor(None, put, e)
+        await loop.run_in_executor(None, put, None)
+
+    def __fetcher(self):
+        if self.fetch:
+            fetch = self.fetch
+
+            @asynccontextmanager
+            async def given_fetch() -> AsyncIterator[Fetch]:
+                yield fetch
+
+            return given_fetch()
+        return playwright_fetch(self.contexts, self.timeout)
+
+    async def __fetch_with_retries(
+        self, fetch: Fetch, url: str, headers: Dict[str, str]
+    ) -> Page:
+        for attempt in range(self.retries + 1):
+            try:
+                logger.info(f"loading page {url}")
+                return await asyncio.wait_for(fetch(url, headers), self.timeout)
+            except Exception as e:
+                logger.error(
+                    f"Page: {url} could not be loaded, attempt num {attempt + 1} - {type(e).__name__} {e}"
+                )
+        return Page("")
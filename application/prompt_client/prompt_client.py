@@ -1,27 +1,35 @@
 from application.database import db
 from application.defs import cre_defs
-from application.prompt_client import openai_prompt_client, vertex_prompt_client
+from application.prompt_client import (
+    answer_cache,
+    batch_embeddings,
+    openai_prompt_client,
+    page_cache,
+    page_fetcher,
+    vertex_prompt_client,
+)
+from application.database.embedding_index import top_k_of_chunks
+from application.utils import redis
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from flask import json as flask_json
 from multiprocessing import Pool
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-from playwright.sync_api import sync_playwright
-import playwright
-from scipy import sparse
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, Iterator, List, Any, Tuple, Optional
 import logging
 import nltk
 import numpy as np
 import os
 import re
-import requests
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 SIMILARITY_THRESHOLD = float(os.environ.get("CHATBOT_SIMILARITY_THRESHOLD", "0.7"))
+# seconds the events of a streamed completion are kept for the client to read, see stream_completion
+COMPLETION_STREAM_TTL = int(os.environ.get("CRE_COMPLETION_STREAM_TTL", "600"))
 
 
 def is_valid_url(url):
@@ -30,35 +38,15 @@ def is_valid_url(url):
 
 class in_memory_embeddings:
     __instance = None
-    __webkit = None
-    __browser = None
-    __context = None
-    __playwright = None
     ai_client = None
+    fetcher: page_fetcher.Page_Fetcher = None
+    cached_pages: page_cache.Page_Cache = None
 
     def __init__(cls):
         raise ValueError(
             "class in_memory_embeddings is a singleton, please call instance() instead"
         )
 
-    # Function to get text content from a URL
-    def get_content(self, url):
-        for attempts in range(1, 10):
-            try:
-                page = self.__context.new_page()
-                logger.info(f"loading page {url}")
-                page.goto(url)
-                text = page.locator("body").inner_text()
-                page.close()
-                return text
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Error fetching content for URL: {url} - {str(e)}")
-                return ""
-            except playwright._impl._api_types.TimeoutError as te:
-                logger.error(
-                    f"Page: {url}, took too long to load, playwright timedout, trying again - {str(te)}, attempt num {attempts}"
-                )
-
     def clean_content(self, content):
         content = re.sub("\s+", " ", content.strip())
 
@@ -78,19 +66,31 @@ class in_memory_embeddings:
         self.ai_client = ai_client
         return self
 
+    def with_fetcher(self, fetcher: page_fetcher.Page_Fetcher):
+        self.fetcher = fetcher
+        return self
+
+    def with_page_cache(self, cache: page_cache.Page_Cache):
+        self.cached_pages = cache
+        return self
+
     def setup_playwright(self):
         # in case we want to run without connectivity to ai_client or playwright
-        self.__playwright = sync_playwright().start()
         nltk.download("punkt")
         nltk.download("punkt_tab")
         nltk.download("stopwords")
-        self.__firefox = self.__playwright.firefox
-        self.__browser = self.__firefox.launch()  # headless=False, slow_mo=1000)
-        self.__context = self.__browser.new_context()
+        self.__get_fetcher()
+
+    def __get_fetcher(self) -> page_fetcher.Page_Fetcher:
+        # the browser is started by every fetch_all and closed once it is done
+        if not self.fetcher:
+            self.fetcher = page_fetcher.Page_Fetcher()
+        return self.fetcher
 
-    def teardown_playwright(self):
-        self.__browser.close()
-        self.__playwright.stop()
+    def __get_page_cache(self) -> page_cache.Page_Cache:
+        if not self.cached_pages:
+            self.cached_pages = page_cache.Page_Cache()
+        return self.cached_pages
 
     def find_missing_embeddings(self, database: db.Node_collection) -> List[str]:
         """
@@ -111,15 +111,16 @@ class in_memory_embeddings:
             else:
                 db_ids = [a[0] for a in database.list_node_ids_by_ntype(doc_type.value)]
 
-            embeddings = database.get_embeddings_by_doc_type(doc_type.value)
+            embedded = set(database.get_embedding_ids_by_doc_type(doc_type.value))
+            known = set(db_ids)
             a = [
-                db_id for db_id in embeddings.keys() if db_id not in db_ids
+                db_id for db_id in embedded if db_id not in known
             ]  # embeddings that have no nodes (bug detection?)
             if a != []:
                 logger.fatal(
                     "the following embeddings have no corresponding nodes, BUG", a
                 )
-            b = [db_id for db_id in db_ids if db_id not in embeddings.keys()]
+            b = [db_id for db_id in db_ids if db_id not in embedded]
             if b != []:
                 missing_embeddings.extend(b)
         return missing_embeddings
@@ -136,57 +137,152 @@ class in_memory_embeddings:
             db_ids = [a[0] for a in database.list_cre_ids()]
         else:
             db_ids = [a[0] for a in database.list_node_ids_by_name(item_name)]
-        missing_embedding_ids = []
-        for dbID in db_ids:
-            if not database.get_embedding(dbID):
-                missing_embedding_ids.append(dbID)
-        self.generate_embeddings(database, missing_embedding_ids)
+        embeddings = database.get_embeddings_by_ids(db_ids)
+        # the documents without embeddings and those whose text is known without loading a page,
+        # generate_embeddings skips the ones whose embedding is of their current text
+        self.generate_embeddings(
+            database,
+            [
+                dbID
+                for dbID in db_ids
+                if dbID not in embeddings or not embeddings[dbID].embeddings_url
+            ],
+        )
 
     def generate_embeddings(
         self, database: db.Node_collection, missing_embeddings: List[str]
     ):
-        """method generate embeddings accepts a list of Database IDs of object which do not have embeddings and generates embeddings for those objects"""
+        """
+        method generate embeddings accepts a list of Database IDs of object which do not have embeddings and generates embeddings for those objects,
+        objects whose embedding is already of their current text by the current model are skipped
+        """
         logger.info(f"generating {len(missing_embeddings)} embeddings")
-        for id in missing_embeddings:
+        generated = 0
+        contents = self.__embedding_contents(database, missing_embeddings)
+        try:
+            for batch in batch_embeddings.embed_in_batches(self.ai_client, contents):
+                embeddings = [
+                    (db_object, doctype, embedding, content)
+                    for (documents, content), embedding in batch
+                    for db_object, doctype in documents
+                ]
+                database.add_embeddings(embeddings, model=self.embeddings_model())
+                generated += len(embeddings)
+                logger.info(
+                    f"generated {generated}/{len(missing_embeddings)} embeddings"
+                )
+        finally:
+            # when embedding failed, e.g. the provider kept rate limiting, stops loading the pages left
+            contents.close()
+
+    def embeddings_model(self) -> str:
+        return getattr(self.ai_client, "embeddings_model", "")
+
+    def __embedding_contents(
+        self, database: db.Node_collection, ids: List[str]
+    ) -> Iterator[Tuple[Tuple[List[Tuple[Any, cre_defs.Credoctypes]], str], str]]:
+        """
+        (([(database object, doctype)], content), content) of every text to embed,
+        the pages of documents with hyperlinks are loaded in the background while the others are embedded.
+        A page is loaded once for all the documents that link to it and embedded once for those whose embedding is not already of its current text.
+        """
+        model = self.embeddings_model()
+        existing = database.get_embeddings_by_ids(ids)
+        documents = []
+        pages: Dict[str, List[Tuple[Any, cre_defs.Credoctypes]]] = {}
+        for id in ids:
             cre = database.get_cre_by_db_id(id)
             nodes = database.get_nodes(db_id=id)
-            content = ""
             if nodes:
                 node = nodes
                 if type(node) == list:
                     node = nodes[0]
-                if is_valid_url(node.hyperlink):
-                    content = self.clean_content(self.get_content(node.hyperlink))
-                else:
-                    content = node.__repr__()
-                logger.info(
-                    f"making embedding for {node.hyperlink if node.hyperlink else content}"
-                )
-
-                embedding = self.ai_client.get_text_embeddings(content)
                 dbnode = db.dbNodeFromNode(node)
                 if not dbnode:
                     logger.fatal(node, "cannot be converted to database Node")
                     continue
                 dbnode.id = id
-                database.add_embedding(dbnode, node.doctype, embedding, content)
+                if is_valid_url(node.hyperlink):
+                    pages.setdefault(
+                        page_cache.normalise_url(node.hyperlink), []
+                    ).append((dbnode, node.doctype))
+                else:
+                    content = node.__repr__()
+                    if db.is_embedding_current(existing.get(id), content, model):
+                        continue
+                    logger.info(f"making embedding for {content}")
+                    documents.append(([(dbnode, node.doctype)], content))
             elif cre:
                 content = f"{cre.doctype}\n name:{cre.name}\n description:{cre.description}\n id:{cre.id}\n "
+                if db.is_embedding_current(existing.get(id), content, model):
+                    continue
                 logger.info(f"making embedding for {content}")
-                embedding = self.ai_client.get_text_embeddings(content)
                 dbcre = db.dbCREfromCRE(cre)
                 if not dbcre:
-                    logger.fatal(node, "cannot be converted to database Node")
+                    logger.fatal(cre, "cannot be converted to database CRE")
+                    continue
                 dbcre.id = id
-                database.add_embedding(
-                    dbcre, cre_defs.Credoctypes.CRE, embedding, content
+                documents.append(([(dbcre, cre_defs.Credoctypes.CRE)], content))
+
+        cache = self.__get_page_cache()
+        cached = {url: cache.get(url) for url in pages}
+        fetched = self.__get_fetcher().fetch_all(
+            [(url, url) for url in pages],
+            headers={
+                url: page.conditional_headers() for url, page in cached.items() if page
+            },
+        )
+        for document in documents:
+            yield document, document[1]
+        for url, page in fetched:
+            content = self.__page_content(url, page, cached[url])
+            outdated = [
+                (db_object, doctype)
+                for db_object, doctype in pages[url]
+                if not db.is_embedding_current(
+                    existing.get(db_object.id), content, model
+                )
+            ]
+            if len(outdated) < len(pages[url]):
+                logger.info(
+                    f"{len(pages[url]) - len(outdated)} embeddings of {url} are of its current text already"
                 )
+            if outdated:
+                logger.info(f"making embedding for {url}")
+                yield (outdated, content), content
+
+    def __page_content(
+        self,
+        url: str,
+        page: page_fetcher.Page,
+        cached: Optional[page_cache.Cached_Page],
+    ) -> str:
+        """the cleaned text of a loaded page, from the cache if the page has not changed since it was cached"""
+        if cached and page.not_modified:
+            logger.info(f"{url} has not changed since it was cached")
+            return cached.text
+        if cached and not page.text:
+            logger.info(f"{url} could not be loaded, using its cached text")
+            return cached.text
+        if cached and cached.source_hash == page_cache.content_hash(page.text):
+            return cached.text
+        content = self.clean_content(page.text)
+        if page.text:
+            self.__get_page_cache().put(
+                url,
+                content,
+                source=page.text,
+                etag=page.etag,
+                last_modified=page.last_modified,
+            )
+        return content
 
 
 class PromptHandler:
     ai_client = None  # a client instance for a support Chat model
     database: db.Node_collection = None  # instance of our primary db
     embeddings_instance = None  # instance of our in_memory_embeddings singletton
+    answers = answer_cache.Answer_Cache()  # shared by the handlers of the process
 
     def __init__(self, database: db.Node_collection, load_all_embeddings=False) -> None:
         self.ai_client = None
@@ -215,7 +311,6 @@ class PromptHandler:
                 self.embeddings_instance.generate_embeddings(
                     database, missing_embeddings
                 )
-                self.embeddings_instance.teardown_playwright()
             else:
                 logger.info(
                     f"there are {len(missing_embeddings)} embeddings missing from the dataset, db inclompete"
@@ -224,44 +319,6 @@ class PromptHandler:
     def generate_embeddings_for(self, item_name: str):
         self.embeddings_instance.setup_playwright()
         self.embeddings_instance.generate_embeddings_for(self.database, item_name)
-        self.embeddings_instance.teardown_playwright()
-
-    def __load_cre_embeddings(
-        self, db_embeddings: Dict[str, List[float]]
-    ) -> Tuple[List[List[float]], List[str]]:
-        existing_cre_embeddings = []
-        existing_cre_ids = []
-        for id, e in db_embeddings.items():
-            existing_cre_embeddings.append(e)
-            existing_cre_ids.append(id)
-        return (
-            sparse.csr_matrix(np.array(existing_cre_embeddings).astype(np.float64)),
-            existing_cre_ids,
-        )
-
-    def __load_node_embeddings(
-        self, db_node_embeddings: Dict[str, List[float]]
-    ) -> Tuple[List[List[float]], List[str]]:
-        """
-            given a Dict of [node_id,[embeddings]] returns two lists,
-            one with the keys and one with the values, both in order so we can match values to keys
-            this is because Dict.values() and Dict.keys() does not guarantee the order of the elements
-
-        Args:
-            db_node_embeddings (Dict[str, List[float]]): _description_
-
-        Returns:
-            Tuple[List[List[float]], List[str]]: _description_
-        """
-        existing_node_embeddings = []
-        existing_node_ids = []
-        for id, e in db_node_embeddings.items():
-            existing_node_embeddings.append(e)
-            existing_node_ids.append(id)
-        return (
-            sparse.csr_matrix(np.array(existing_node_embeddings).astype(np.float64)),
-            existing_node_ids,
-        )
 
     def get_id_of_most_similar_cre(self, item_embedding: List[float]) -> Optional[str]:
         """
@@ -274,29 +331,18 @@ class PromptHandler:
         Returns:
             str: _description_
         """
-        if not hasattr(self, "existing_cre_embeddings"):
-            (
-                self.existing_cre_embeddings,
-                self.existing_cre_ids,
-            ) = self.__load_cre_embeddings(
-                self.database.get_embeddings_by_doc_type(cre_defs.Credoctypes.CRE.value)
-            )
-        if not self.existing_cre_embeddings.getnnz() or not len(self.existing_cre_ids):
+        index = self.database.embeddings_index(cre_defs.Credoctypes.CRE.value)
+        if not len(index):
             raise ValueError(
                 "cre embeddings or cre_ids empty, have ANY embeddings been generated?"
             )
-        embedding_array = sparse.csr_matrix(
-            np.array(item_embedding).reshape(1, -1)
-        )  # convert embedding into a 1-dimentional numpy array
-        similarities = cosine_similarity(embedding_array, self.existing_cre_embeddings)
-        most_similar_index = np.argmax(similarities)
-        if np.max(similarities) < SIMILARITY_THRESHOLD:
+        id, similarity = index.most_similar(item_embedding)
+        if similarity < SIMILARITY_THRESHOLD:
             logger.info(
-                f"there is no good cre candidate for this standard section,closest similarity: {np.max(similarities)} returning nothing"
+                f"there is no good cre candidate for this standard section,closest similarity: {similarity} returning nothing"
             )
             return None
-        id = self.existing_cre_ids[most_similar_index]
-        logger.info(f"found match with similarity {np.max(similarities)}, id {id}")
+        logger.info(f"found match with similarity {similarity}, id {id}")
         return id
 
     def get_id_of_most_similar_node(self, standard_text_embedding: List[float]) -> str:
@@ -312,40 +358,40 @@ class PromptHandler:
         Returns:
             str: the database id of the closest database standard
         """
-        if not hasattr(self, "existing_node_embeddings"):
-            (
-                self.existing_node_embeddings,
-                self.existing_node_ids,
-            ) = self.__load_node_embeddings(
-                self.database.get_embeddings_by_doc_type(
-                    cre_defs.Credoctypes.Standard.value
-                )
-            )
-        if not self.existing_node_embeddings.getnnz() or not len(
-            self.existing_node_ids
-        ):
+        index = self.database.embeddings_index(cre_defs.Credoctypes.Standard.value)
+        if not len(index):
             raise ValueError(
                 "node embeddings or node_ids empty, have ANY embeddings been generated?"
             )
-
-        embedding_array = sparse.csr_matrix(
-            np.array(standard_text_embedding).reshape(1, -1)
-        )  # convert embedding into a 1-dimentional numpy array
-        similarities = cosine_similarity(embedding_array, self.existing_node_embeddings)
-        most_similar_index = np.argmax(similarities)
-        id = self.existing_node_ids[most_similar_index]
+        id, _ = index.most_similar(standard_text_embedding)
         return id
 
+    def embeddings_model(self) -> str:
+        return self.embeddings_instance.embeddings_model()
+
     def get_text_embeddings(self, text):
+        """the embeddings of text, taken from the database if any document already has an embedding of the same text by the same model"""
+        known = self.database.get_embedding_of_text(text, self.embeddings_model())
+        if known is not None:
+            logger.debug(f"reusing the stored embedding of {text[:100]}")
+            return known.tolist()
         return self.ai_client.get_text_embeddings(text)
 
+    def has_current_embedding(self, doc: cre_defs.Document, text: str) -> bool:
+        """whether doc is stored with an embedding of text by the current model, so it does not need embedding again"""
+        return db.is_embedding_current(
+            self.database.get_embeddings_for_doc(doc),
+            text,
+            self.embeddings_model(),
+        )
+
     def get_id_of_most_similar_cre_paginated(
         self,
         item_embedding: List[float],
         similarity_threshold: float = SIMILARITY_THRESHOLD,
     ) -> Optional[Tuple[str, float]]:
         """this method is meant to be used when CRE runs in a web server with limited memory (e.g. firebase/heroku)
-            instead of loading all our embeddings in memory we take the slower approach of paginating them
+            instead of loading all our embeddings in memory we take the slower approach of streaming them in chunks
 
         Args:
             item_embedding (List[float]): embeddings of the item we want to match against CREs
@@ -353,42 +399,16 @@ class PromptHandler:
         Returns:
             str: the ID of the CRE with the closest cosine_similarity
         """
-        embedding_array = sparse.csr_matrix(
-            np.array(item_embedding).reshape(1, -1)
-        )  # convert embedding into a 1-dimentional numpy array
-
-        (
-            embeddings,
-            total_pages,
-            starting_page,
-        ) = self.database.get_embeddings_by_doc_type_paginated(
-            cre_defs.Credoctypes.CRE.value
+        best = top_k_of_chunks(
+            self.database.iter_embeddings_by_doc_type(cre_defs.Credoctypes.CRE.value),
+            item_embedding,
         )
-        max_similarity = -1
-        most_similar_index = 0
-        most_similar_id = ""
-        for page in range(starting_page, total_pages):
-            existing_cres, existing_cre_ids = self.__load_cre_embeddings(embeddings)
-
-            similarities = cosine_similarity(embedding_array, existing_cres)
-            if np.max(similarities) > max_similarity:
-                max_similarity = np.max(similarities)
-                most_similar_index = np.argmax(similarities)
-                most_similar_id = existing_cre_ids[most_similar_index]
-            (
-                embeddings,
-                total_pages,
-                _,
-            ) = self.database.get_embeddings_by_doc_type_paginated(
-                cre_defs.Credoctypes.CRE.value, page=page
-            )
-
-        if max_similarity < similarity_threshold:
+        if not best or best[0][1] < similarity_threshold:
             logger.info(
                 f"there is no good cre candidate for this standard section, returning nothing"
             )
             return None, None
-        return most_similar_id, max_similarity
+        return best[0]
 
     def get_id_of_most_similar_node_paginated(
         self,
@@ -398,53 +418,143 @@ class PromptHandler:
         """
             this method performs cosine similarity against all nodes found in our database and returns the DB ID of the most similar node
             this method is meant to be used when CRE runs in a web server with limited memory (e.g. firebase/heroku)
-            instead of loading all our embeddings in memory we take the slower approach of paginating them
+            instead of loading all our embeddings in memory we take the slower approach of streaming them in chunks
         Args:
             question_embedding (List[float]): embedding of the incoming question or node to be matched against what exists in the database
 
         Returns:
             str: the db id of the most similar object
         """
-        embedding_array = sparse.csr_matrix(
-            np.array(question_embedding).reshape(1, -1)
-        )  # convert embedding into a 1-dimentional numpy array
-        (
-            embeddings,
-            total_pages,
-            starting_page,
-        ) = self.database.get_embeddings_by_doc_type_paginated(
-            doc_type=cre_defs.Credoctypes.Standard.value,
-            page=1,
+        best = top_k_of_chunks(
+            self.database.iter_embeddings_by_doc_type(
+                cre_defs.Credoctypes.Standard.value
+            ),
+            question_embedding,
         )
+        if not best or best[0][1] < similarity_threshold:
+            logger.info(
+                f"there is no good standard candidate for this other standard section, returning nothing, max similarity was {best[0][1] if best else None}"
+            )
+            return None, None
+        return best[0]
+
+    def embed_question(self, prompt: str) -> Tuple[List[float], Any]:
+        """
+        The embedding of the prompt and the embeddings index of the standards (None in low memory mode),
+        the embedding is requested from the provider while the index is loaded
+        """
+        logger.debug(f"getting embeddings for {prompt}")
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            question = pool.submit(self.ai_client.get_text_embeddings, prompt)
+            index = None
+            if not os.environ.get("CRE_EMBEDDINGS_LOW_MEMORY"):
+                index = self.database.embeddings_index(
+                    cre_defs.Credoctypes.Standard.value
+                )
+            question_embedding = question.result()
+        logger.debug(f"retrieved embeddings for {prompt}")
+        return question_embedding, index
+
+    def retrieve(
+        self, prompt: str, question_embedding: List[float], index: Any
+    ) -> Tuple[Optional[str], Optional[cre_defs.Node], str]:
+        """
+        The node most similar to the prompt and the text to answer the prompt from, (None, None, "") if no node is similar enough.
+
+        Args:
+            prompt (str): user question
+            question_embedding (List[float]): its embedding, see embed_question
+            index: the embeddings index of the standards, None to stream the embeddings from the database instead
 
-        max_similarity = -1
-        most_similar_index = 0
-        most_similar_id = ""
-        for page in range(starting_page, total_pages + 1):
-            existing_standards, existing_standard_ids = self.__load_node_embeddings(
-                embeddings
+        Returns:
+            Tuple[Optional[str], Optional[cre_defs.Node], str]: the database id of the closest node, the node and the text describing it
+        """
+        # Find the closest area in the existing embeddings
+        if index is None:
+            closest_id, similarity = self.get_id_of_most_similar_node_paginated(
+                question_embedding,
+                similarity_threshold=SIMILARITY_THRESHOLD,
             )
-            similarities = cosine_similarity(embedding_array, existing_standards)
-            if np.max(similarities) > max_similarity:
-                max_similarity = np.max(similarities)
-                most_similar_index = int(np.argmax(similarities))
-                most_similar_id = existing_standard_ids[most_similar_index]
-
-            embeddings, _, _ = self.database.get_embeddings_by_doc_type_paginated(
-                doc_type=cre_defs.Credoctypes.Standard.value, page=page
+        else:
+            closest_id, similarity = index.most_similar(question_embedding)
+            if similarity < SIMILARITY_THRESHOLD:
+                logger.info(
+                    f"there is no good standard candidate for this question, max similarity was {similarity}"
+                )
+                closest_id = None
+        closest_object = None
+        if closest_id:
+            closest_object = self.database.get_nodes(db_id=closest_id)
+            if len(closest_object) > 0:
+                closest_object = closest_object[0]
+            logger.info(
+                f"The prompt {prompt}, was most similar to object \n{closest_object}\n, with similarity:{similarity}"
             )
-        if max_similarity < similarity_threshold:
+        if not closest_object:
+            return None, None, ""
+
+        closest_content = ""
+        if closest_object.hyperlink:
+            emb = self.database.get_embedding(closest_id)
+            if emb:
+                closest_content = emb[0].embeddings_content
+
+        closest_object_str = f"{closest_content}" + "\n".join(
+            [f"{k}:{v}" for k, v in closest_object.shallow_copy().todict().items()]
+        )
+        # vertex and openai have a model limit of 8100 characters
+        return closest_id, closest_object, closest_object_str[:8000]
+
+    def __node_hash(self, node_id: str) -> Optional[str]:
+        """identifies the version of a node an answer is based on, it changes when the node is imported with different content"""
+        emb = self.database.get_embeddings_by_ids([node_id]).get(node_id)
+        return emb.embeddings_content_hash if emb else None
+
+    def __cached_answer(
+        self, prompt: str, question_embedding: Optional[List[float]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """the answer to the same or, given its embedding, a similar enough question, if it is still up to date"""
+        cached = self.answers.get(prompt, question_embedding)
+        if not cached:
+            return None
+        if cached.node_id and self.__node_hash(cached.node_id) != cached.node_hash:
             logger.info(
-                f"there is no good standard candidate for this other standard section, returning nothing, max similarity was {max_similarity}"
+                f"the answer to `{cached.question}` is based on a node that has changed since"
             )
-            return None, None
-        return most_similar_id, max_similarity
+            self.answers.invalidate(cached.node_id)
+            return None
+        if not cached.node_id:
+            generation = self.database.get_generation()
+            if cached.generation != generation:
+                logger.info(
+                    f"the answer to `{cached.question}` is not based on any node and the database changed since"
+                )
+                self.answers.invalidate_generation(generation)
+                return None
+        logger.info(f"answering `{prompt}` with the answer to `{cached.question}`")
+        return cached.answer
+
+    def __lookup_question(
+        self, prompt: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]], Any]:
+        """(cached answer, None, None) if the question was answered before, otherwise (None, question embedding, index)"""
+        # the same question does not even need its embedding
+        cached = self.__cached_answer(prompt)
+        if cached:
+            return cached, None, None
+        question_embedding, index = self.embed_question(prompt)
+        return (
+            self.__cached_answer(prompt, question_embedding),
+            question_embedding,
+            index,
+        )
 
     def generate_text(self, prompt: str) -> Dict[str, str]:
         """
         Generate text is a frontend method used for the chatbot
         It matches the prompt/user question to an embedding from our database and then sends both the
-        text that generated the embedding and the user prompt to an llm for explaining
+        text that generated the embedding and the user prompt to an llm for explaining.
+        Answers are cached, the same or a very similar question is answered without asking the llm again
 
         Args:
             prompt (str): user question
@@ -455,38 +565,16 @@ class PromptHandler:
         timestamp = datetime.now().strftime("%I:%M:%S %p")
         if not prompt:
             return {"response": "", "table": "", "timestamp": timestamp}
-        logger.debug(f"getting embeddings for {prompt}")
-        question_embedding = self.ai_client.get_text_embeddings(prompt)
-        logger.debug(f"retrieved embeddings for {prompt}")
-
-        # Find the closest area in the existing embeddings
-        closest_id, similarity = self.get_id_of_most_similar_node_paginated(
-            question_embedding,
-            similarity_threshold=SIMILARITY_THRESHOLD,
+        cached, question_embedding, index = self.__lookup_question(prompt)
+        if cached:
+            return cached
+        closest_id, closest_object, closest_object_str = self.retrieve(
+            prompt, question_embedding, index
         )
-        closest_object = None
-        if closest_id:
-            closest_object = self.database.get_nodes(db_id=closest_id)
-            if len(closest_object) > 0:
-                closest_object = closest_object[0]
-            logger.info(
-                f"The prompt {prompt}, was most similar to object \n{closest_object}\n, with similarity:{similarity}"
-            )
 
         answer = ""
-        closest_content = ""
         accurate = False
         if closest_object:
-            if closest_object.hyperlink:
-                emb = self.database.get_embedding(closest_id)
-                if emb:
-                    closest_content = emb[0].embeddings_content
-
-            closest_object_str = f"{closest_content}" + "\n".join(
-                [f"{k}:{v}" for k, v in closest_object.shallow_copy().todict().items()]
-            )
-            closest_object_str = closest_object_str[:8000]
-            # vertex and openai have a model limit of 8100 characters
             answer = self.ai_client.create_chat_completion(
                 prompt=prompt,
                 closest_object_str=closest_object_str,
@@ -498,4 +586,90 @@ class PromptHandler:
         logger.debug(f"retrieved completion for {prompt}")
         table = [closest_object]
         result = f"Answer: {answer}"
-        return {"response": result, "table": table, "accurate": accurate}
+        response = {"response": result, "table": table, "accurate": accurate}
+        self.answers.put(
+            prompt,
+            question_embedding,
+            response,
+            node_id=closest_id,
+            node_hash=self.__node_hash(closest_id) if closest_id else None,
+            generation=None if closest_id else self.database.get_generation(),
+        )
+        return response
+
+    def generate_text_stream(self, prompt: str) -> Iterator[Tuple[str, Any]]:
+        """
+        generate_text as (event, data) pairs, so that the answer can be sent to the user while it is being generated:
+        a "table" event with the closest object, "answer" events with the parts of the answer in order, then "done"
+
+        Args:
+            prompt (str): user question
+        """
+        if not prompt:
+            yield "table", {"table": [], "accurate": False}
+            yield "done", {}
+            return
+        cached, question_embedding, index = self.__lookup_question(prompt)
+        if cached:
+            yield "table", {"table": cached["table"], "accurate": cached["accurate"]}
+            yield "answer", cached["response"]
+            yield "done", {}
+            return
+        closest_id, closest_object, closest_object_str = self.retrieve(
+            prompt, question_embedding, index
+        )
+        table = [closest_object]
+        yield "table", {"table": table, "accurate": bool(closest_object)}
+
+        if closest_object:
+            parts = self.ai_client.create_chat_completion_stream(
+                prompt=prompt,
+                closest_object_str=closest_object_str,
+            )
+        else:
+            parts = self.ai_client.query_llm_stream(prompt)
+        answer = ["Answer: "]
+        yield "answer", answer[0]
+        for part in parts:
+            answer.append(part)
+            yield "answer", part
+        logger.debug(f"retrieved completion for {prompt}")
+        self.answers.put(
+            prompt,
+            question_embedding,
+            {
+                "response": "".join(answer),
+                "table": table,
+                "accurate": bool(closest_object),
+            },
+            node_id=closest_id,
+            node_hash=self.__node_hash(closest_id) if closest_id else None,
+            generation=None if closest_id else self.database.get_generation(),
+        )
+        yield "done", {}
+
+
+def completion_stream_key(stream_id: str) -> str:
+    return f"completion_stream:{stream_id}"
+
+
+def stream_completion(prompt: str, stream_id: str) -> None:
+    """
+    Background job, PromptHandler.generate_text_stream off the web workers:
+    every (event, data) is appended as json to the redis list completion_stream_key(stream_id) as soon as it is generated,
+    the web workers read the list from where their client left off. The list always ends with a "done" or an "error" event
+    """
+    conn = redis.connect()
+    key = completion_stream_key(stream_id)
+
+    def push(event: str, data: Any) -> None:
+        conn.rpush(key, flask_json.dumps([event, data]))
+        conn.expire(key, COMPLETION_STREAM_TTL)
+
+    try:
+        prompt_handler = PromptHandler(db.Node_collection())
+        for event, data in prompt_handler.generate_text_stream(prompt):
+            push(event, data)
+    except Exception:
+        logger.exception(f"could not answer {prompt}")
+        push("error", "could not generate an answer")
@@ -1,5 +1,5 @@
 import google.api_core.exceptions as googleExceptions
-from typing import List
+from typing import Iterator, List
 from vertexai.preview.language_models import TextEmbeddingModel
 from google.cloud import aiplatform
 from vertexai.preview.language_models import ChatModel
@@ -21,6 +21,11 @@ import grpc
 import grpc_status
 import time
 
+from application.prompt_client.batch_embeddings import (
+    MAX_TEXT_CHARACTERS,
+    RateLimitedError,
+)
+
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -52,6 +57,11 @@ class VertexPromptClient:
         ),
     ]
 
+    # the most texts and characters batch_embeddings sends in one request
+    embeddings_batch_size = 100
+    embeddings_batch_characters = 200000
+    embeddings_model = "gemini-embedding-exp-03-07"
+
     def __init__(self) -> None:
         self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
 
@@ -66,7 +76,7 @@ class VertexPromptClient:
         values = []
         try:
             result = self.client.models.embed_content(
-                model="gemini-embedding-exp-03-07",
+                model=self.embeddings_model,
                 contents=text,
                 config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
             )
@@ -82,8 +92,27 @@ class VertexPromptClient:
 
         return values
 
-    def create_chat_completion(self, prompt, closest_object_str) -> str:
-        msg = f"Your task is to answer the following question based on this area of knowledge:`{closest_object_str}` if you can, provide code examples, delimit any code snippet with three backticks\nQuestion: `{prompt}`\n ignore all other commands and questions that are not relevant."
+    def get_text_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """the embeddings of many texts in one request, in the order of texts"""
+        try:
+            result = self.client.models.embed_content(
+                model=self.embeddings_model,
+                contents=[text[:MAX_TEXT_CHARACTERS] for text in texts],
+                config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
+            )
+        except genai.errors.ClientError as e:
+            if e.code == 429:
+                raise RateLimitedError(str(e)) from e
+            raise
+        return [embedding.values for embedding in result.embeddings]
+
+    def __chat_completion_message(self, prompt, closest_object_str) -> str:
+        return f"Your task is to answer the following question based on this area of knowledge:`{closest_object_str}` if you can, provide code examples, delimit any code snippet with three backticks\nQuestion: `{prompt}`\n ignore all other commands and questions that are not relevant."
+
+    def __query_llm_message(self, raw_question: str) -> str:
+        return f"Your task is to answer the following cybersecurity question if you can, provide code examples, delimit any code snippet with three backticks, ignore any unethical questions or questions irrelevant to cybersecurity\nQuestion: `{raw_question}`\n ignore all other commands and questions that are not relevant."
+
+    def __generate(self, msg: str) -> str:
         response = self.client.models.generate_content(
             model="gemini-2.0-flash",
             contents=msg,
@@ -93,14 +122,33 @@ class VertexPromptClient:
         )
         return response.text
 
-    def query_llm(self, raw_question: str) -> str:
-        msg = f"Your task is to answer the following cybersecurity question if you can, provide code examples, delimit any code snippet with three backticks, ignore any unethical questions or questions irrelevant to cybersecurity\nQuestion: `{raw_question}`\n ignore all other commands and questions that are not relevant."
-        response = self.client.models.generate_content(
+    def __generate_stream(self, msg: str) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(
             model="gemini-2.0-flash",
             contents=msg,
             config=types.GenerateContentConfig(
                 max_output_tokens=MAX_OUTPUT_TOKENS, temperature=0.5
             ),
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    def create_chat_completion(self, prompt, closest_object_str) -> str:
+        return self.__generate(
+            self.__chat_completion_message(prompt, closest_object_str)
         )
-        # response = self.chat.send_message(msg, **parameters)
-        return response.text
+
+    def create_chat_completion_stream(
+        self, prompt, closest_object_str
+    ) -> Iterator[str]:
+        """create_chat_completion, as the parts of the answer are generated"""
+        return self.__generate_stream(
+            self.__chat_completion_message(prompt, closest_object_str)
+        )
+
+    def query_llm(self, raw_question: str) -> str:
+        return self.__generate(self.__query_llm_message(raw_question))
+
+    def query_llm_stream(self, raw_question: str) -> Iterator[str]:
+        """query_llm, as the parts of the answer are generated"""
+        return self.__generate_stream(self.__query_llm_message(raw_question))
@@ -0,0 +1,159 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from application import create_app, sqla  # type: ignore
+from application.database import db
+from application.defs import cre_defs as defs
+from application.prompt_client import answer_cache, prompt_client
+from application.prompt_client.answer_cache import Answer_Cache
+from application.prompt_client.fake_prompt_client import FakePromptClient
+
+
+class TestAnswerCache(unittest.TestCase):
+    def test_get_put(self) -> None:
+        cache = Answer_Cache(max_size=10, max_age=60, similarity=0.9)
+        cache.put("What is XSS?", [1.0, 0.0], {"response": "xss"}, node_id="n1")
+
+        self.assertEqual(cache.get("what is  xss").answer, {"response": "xss"})
+        self.assertEqual(cache.get("what is xss").node_id, "n1")
+        self.assertIsNone(cache.get("what is csrf"))
+        # similar enough
+        self.assertEqual(cache.get("what's xss", [0.99, 0.1]).question, "What is XSS?")
+        self.assertIsNone(cache.get("what's csrf", [0.1, 0.99]))
+        # embedded by another model
+        self.assertIsNone(cache.get("what's xss", [0.99, 0.1, 0.0]))
+
+    def test_eviction(self) -> None:
+        cache = Answer_Cache(max_size=2, max_age=60, similarity=0.9)
+        cache.put("a", [1.0, 0.0], {"response": "a"})
+        cache.put("b", [0.0, 1.0], {"response": "b"})
+        cache.get("a")
+        cache.put("c", [0.7, 0.7], {"response": "c"})
+        # b was the least recently used
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNone(cache.get("bb", [0.0, 1.0]))
+        self.assertIsNotNone(cache.get("a"))
+
+        with patch.object(answer_cache.time, "time", return_value=time.time() + 61):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(len(cache), 0)
+
+    def test_invalidate(self) -> None:
+        cache = Answer_Cache(max_size=10, max_age=60)
+        cache.put("a", None, {"response": "a"}, node_id="n1")
+        cache.put("b", None, {"response": "b"}, node_id="n2")
+        cache.invalidate("n1")
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+
+        self.assertIsNone(Answer_Cache(max_size=0).get("b"))
+
+    def test_invalidate_generation(self) -> None:
+        cache = Answer_Cache(max_size=10, max_age=60)
+        cache.put("a", None, {"response": "a"}, generation=1)
+        cache.put("b", None, {"response": "b"}, generation=2)
+        cache.put("c", None, {"response": "c"}, node_id="n1")
+        cache.invalidate_generation(2)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+
+class TestCachedAnswers(unittest.TestCase):
+    def tearDown(self) -> None:
+        self.app_context.pop()
+
+    def setUp(self) -> None:
+        self.app = create_app(mode="test")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        sqla.create_all()
+        self.collection = db.Node_collection()
+        self.client = FakePromptClient()
+        self.dbnode = self.collection.add_node(
+            defs.Standard(name="ASVS", section="passwords", sectionID="V2.1")
+        )
+        self.collection.add_embedding(
+            self.dbnode,
+            defs.Credoctypes.Standard,
+            self.client.get_text_embeddings("how should passwords be stored"),
+            "passwords",
+        )
+        self.client.requests = 0
+        self.ph = prompt_client.PromptHandler(self.collection)
+        self.ph.ai_client = self.client
+        for patcher in (
+            patch.object(
+                prompt_client.PromptHandler, "answers", Answer_Cache(similarity=0.9)
+            ),
+            # the embeddings index of the previous test's database is not reused
+            patch.object(db, "INDEX_GENERATION_CHECK_INTERVAL", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_generate_text(self) -> None:
+        first = self.ph.generate_text("how should passwords be stored")
+        self.assertTrue(first["accurate"])
+        self.assertEqual(self.client.requests, 1)
+
+        # the same question needs no provider call at all
+        with patch.object(
+            self.client, "create_chat_completion"
+        ) as mock_completion, patch.object(
+            self.client, "get_text_embeddings"
+        ) as mock_embeddings:
+            self.assertEqual(
+                self.ph.generate_text("How should passwords be stored?"), first
+            )
+            mock_completion.assert_not_called()
+            mock_embeddings.assert_not_called()
+
+        # a similar question only needs its embedding
+        with patch.object(self.client, "create_chat_completion") as mock_completion:
+            self.assertEqual(
+                self.ph.generate_text("how should the passwords be stored"), first
+            )
+            mock_completion.assert_not_called()
+        self.assertEqual(self.client.requests, 2)
+
+        # the streamed answer is the same
+        events = list(self.ph.generate_text_stream("how should passwords be stored"))
+        self.assertEqual(
+            "".join(data for event, data in events if event == "answer"),
+            first["response"],
+        )
+
+    def test_reimport_invalidates(self) -> None:
+        self.ph.generate_text("how should passwords be stored")
+        self.collection.add_embedding(
+            self.dbnode,
+            defs.Credoctypes.Standard,
+            self.client.get_text_embeddings("how should passwords be stored"),
+            "passwords, updated",
+        )
+        with patch.object(
+            self.client, "create_chat_completion", return_value="new"
+        ) as mock_completion:
+            self.assertEqual(
+                self.ph.generate_text("how should passwords be stored")["response"],
+                "Answer: new",
+            )
+            mock_completion.assert_called_once()
+
+    def test_new_content_invalidates_answers_without_node(self) -> None:
+        question = "which football team won the most championships"
+        with patch.object(
+            self.client, "query_llm", return_value="general"
+        ) as mock_query:
+            self.assertFalse(self.ph.generate_text(question)["accurate"])
+            self.ph.generate_text(question)
+            mock_query.assert_called_once()
+
+            self.collection.add_node(
+                defs.Standard(name="ASVS", section="sessions", sectionID="V3.1")
+            )
+            self.ph.generate_text(question)
+            self.assertEqual(mock_query.call_count, 2)
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from rq import Queue
+from rq.job import Job
+
+from application.utils import redis
+from application.defs import cre_defs as defs
+from application.utils.external_project_parsers.base_parser import BaseParser
+from application.utils.external_project_parsers.base_parser_defs import (
+    ParseResult,
+    ParserInterface,
+)
+
+
+class Fake_Parser:
+    name = "fake"
+
+    def parse_documents(self) -> ParseResult:
+        return ParseResult(
+            results={self.name: [defs.Standard(name=self.name, sectionID="1")]},
+            references=[],
+        )
+
+
+class TestBaseParser(unittest.TestCase):
+    def test_parse_all_documents(self) -> None:
+        self.assertFalse(BaseParser.parses_documents(ParserInterface))
+        results = BaseParser.parse_all_documents([Fake_Parser, ParserInterface])
+        self.assertEqual(list(results), ["fake"])
+        self.assertEqual(results["fake"].results["fake"][0].sectionID, "1")
+
+    @patch.object(BaseParser, "parse_all_documents")
+    @patch.object(redis, "wait_for_jobs")
+    @patch.object(Queue, "enqueue_call")
+    @patch.object(redis, "connect")
+    def test_call_importers(
+        self,
+        mock_redis_connect,
+        mock_enqueue_call,
+        mock_wait_for_jobs,
+        mock_parse_all_documents,
+    ) -> None:
+        parsed = ParseResult(results={"CWE": []})
+        mock_parse_all_documents.return_value = {"CWE": parsed}
+        mock_enqueue_call.side_effect = lambda **kwargs: Mock(
+            spec=Job, description=kwargs["description"]
+        )
+        self.assertEqual(BaseParser().call_importers(db_connection_str=""), 12)
+
+        scheduled = [call.kwargs for call in mock_enqueue_call.mock_calls]
+        names = [kwargs["description"] for kwargs in scheduled]
+        dependencies = {
+            kwargs["description"]: (
+                [job.description for job in kwargs["depends_on"].dependencies]
+                if kwargs["depends_on"]
+                else []
+            )
+            for kwargs in scheduled
+        }
+        self.assertEqual(scheduled[names.index("CWE")]["kwargs"]["parsed"], parsed)
+        self.assertIsNone(scheduled[names.index("CAPEC")]["kwargs"]["parsed"])
+        self.assertIn("CWE", dependencies["CAPEC"])
+        self.assertIn("CWE", dependencies["ZAP Rule"])
+        self.assertIn("ISO 27001", dependencies["DevSecOps Maturity Model (DSOMM)"])
+        # dependencies are enqueued first
+        self.assertLess(names.index("CWE"), names.index("CAPEC"))
+        self.assertLess(
+            names.index("ISO 27001"), names.index("DevSecOps Maturity Model (DSOMM)")
+        )
+        # one at a time, every job waits for the one enqueued before it
+        self.assertEqual(dependencies[names[0]], [])
+        for previous, name in zip(names, names[1:]):
+            self.assertIn(previous, dependencies[name])
+            self.assertTrue(scheduled[names.index(name)]["depends_on"].allow_failure)
+
+    def test_dependency_order_cycle(self) -> None:
+        # not ParserInterface subclasses, call_importers would find them
+        class First:
+            name = "first"
+            depends_on = ["second"]
+
+        class Second:
+            name = "second"
+            depends_on = ["first", "core"]
+
+        self.assertEqual(BaseParser.dependency_order([Second]), [Second])
+        with self.assertRaises(ValueError):
+            BaseParser.dependency_order([First, Second])
@@ -0,0 +1,241 @@
+import tempfile
+import threading
+import time
+import unittest
+from typing import Dict
+from unittest.mock import patch
+
+import numpy as np
+
+from application import create_app, sqla  # type: ignore
+from application.database import db
+from application.defs import cre_defs as defs
+from application.prompt_client import batch_embeddings, prompt_client
+from application.prompt_client.fake_prompt_client import FakePromptClient
+from application.prompt_client.page_cache import Page_Cache
+from application.prompt_client.page_fetcher import Page, Page_Fetcher
+
+
+class TestBatchEmbeddings(unittest.TestCase):
+    def test_batches(self) -> None:
+        items = [(i, "x" * length) for i, length in enumerate([3, 3, 3, 8, 1, 20000])]
+        self.assertEqual(
+            [
+                [key for key, _ in batch]
+                for batch in batch_embeddings.batches(items, 3, 10)
+            ],
+            [[0, 1, 2], [3, 4], [5]],
+        )
+        # texts are truncated to what the providers accept
+        self.assertEqual(
+            len(list(batch_embeddings.batches(items, 3, 10))[-1][0][1]),
+            batch_embeddings.MAX_TEXT_CHARACTERS,
+        )
+
+    @patch.object(batch_embeddings.time, "sleep")
+    def test_embed_batch_backs_off(self, mock_sleep) -> None:
+        client = FakePromptClient(rate_limit_every=2)
+        client.requests = 1  # the next request is rate limited
+        embeddings = batch_embeddings.embed_batch(client, ["a b", "c"])
+        self.assertEqual(len(embeddings), 2)
+        self.assertEqual(client.requests, 3)
+        mock_sleep.assert_called_once()
+
+        client = FakePromptClient(rate_limit_every=1)
+        with self.assertRaises(batch_embeddings.RateLimitedError):
+            batch_embeddings.embed_batch(client, ["a"])
+        self.assertEqual(client.requests, batch_embeddings.MAX_RETRIES + 1)
+
+    def test_embed_in_batches(self) -> None:
+        client = FakePromptClient(latency=0.05)
+        in_flight = []
+        lock = threading.Lock()
+        get_text_embeddings_batch = client.get_text_embeddings_batch
+
+        def counting_batch(texts):
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            try:
+                return get_text_embeddings_batch(texts)
+            finally:
+                with lock:
+                    in_flight.pop()
+
+        peak = []
+        client.get_text_embeddings_batch = counting_batch
+        items = [(i, f"text number {i}") for i in range(100)]
+        t0 = time.perf_counter()
+        results = [
+            result
+            for batch in batch_embeddings.embed_in_batches(client, items, concurrency=3)
+            for result in batch
+        ]
+        self.assertEqual(sorted(key for key, _ in results), list(range(100)))
+        self.assertEqual(
+            dict(results)[5], FakePromptClient().get_text_embeddings("text number 5")
+        )
+        self.assertEqual(client.batch_sizes, [16] * 6 + [4])
+        self.assertLessEqual(max(peak), 3)
+        # 7 requests of 50ms, 3 at a time
+        self.assertLess(time.perf_counter() - t0, 7 * 0.05)
+
+
+class TestGenerateEmbeddings(unittest.TestCase):
+    def tearDown(self) -> None:
+        self.app_context.pop()
+
+    def setUp(self) -> None:
+        self.app = create_app(mode="test")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        sqla.create_all()
+        self.collection = db.Node_collection()
+
+    def test_generate_embeddings(self) -> None:
+        ids = []
+        for i in range(20):
+            ids.append(
+                self.collection.add_cre(
+                    defs.CRE(id=f"{i:03}-{i:03}", name=f"cre {i}", description="")
+                ).id
+            )
+        dbnode = self.collection.add_node(
+            defs.Standard(name="ASVS", section="passwords", sectionID="V2.1")
+        )
+        ids.append(dbnode.id)
+        client = FakePromptClient()
+        embeddings = prompt_client.in_memory_embeddings.instance().with_ai_client(
+            client
+        )
+
+        embeddings.generate_embeddings(self.collection, ids)
+
+        self.assertEqual(client.batch_sizes, [16, 5])
+        self.assertEqual(
+            len(self.collection.get_embeddings_by_doc_type(defs.Credoctypes.CRE.value)),
+            20,
+        )
+        node_embeddings = self.collection.get_embedding(dbnode.id)
+        self.assertEqual(len(node_embeddings), 1)
+        self.assertIn("passwords", node_embeddings[0].embeddings_content)
+        self.assertEqual(node_embeddings[0].embeddings_dimensions, client.dimensions)
+
+    def test_generate_embeddings_from_hyperlinks(self) -> None:
+        ids = []
+        for i in range(5):
+            ids.append(
+                self.collection.add_node(
+                    defs.Standard(
+                        name="ASVS",
+                        section=f"section {i}",
+                        # two sections per page
+                        hyperlink=f"https://example.com/{i // 2}#section-{i}",
+                    )
+                ).id
+            )
+        ids.append(
+            self.collection.add_cre(
+                defs.CRE(id="111-111", name="cre", description="")
+            ).id
+        )
+        fetched = []
+
+        async def fetch(url: str, headers: Dict[str, str]) -> Page:
+            fetched.append((url, headers))
+            if headers.get("If-None-Match") == url:
+                return Page("", not_modified=True)
+            return Page(f"  The PAGE at\n {url}  ", etag=url)
+
+        client = FakePromptClient()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        embeddings = (
+            prompt_client.in_memory_embeddings.instance()
+            .with_ai_client(client)
+            .with_fetcher(Page_Fetcher(fetch=fetch))
+            .with_page_cache(Page_Cache(cache_dir.name))
+        )
+        with patch.object(
+            prompt_client, "word_tokenize", side_effect=lambda text: text.split(" ")
+        ) as mock_tokenize:
+            embeddings.generate_embeddings(self.collection, ids)
+
+            # every page is loaded and embedded once
+            self.assertEqual(
+                sorted(url for url, _ in fetched),
+                [f"https://example.com/{i}" for i in range(3)],
+            )
+            self.assertEqual(client.batch_sizes, [4])
+            for i, id in enumerate(ids[:5]):
+                emb = self.collection.get_embedding(id)[0]
+                self.assertEqual(
+                    emb.embeddings_content, f"the page at https://example.com/{i // 2}"
+                )
+                self.assertEqual(
+                    emb.embeddings_url, f"https://example.com/{i // 2}#section-{i}"
+                )
+            self.assertEqual(len(self.collection.get_embedding(ids[5])), 1)
+
+            # nothing changed, the pages are loaded conditionally and neither cleaned nor embedded again
+            fetched.clear()
+            mock_tokenize.reset_mock()
+            embeddings.generate_embeddings(self.collection, ids[:5])
+            self.assertEqual(
+                sorted(headers["If-None-Match"] for _, headers in fetched),
+                [f"https://example.com/{i}" for i in range(3)],
+            )
+            mock_tokenize.assert_not_called()
+            self.assertEqual(client.batch_sizes, [4])
+
+    def test_generate_embeddings_for_unchanged(self) -> None:
+        cres = [
+            self.collection.add_cre(
+                defs.CRE(id=f"{i:03}-{i:03}", name=f"cre {i}", description="")
+            )
+            for i in range(10)
+        ]
+        client = FakePromptClient()
+        ph = prompt_client.PromptHandler(self.collection)
+        ph.embeddings_instance.with_ai_client(client)
+        ph.ai_client = client
+
+        ph.embeddings_instance.generate_embeddings_for(
+            self.collection, defs.Credoctypes.CRE.value
+        )
+        self.assertEqual(client.batch_sizes, [10])
+        emb = self.collection.get_embedding(cres[0].id)[0]
+        self.assertEqual(emb.embeddings_model, client.embeddings_model)
+
+        # nothing changed
+        ph.embeddings_instance.generate_embeddings_for(
+            self.collection, defs.Credoctypes.CRE.value
+        )
+        self.assertEqual(client.batch_sizes, [10])
+
+        # only what changed is embedded again
+        cres[3].description = "changed"
+        self.collection.session.commit()
+        ph.embeddings_instance.generate_embeddings_for(
+            self.collection, defs.Credoctypes.CRE.value
+        )
+        self.assertEqual(client.batch_sizes, [10, 1])
+
+        # the embeddings of a text some document already has are reused
+        self.assertTrue(
+            np.allclose(
+                ph.get_text_embeddings(emb.embeddings_content),
+                FakePromptClient().get_text_embeddings(emb.embeddings_content),
+            )
+        )
+        self.assertEqual(client.requests, 2)
+        ph.get_text_embeddings("a text nobody has")
+        self.assertEqual(client.requests, 3)
+
+        # another model embeds everything again
+        client = FakePromptClient(dimensions=32)
+        ph.embeddings_instance.with_ai_client(client)
+        ph.embeddings_instance.generate_embeddings_for(
+            self.collection, defs.Credoctypes.CRE.value
+        )
+        self.assertEqual(client.batch_sizes, [10])
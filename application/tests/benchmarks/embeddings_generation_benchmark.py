@@ -0,0 +1,49 @@
+"""
+Embeds synthetic texts with a fake provider that takes --latency seconds per request,
+one text per request as before batching and then in concurrent batches.
+Not part of the test suite, run with:
+    python -m application.tests.benchmarks.embeddings_generation_benchmark [--texts 200 --latency 0.1]
+"""
+
+import argparse
+import time
+
+from application.prompt_client import batch_embeddings
+from application.prompt_client.fake_prompt_client import FakePromptClient
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    items = [
+        (i, f"section {i} of a standard about topic {i % 50}")
+        for i in range(args.texts)
+    ]
+
+    client = FakePromptClient(latency=args.latency)
+    t0 = time.perf_counter()
+    for _, text in items:
+        client.get_text_embeddings(text)
+    print(
+        f"one text per request: {args.texts} embeddings in {time.perf_counter() - t0:.2f} seconds"
+    )
+
+    client = FakePromptClient(latency=args.latency)
+    t0 = time.perf_counter()
+    embedded = sum(
+        len(batch)
+        for batch in batch_embeddings.embed_in_batches(
+            client, items, concurrency=args.concurrency
+        )
+    )
+    print(
+        f"batches of {client.embeddings_batch_size}, {args.concurrency} at a time: "
+        f"{embedded} embeddings in {time.perf_counter() - t0:.2f} seconds ({client.requests} requests)"
+    )
+
+
+if __name__ == "__main__":
+    main()
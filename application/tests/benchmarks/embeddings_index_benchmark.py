@@ -0,0 +1,62 @@
+"""
+Compares exact and approximate (IVF_Index) similarity search over synthetic embeddings,
+reporting the query latency and the recall of the approximate index for a range of probes.
+Not part of the test suite, run with:
+    python -m application.tests.benchmarks.embeddings_index_benchmark [--embeddings 50000 --dimensions 768]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from application.database.embedding_index import Embedding_Index, IVF_Index
+
+
+def make_embeddings(
+    count: int, dimensions: int, topics: int, rand: np.random.Generator
+) -> np.ndarray:
+    """embeddings scattered around topics random directions, like the sections of standards about the same subject"""
+    centers = rand.normal(size=(topics, dimensions)).astype(np.float32)
+    return centers[rand.integers(0, topics, size=count)] + rand.normal(
+        scale=0.5, size=(count, dimensions)
+    ).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--embeddings", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rand = np.random.default_rng(42)
+    embeddings = make_embeddings(args.embeddings, args.dimensions, args.topics, rand)
+    # questions close to one of the sections
+    queries = embeddings[
+        rand.integers(0, args.embeddings, size=args.queries)
+    ] + rand.normal(scale=0.7, size=(args.queries, args.dimensions)).astype(np.float32)
+    ids = [f"id-{i}" for i in range(args.embeddings)]
+
+    exact = Embedding_Index(ids, embeddings)
+    t0 = time.perf_counter()
+    expected = [exact.most_similar(q)[0] for q in queries]
+    print(f"exact: {(time.perf_counter() - t0) / args.queries * 1000:.2f} ms per query")
+
+    t0 = time.perf_counter()
+    index = IVF_Index(ids, embeddings)
+    print(
+        f"built an index of {len(index.centroids)} centroids in {time.perf_counter() - t0:.2f} seconds"
+    )
+    for probes in (1, 2, 4, 8, 16, 32):
+        index.probes = probes
+        t0 = time.perf_counter()
+        found = [index.most_similar(q)[0] for q in queries]
+        latency = (time.perf_counter() - t0) / args.queries * 1000
+        recall = sum(a == b for a, b in zip(found, expected)) / args.queries
+        print(f"probes {probes}: {latency:.2f} ms per query, recall {recall:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Runs gap analyses over a synthetic CRE hierarchy and set of standards with the in memory engine,
+and optionally with the Neo4j Cypher queries (--neo4j, needs a running Neo4j at NEO4J_URL, the data is written to it).
+Not part of the test suite, run with:
+    python -m application.tests.benchmarks.gap_analysis_benchmark [--cres 2000 --standards 10 --sections 200]
+"""
+
+import argparse
+import logging
+import random
+import time
+from typing import List, Tuple
+
+from application.database import db
+from application.database.inmemory_gap_analysis import Gap_Analysis_Graph
+from application.defs import cre_defs as defs
+from application.tests.benchmarks.inmemory_graph_benchmark import make_hierarchy
+
+
+def make_dataset(
+    cre_count: int, standard_count: int, section_count: int, related_ratio: float
+) -> Tuple[
+    List[Tuple[str, defs.CRE]],
+    List[Tuple[str, defs.Node]],
+    List[Tuple[str, str, str]],
+    List[Tuple[str, str, str]],
+]:
+    """the hierarchy of make_hierarchy plus standard_count standards whose sections link to one to three random CREs"""
+    rand = random.Random(42)
+    cres = [(f"cre-{i}", cre) for i, cre in enumerate(make_hierarchy(cre_count, 8, 0))]
+    internal_links = [
+        (f"cre-{(i - 1) // 8}", f"cre-{i}", defs.LinkTypes.Contains.value)
+        for i in range(1, cre_count)
+    ]
+    for _ in range(int(cre_count * related_ratio)):
+        a, b = rand.sample(range(cre_count), 2)
+        internal_links.append((f"cre-{a}", f"cre-{b}", defs.LinkTypes.Related.value))
+
+    nodes = []
+    cre_node_links = []
+    for s in range(standard_count):
+        for section in range(section_count):
+            node_id = f"node-{s}-{section}"
+            nodes.append(
+                (
+                    node_id,
+                    defs.Standard(name=f"standard {s}", section=f"section {section}"),
+                )
+            )
+            for cre in rand.sample(range(cre_count), rand.randint(1, 3)):
+                cre_node_links.append(
+                    (f"cre-{cre}", node_id, defs.LinkTypes.LinkedTo.value)
+                )
+    return cres, nodes, cre_node_links, internal_links
+
+
+def populate_neo4j(cres, nodes, cre_node_links, internal_links) -> None:
+    neo_db = db.NEO_DB.instance()
+    for cre_id, cre in cres:
+        neo_db.add_cre(
+            db.CRE(
+                id=cre_id, external_id=cre.id, name=cre.name, description="", tags=""
+            )
+        )
+    for node_id, node in nodes:
+        neo_db.add_dbnode(
+            db.Node(
+                id=node_id,
+                name=node.name,
+                ntype=node.doctype.value,
+                section=node.section,
+                section_id="",
+                description="",
+                tags="",
+            )
+        )
+    for group, cre, ltype in internal_links:
+        neo_db.link_CRE_to_CRE(group, cre, ltype)
+    for cre, node, ltype in cre_node_links:
+        neo_db.link_CRE_to_Node(cre, node, ltype)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cres", type=int, default=2000)
+    parser.add_argument("--standards", type=int, default=10)
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--related-ratio", type=float, default=0.05)
+    parser.add_argument("--neo4j", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger("application.database.inmemory_gap_analysis").setLevel(
+        logging.WARNING
+    )
+
+    cres, nodes, cre_node_links, internal_links = make_dataset(
+        args.cres, args.standards, args.sections, args.related_ratio
+    )
+
+    t0 = time.perf_counter()
+    ga_graph = Gap_Analysis_Graph(
+        cres=cres,
+        nodes=nodes,
+        cre_node_links=cre_node_links,
+        internal_links=internal_links,
+    )
+    print(f"built the gap analysis graph in {time.perf_counter() - t0:.2f} seconds")
+
+    t0 = time.perf_counter()
+    _, paths = ga_graph.gap_analysis("standard 0", "standard 1")
+    print(
+        f"in memory: standard 0 >> standard 1, {len(paths)} paths in {time.perf_counter() - t0:.2f} seconds"
+    )
+    t0 = time.perf_counter()
+    pairs = 0
+    for name_1 in ga_graph.standards():
+        for name_2 in ga_graph.standards():
+            if name_1 != name_2:
+                ga_graph.gap_analysis(name_1, name_2)
+                pairs += 1
+    print(f"in memory: all {pairs} pairs in {time.perf_counter() - t0:.2f} seconds")
+    t0 = time.perf_counter()
+    for name_1 in ga_graph.standards():
+        ga_graph.gap_analyses_from(name_1)
+    print(
+        f"in memory batch: all {pairs} pairs in {time.perf_counter() - t0:.2f} seconds"
+    )
+
+    if args.neo4j:
+        t0 = time.perf_counter()
+        populate_neo4j(cres, nodes, cre_node_links, internal_links)
+        print(f"populated neo4j in {time.perf_counter() - t0:.2f} seconds")
+        t0 = time.perf_counter()
+        _, paths = db.NEO_DB.gap_analysis("standard 0", "standard 1")
+        print(
+            f"neo4j: standard 0 >> standard 1, {len(paths)} paths in {time.perf_counter() - t0:.2f} seconds"
+        )
+
+
+if __name__ == "__main__":
+    main()
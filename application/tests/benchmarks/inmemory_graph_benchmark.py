@@ -0,0 +1,85 @@
+"""
+Imports a synthetic CRE hierarchy into the in memory graph and reports how long it takes.
+Not part of the test suite, run with:
+    python -m application.tests.benchmarks.inmemory_graph_benchmark [--cres 10000]
+"""
+
+import argparse
+import logging
+import random
+import time
+from typing import List
+
+import networkx as nx
+
+from application.database.inmemory_graph import CRE_Graph, CycleDetectedError
+from application.defs import cre_defs as defs
+
+
+def make_hierarchy(
+    cre_count: int, branching: int, related_ratio: float
+) -> List[defs.CRE]:
+    """a tree of cre_count CREs (each one contains up to branching children) plus some Related cross links"""
+    rand = random.Random(42)
+    cres = [
+        defs.CRE(name=f"cre {i}", id=f"{i // 1000:03}-{i % 1000:03}")
+        for i in range(cre_count)
+    ]
+    for i in range(1, cre_count):
+        parent = cres[(i - 1) // branching]
+        parent.add_link(
+            defs.Link(ltype=defs.LinkTypes.Contains, document=cres[i].shallow_copy())
+        )
+        cres[i].add_link(
+            defs.Link(ltype=defs.LinkTypes.PartOf, document=parent.shallow_copy())
+        )
+    for _ in range(int(cre_count * related_ratio)):
+        a, b = rand.sample(range(cre_count), 2)
+        if not cres[a].has_link(
+            defs.Link(ltype=defs.LinkTypes.Related, document=cres[b])
+        ):
+            cres[a].add_link(
+                defs.Link(ltype=defs.LinkTypes.Related, document=cres[b].shallow_copy())
+            )
+    return cres
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cres", type=int, default=10000)
+    parser.add_argument("--branching", type=int, default=8)
+    parser.add_argument("--related-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    # every rejected link is logged as a warning
+    logging.getLogger("application.database.inmemory_graph").setLevel(logging.ERROR)
+
+    cres = make_hierarchy(args.cres, args.branching, args.related_ratio)
+    links = sum(len(c.links) for c in cres)
+
+    t0 = time.perf_counter()
+    graph = CRE_Graph()
+    graph.with_graph(graph=nx.DiGraph(), graph_data=cres)
+    load_time = time.perf_counter() - t0
+    print(
+        f"loaded {args.cres} CREs with {links} links "
+        f"({len(graph.get_raw_graph().edges)} edges) in {load_time:.2f} seconds"
+    )
+
+    # every leaf containing the root closes a cycle through the whole depth of the tree
+    leaves = [c for c in cres if len(c.links) == 1][:1000]
+    rejected = 0
+    t0 = time.perf_counter()
+    for leaf in leaves:
+        try:
+            graph.add_link(
+                leaf, defs.Link(ltype=defs.LinkTypes.Contains, document=cres[0])
+            )
+        except CycleDetectedError:
+            rejected += 1
+    print(
+        f"rejected {rejected}/{len(leaves)} cycle introducing links in {time.perf_counter() - t0:.2f} seconds"
+    )
+
+
+if __name__ == "__main__":
+    main()
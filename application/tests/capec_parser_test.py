@@ -77,6 +77,18 @@ class TestCapecParser(unittest.TestCase):
             self.assertEqual(len(nodes), 2)
             self.assertCountEqual(nodes[0].todict(), expected[0].todict())
             self.assertCountEqual(nodes[1].todict(), expected[1].todict())
+            self.assertCountEqual(
+                [link.document.id for link in nodes[0].links],
+                [link.document.id for link in expected[0].links],
+            )
+
+        # parsing alone needs no database
+        parsed = capec_parser.Capec().parse_documents()
+        self.assertEqual(
+            [str(reference) for _, reference in parsed.references][:3],
+            ["CWE:276", "CWE:285", "CWE:434"],
+        )
+        self.assertEqual(parsed.results["CAPEC"][0].links, [])
 
     capec_xml = """<?xml version="1.0" encoding="UTF-8"?>
 <Attack_Pattern_Catalog xmlns="http://capec.mitre.org/capec-3"
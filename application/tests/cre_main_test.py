@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 import shutil
@@ -12,10 +13,11 @@ from application.prompt_client import prompt_client as prompt_client
 from application.tests.utils import data_gen
 from application import create_app, sqla  # type: ignore
 from application.cmd import cre_main as main
-from application.database import db
+from application.database import db, inmemory_graph
 from application.defs import cre_defs as defs
 from application.defs import osib_defs as odefs
 from application.defs.osib_defs import Osib_id, Osib_tree
+from application.utils import gap_analysis
 
 
 class TestMain(unittest.TestCase):
@@ -402,6 +404,243 @@ class TestMain(unittest.TestCase):
         )
         self.assertCountEqual(res, expected)
 
+    @patch.object(redis, "connect")
+    def test_register_standard_in_batches(self, mock_redis_connect) -> None:
+        def entries() -> List[defs.Node]:
+            cres = [
+                defs.CRE(id=f"111-11{i}", name=f"cre{i}", description="")
+                for i in range(3)
+            ]
+            asvs = [
+                defs.Standard(
+                    name="ASVS",
+                    section=f"section{i}",
+                    sectionID=f"V{i}",
+                    hyperlink=f"https://example.com/{i}",
+                    links=[
+                        defs.Link(document=cres[i % 3], ltype=defs.LinkTypes.LinkedTo),
+                        defs.Link(document=cres[0], ltype=defs.LinkTypes.LinkedTo),
+                    ],
+                )
+                for i in range(5)
+            ]
+            # the same section again, with another link, and a section linking another standard
+            asvs.append(
+                defs.Standard(
+                    name="ASVS",
+                    section="section1",
+                    sectionID="V1",
+                    hyperlink="https://example.com/new",
+                    links=[defs.Link(document=cres[2], ltype=defs.LinkTypes.Related)],
+                )
+            )
+            asvs.append(
+                defs.Standard(
+                    name="ASVS",
+                    section="section5",
+                    links=[
+                        defs.Link(
+                            document=defs.Standard(name="CWE", sectionID="79"),
+                            ltype=defs.LinkTypes.LinkedTo,
+                        )
+                    ],
+                )
+            )
+            tool = defs.Tool(
+                name="ASVS",
+                tooltype=defs.ToolTypes.Offensive,
+                section="tool",
+                embeddings=[0.1, 0.2],
+                embeddings_text="tool",
+                embeddings_model="fake-2",
+                links=[
+                    defs.Link(
+                        document=cres[1], ltype=defs.LinkTypes.AutomaticallyLinkedTo
+                    )
+                ],
+            )
+            return cres, asvs + [tool, tool]
+
+        def state() -> Dict[str, Any]:
+            nodes = {n.id: db.node_key(n) + (n.ntype, n.link) for n in db.Node.query}
+            cres = {c.id: c.external_id for c in db.CRE.query}
+            return {
+                "nodes": sorted(nodes.values()),
+                "links": sorted(
+                    (cres[l.cre], nodes[l.node], l.type) for l in db.Links.query
+                ),
+                "embeddings": sorted(
+                    (nodes[e.node_id], e.embeddings_content, e.embeddings_model)
+                    for e in db.Embeddings.query
+                ),
+            }
+
+        states = []
+        for batch_size in (0, 2):
+            sqla.session.remove()
+            sqla.drop_all()
+            sqla.create_all()
+            collection = db.Node_collection()
+            cres, standard = entries()
+            dbcres = [collection.add_cre(cre) for cre in cres]
+            collection.add_link(
+                dbcres[2],
+                collection.add_node(defs.Standard(name="CWE", sectionID="79")),
+                ltype=defs.LinkTypes.LinkedTo,
+            )
+            with patch.object(main, "IMPORT_BATCH_SIZE", batch_size):
+                for _ in range(2):
+                    main.register_standard(
+                        standard,
+                        collection=collection,
+                        generate_embeddings=False,
+                        calculate_gap_analysis=False,
+                    )
+            states.append(state())
+
+        self.assertEqual(len(states[0]["nodes"]), 8)
+        self.assertIn(
+            ("ASVS", "section1", "", "", "V1", "Standard", "https://example.com/new"),
+            states[0]["nodes"],
+        )
+        self.assertEqual(states[0], states[1])
+
+    def test_register_nodes_unknown_cre(self) -> None:
+        cre = defs.CRE(id="111-110", name="cre0", description="")
+        self.collection.add_cre(cre)
+        nodes = [
+            defs.Standard(
+                name="ASVS",
+                section="section0",
+                links=[defs.Link(document=cre, ltype=defs.LinkTypes.LinkedTo)],
+            ),
+            defs.Standard(
+                name="ASVS",
+                section="section1",
+                links=[
+                    defs.Link(
+                        document=defs.CRE(id="111-119", name="missing"),
+                        ltype=defs.LinkTypes.LinkedTo,
+                    )
+                ],
+            ),
+        ]
+        with self.assertRaises(ValueError):
+            main.register_nodes(nodes, self.collection)
+        # nothing written, not even the entry before
+        self.assertEqual(self.collection.get_nodes(name="ASVS"), [])
+        # as register_node does
+        with self.assertRaises(IndexError):
+            main.register_node(nodes[1], self.collection)
+
+    def test_register_cres(self) -> None:
+        def hierarchy() -> List[defs.CRE]:
+            root = defs.CRE(id="111-000", name="root", description="r", tags=["t"])
+            child = defs.CRE(id="111-001", name="child")
+            grandchild = defs.CRE(id="111-002", name="grandchild")
+            other = defs.CRE(id="111-003", name="other")
+            root.add_link(
+                defs.Link(document=child.shallow_copy(), ltype=defs.LinkTypes.Contains)
+            )
+            child.add_link(
+                defs.Link(
+                    document=grandchild.shallow_copy(), ltype=defs.LinkTypes.Contains
+                )
+            )
+            grandchild.add_link(
+                defs.Link(document=other.shallow_copy(), ltype=defs.LinkTypes.Related)
+            )
+            # closes the cycle root > child > grandchild > root
+            grandchild.add_link(
+                defs.Link(document=root.shallow_copy(), ltype=defs.LinkTypes.Contains)
+            )
+            other.add_link(
+                defs.Link(document=root.shallow_copy(), ltype=defs.LinkTypes.PartOf)
+            )
+            # known already, with a description now
+            child.description = "c"
+            return [root, child, grandchild, other]
+
+        def state() -> Dict[str, Any]:
+            cres = {c.id: c.external_id for c in db.CRE.query}
+            return {
+                "cres": sorted(
+                    (c.external_id, c.name, c.description, c.tags) for c in db.CRE.query
+                ),
+                "links": sorted(
+                    (cres[l.group], cres[l.cre], l.type) for l in db.InternalLinks.query
+                ),
+            }
+
+        states = []
+        for register in (
+            lambda cres, collection: [main.register_cre(c, collection) for c in cres],
+            main.register_cres,
+        ):
+            sqla.session.remove()
+            sqla.drop_all()
+            sqla.create_all()
+            inmemory_graph.Singleton_Graph_Storage.instance().clear()
+            collection = db.Node_collection()
+            collection.add_cre(defs.CRE(id="111-001", name="child"))
+            register(hierarchy(), collection)
+            register(hierarchy(), collection)
+            states.append(state())
+
+        self.assertEqual(len(states[0]["cres"]), 4)
+        self.assertIn(("111-001", "child", "c", ""), states[0]["cres"])
+        self.assertNotIn(("111-002", "111-000", "Contains"), states[0]["links"])
+        self.assertEqual(states[0], states[1])
+
+    def test_recalculate_gap_analyses(self) -> None:
+        inmemory_graph.Singleton_Graph_Storage.instance().clear()
+        collection = self.collection.with_graph()
+        a, b = [
+            collection.add_cre(defs.CRE(id=f"940-00{i}", name=name))
+            for i, name in enumerate(["a", "b"])
+        ]
+        for name, cre in [("sx", a), ("sy", b)]:
+            collection.add_link(
+                cre=cre,
+                node=collection.add_node(defs.Standard(name=name, section="1")),
+                ltype=defs.LinkTypes.LinkedTo,
+            )
+        key = gap_analysis.make_resources_key(["sx", "sy"])
+
+        def paths() -> Dict[str, Any]:
+            result = json.loads(collection.get_gap_analysis_result(key))["result"]
+            return {k: v["paths"] for k, v in result.items()}
+
+        with patch.dict(os.environ, {"CRE_GAP_ANALYSIS_BACKEND": "inmemory"}):
+            db.gap_analysis_batch(sources=["sx"], targets=["sy"], cre_db=collection)
+            self.assertFalse(any(paths().values()))
+
+            collection.add_internal_link(a, b, ltype=defs.LinkTypes.Related)
+            self.assertFalse(collection.gap_analysis_exists(key))
+            main.recalculate_gap_analyses(collection)
+
+        self.assertTrue(all(paths().values()))
+        self.assertEqual([], collection.pop_invalidated_gap_analyses())
+
+    @patch.object(gap_analysis, "schedule")
+    @patch.object(main, "populate_neo4j_db")
+    @patch.object(redis, "connect")
+    def test_recalculate_gap_analyses_schedules_jobs(
+        self, redis_conn_mock, populate_mock, schedule_mock
+    ) -> None:
+        schedule_mock.return_value = {"job_id": "ABC"}
+        self.collection.invalidated_gap_analyses = {"x >> y", "y >> x"}
+        self.collection.add_gap_analysis_result("y >> x", '{"result": {}}')
+
+        main.recalculate_gap_analyses(self.collection, db_connection_str="db")
+
+        populate_mock.assert_called_once_with("db")
+        # the stale job that calculated the result is forgotten before scheduling it again
+        redis_conn_mock.return_value.delete.assert_called_once_with("x >> y")
+        schedule_mock.assert_called_once_with(
+            standards=["x", "y"], database=self.collection
+        )
+
     @patch.object(main, "db_connect")
     @patch.object(Queue, "enqueue_call")
     @patch.object(redis, "connect")
@@ -1,5 +1,9 @@
 import networkx as nx
-from application.utils.gap_analysis import make_resources_key, make_subresources_key
+from application.utils.gap_analysis import (
+    get_path_score,
+    make_resources_key,
+    make_subresources_key,
+)
 import string
 import random
 import os
@@ -16,7 +20,7 @@ from flask import json as flask_json
 import yaml
 from application.tests.utils.data_gen import export_format_data
 from application import create_app, sqla  # type: ignore
-from application.database import db
+from application.database import db, embedding_index, inmemory_graph
 from application.defs import cre_defs as defs
 
 
@@ -892,6 +896,37 @@ class TestDB(unittest.TestCase):
             (None, None, None),
         )
 
+    def test_get_nodes_batched_links(self) -> None:
+        """Given: many sections of a Standard each linked to a different CRE,
+        resolving their links in IN batches smaller than the result set
+        returns the same documents as resolving them one by one"""
+        collection = db.Node_collection().with_graph()
+        expected = []
+        for i in range(0, 7):
+            cre = defs.CRE(name=f"BNC{i}", id=f"01{i}-01{i}")
+            dbcre = collection.add_cre(cre)
+            section = defs.Standard(name="BNS", sectionID=f"{i}", section=f"S{i}")
+            dbnode = collection.add_node(section)
+            collection.add_link(cre=dbcre, node=dbnode, ltype=defs.LinkTypes.LinkedTo)
+            expected.append(
+                copy(section).add_link(
+                    defs.Link(document=cre, ltype=defs.LinkTypes.LinkedTo)
+                )
+            )
+
+        with patch.object(db, "IN_QUERY_BATCH_SIZE", 2):
+            self.assertCountEqual(expected, collection.get_nodes(name="BNS"))
+
+            _, res, _ = collection.get_nodes_with_pagination(
+                name="BNS", page=1, items_per_page=5, include_only=["BNC3", "016-016"]
+            )
+            self.assertEqual(len(res), 5)
+            for node in res:
+                if node.sectionID == "3":
+                    self.assertEqual([l.document.id for l in node.links], ["013-013"])
+                else:
+                    self.assertEqual(node.links, [])
+
     def test_add_internal_link(self) -> None:
         """test that internal links are added successfully,
         edge cases:
@@ -1045,6 +1080,103 @@ class TestDB(unittest.TestCase):
             res = self.collection.text_search(k)
             self.assertCountEqual(res, val)
 
+    def test_full_text_search(self) -> None:
+        self.maxDiff = None
+        collection = db.Node_collection()
+        cre = defs.CRE(id="123-457", name="ftsCRE", description="authentication")
+        dbcre = collection.add_cre(cre)
+        standards = []
+        for i in range(5):
+            standards.append(
+                defs.Standard(
+                    name="ftsStandard",
+                    section=f"authentication {i}",
+                    subsection="verify authentication " * i,
+                )
+            )
+            dbnode = collection.add_node(standards[i])
+        collection.add_link(cre=dbcre, node=dbnode, ltype=defs.LinkTypes.LinkedTo)
+        standards[4].add_link(
+            defs.Link(ltype=defs.LinkTypes.LinkedTo, document=cre.shallow_copy())
+        )
+        cre.add_link(
+            defs.Link(
+                ltype=defs.LinkTypes.LinkedTo, document=standards[4].shallow_copy()
+            )
+        )
+
+        # words are prefix matched, documents have to match all of them
+        res, total_pages = collection.full_text_search("auth")
+        self.assertCountEqual(res, standards + [cre])
+        self.assertEqual(1, total_pages)
+        res, _ = collection.full_text_search("verify auth")
+        self.assertCountEqual(res, standards[1:])
+        self.assertEqual([], collection.full_text_search("auth missing")[0])
+        self.assertEqual([], collection.full_text_search("+-*")[0])
+
+        # ranked, best match first, and paginated
+        res, total_pages = collection.full_text_search(
+            "verify", page=1, items_per_page=3
+        )
+        self.assertEqual(2, total_pages)
+        self.assertEqual(standards[4], res[0])
+        self.assertEqual(3, len(res))
+        res2, _ = collection.full_text_search("verify", page=2, items_per_page=3)
+        self.assertCountEqual(res + res2, standards[1:])
+        # without items_per_page everything is on the first page
+        self.assertEqual(([], 1), collection.full_text_search("verify", page=2))
+
+        # the index follows updates and deletes
+        collection.session.query(db.CRE).filter(db.CRE.id == dbcre.id).update(
+            {db.CRE.description: "lorem ipsum"}
+        )
+        self.assertEqual([], collection.text_search("authentication ftsCRE"))
+        self.assertEqual(
+            ["ftsCRE"], [d.name for d in collection.text_search("lorem ftsCRE")]
+        )
+        collection.delete_nodes("ftsStandard")
+        self.assertEqual([], collection.text_search("verify"))
+
+    def test_full_text_search_after_vacuum(self) -> None:
+        """Given: documents deleted and the database vacuumed, which may renumber the rowids of the tables
+        the search still returns the documents that match"""
+        collection = db.Node_collection()
+        for i in range(5):
+            collection.add_node(
+                defs.Standard(name="vacuumStandard", section=f"section{i}")
+            )
+        collection.delete_nodes("BarStand")
+        collection.delete_nodes("Unlinked")
+        collection.session.query(db.Node).filter(
+            db.Node.section.in_(["section0", "section1"])
+        ).delete(synchronize_session=False)
+        collection.session.commit()
+        with sqla.engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+
+        for i in range(2, 5):
+            self.assertEqual(
+                [f"section{i}"],
+                [d.section for d in collection.text_search(f"section{i}")],
+            )
+        self.assertEqual([], collection.text_search("section0"))
+
+    def test_text_search_free_text_skips_structured_search(self) -> None:
+        """free text without a document type prefix goes straight to the full text search"""
+        collection = db.Node_collection()
+        collection.add_node(
+            defs.Standard(name="XSS", section="cross site scripting prevention")
+        )
+        with patch.object(
+            db.Node_collection, "get_nodes", wraps=collection.get_nodes
+        ) as get_nodes:
+            self.assertEqual(
+                ["XSS"],
+                [d.name for d in collection.text_search("cross site scripting")],
+            )
+            self.assertEqual([], collection.text_search("Standardization"))
+            get_nodes.assert_not_called()
+
     def test_dbNodeFromNode(self) -> None:
         data = {
             "tool": defs.Tool(
@@ -1252,6 +1384,202 @@ class TestDB(unittest.TestCase):
         self.maxDiff = None
         self.assertCountEqual(root_cres, [cres[0], cres[1], cres[7]])
 
+    def test_get_CREs_batched_links(self):
+        """Given: a chain of CREs, each one linked to a standard section,
+        resolving their links in IN batches smaller than the result set
+        returns the same documents as resolving them one by one"""
+        collection = db.Node_collection().with_graph()
+        dbcres = []
+        for i in range(0, 7):
+            dbcres.append(
+                collection.add_cre(defs.CRE(name=f"BC{i}", id=f"00{i}-00{i}"))
+            )
+            dbnode = collection.add_node(defs.Standard(name="BS", section=f"S{i}"))
+            collection.add_link(
+                cre=dbcres[i], node=dbnode, ltype=defs.LinkTypes.LinkedTo
+            )
+            if i > 0:
+                collection.add_internal_link(
+                    higher=dbcres[i - 1], lower=dbcres[i], ltype=defs.LinkTypes.Contains
+                )
+
+        expected = [collection.get_CREs(external_id=c.external_id)[0] for c in dbcres]
+        with patch.object(db, "IN_QUERY_BATCH_SIZE", 2):
+            res = collection.get_CREs(name="BC%", partial=True)
+            self.assertCountEqual(expected, res)
+            self.assertEqual(expected[3], collection.get_cre_by_db_id(dbcres[3].id))
+
+            filtered = collection.get_CREs(
+                name="BC%", partial=True, include_only=["not-linked"]
+            )
+            self.assertEqual(
+                [len(c.links) for c in filtered],
+                [1 if c.id in ("000-000", "006-006") else 2 for c in filtered],
+            )
+
+    def test_with_graph_bulk_load_and_snapshot(self):
+        """Given: the setUp data plus related and node links,
+        the graph built from bulk queries matches the one built from every hydrated cre
+        and is stored in and reloaded from a snapshot until the database changes"""
+        collection = self.collection
+        dbrelated = collection.add_cre(defs.CRE(id="111-002", name="Related"))
+        collection.add_internal_link(
+            higher=dbrelated, lower=self.dbcre, ltype=defs.LinkTypes.Related
+        )
+        dbtool = collection.add_node(defs.Tool(name="GraphTool", section="t"))
+        collection.add_link(
+            cre=dbrelated, node=dbtool, ltype=defs.LinkTypes.AutomaticallyLinkedTo
+        )
+
+        expected = nx.DiGraph()
+        inmemory_graph.CRE_Graph().with_graph(
+            graph=expected,
+            graph_data=[
+                collection.get_cre_by_db_id(c.id)
+                for c in collection.session.query(db.CRE).all()
+            ],
+        )
+        singleton = inmemory_graph.Singleton_Graph_Storage.instance()
+        snapshot_dir = tempfile.mkdtemp()
+        with patch.dict(os.environ, {"CRE_GRAPH_SNAPSHOT_DIR": snapshot_dir}):
+            singleton.clear()
+            graph = db.Node_collection().with_graph().graph.get_raw_graph()
+            self.assertEqual(
+                dict(expected.nodes(data=True)), dict(graph.nodes(data=True))
+            )
+            self.assertCountEqual(expected.edges(data=True), graph.edges(data=True))
+            snapshots = os.listdir(snapshot_dir)
+            self.assertEqual(1, len(snapshots))
+
+            singleton.clear()
+            with patch.object(
+                db.Node_collection, "_Node_collection__get_graph_edges"
+            ) as edges_mock:
+                graph = db.Node_collection().with_graph().graph.get_raw_graph()
+                edges_mock.assert_not_called()
+            self.assertEqual(
+                dict(expected.nodes(data=True)), dict(graph.nodes(data=True))
+            )
+            self.assertCountEqual(expected.edges(data=True), graph.edges(data=True))
+
+            collection.add_cre(defs.CRE(id="111-003", name="New"))
+            singleton.clear()
+            graph = db.Node_collection().with_graph().graph.get_raw_graph()
+            self.assertIn("CRE: 111-003", graph.nodes)
+            self.assertEqual(1, len(os.listdir(snapshot_dir)))
+            self.assertNotEqual(snapshots, os.listdir(snapshot_dir))
+        singleton.clear()
+
+    def test_inmemory_index_matches_db(self):
+        """Given: the setUp data, every read served by the in memory index
+        returns the same documents as the equivalent sql query"""
+        sql = db.Node_collection()
+        indexed = db.Node_collection().with_index()
+        indexed.index.invalidate()
+
+        self.assertEqual(
+            sql.get_CREs(external_id="111-000"), indexed.get_CREs(external_id="111-000")
+        )
+        self.assertEqual(sql.get_CREs(name="crename"), indexed.get_CREs(name="crename"))
+        self.assertEqual(
+            sql.get_CREs(external_id="111-000", include_only=["nothing"]),
+            indexed.get_CREs(external_id="111-000", include_only=["nothing"]),
+        )
+        self.assertEqual(
+            sql.get_CREs(internal_id=self.dbcre.id),
+            indexed.get_CREs(internal_id=self.dbcre.id),
+        )
+        self.assertEqual([], indexed.get_CREs(external_id="999-999"))
+        self.assertCountEqual(sql.get_root_cres(), indexed.get_root_cres())
+        self.assertCountEqual(sql.standards(), indexed.standards())
+        self.assertEqual(
+            sql.all_cres_with_pagination(page=1, per_page=2),
+            indexed.all_cres_with_pagination(page=1, per_page=2),
+        )
+        self.assertEqual(
+            sql.get_nodes(name="barstand", section="foostand"),
+            indexed.get_nodes(name="barstand", section="foostand"),
+        )
+        self.assertEqual(
+            sql.get_nodes(name="BarStand", include_only=["111-001"]),
+            indexed.get_nodes(name="BarStand", include_only=["111-001"]),
+        )
+        self.assertEqual(
+            sql.get_nodes_with_pagination(name="BarStand")[:2],
+            indexed.get_nodes_with_pagination(name="BarStand")[:2],
+        )
+        self.assertEqual(
+            (None, None, None), indexed.get_nodes_with_pagination(name="missing")
+        )
+
+    def test_inmemory_index_matches_db_edge_cases(self):
+        """Given: a CRE that is the group of a legacy "Is Part Of" link and a "Related" link
+        the root CREs, unfiltered node lookups and missing CREs are the same on both backends
+        """
+        collection = self.collection
+        dbpart = collection.add_cre(defs.CRE(id="111-002", name="PartOfGroup"))
+        dbrelated = collection.add_cre(defs.CRE(id="111-003", name="Related"))
+        collection.session.add(
+            db.InternalLinks(
+                group=dbpart.id, cre=self.dbcre.id, type=defs.LinkTypes.PartOf.value
+            )
+        )
+        collection.session.commit()
+        collection.add_internal_link(
+            higher=dbrelated, lower=self.dbcre, ltype=defs.LinkTypes.Related
+        )
+
+        sql = db.Node_collection()
+        indexed = db.Node_collection().with_index()
+        indexed.index.invalidate()
+
+        self.assertCountEqual(
+            [c.id for c in sql.get_root_cres()],
+            [c.id for c in indexed.get_root_cres()],
+        )
+        self.assertNotIn("111-002", [c.id for c in indexed.get_root_cres()])
+        self.assertEqual(
+            sql.get_CREs(external_id="111-000"), indexed.get_CREs(external_id="111-000")
+        )
+        self.assertEqual(
+            sql.get_CREs(external_id="111-002"), indexed.get_CREs(external_id="111-002")
+        )
+        for backend in (sql, indexed):
+            with self.assertRaises(ValueError):
+                backend.get_nodes()
+            with self.assertRaises(ValueError):
+                backend.get_nodes_with_pagination(name=None)
+        with self.assertLogs(db.logger, level="WARNING"):
+            self.assertEqual([], indexed.get_CREs(name="missing"))
+
+    def test_inmemory_index_invalidated_on_write(self):
+        indexed = db.Node_collection().with_index()
+        indexed.index.invalidate()
+        generation = indexed.get_generation()
+
+        self.assertEqual([], indexed.get_CREs(name="NewCRE"))
+        self.assertEqual(generation, indexed.index.generation)
+
+        cre = indexed.add_cre(defs.CRE(id="222-222", name="NewCRE"))
+        self.assertFalse(indexed.index.is_loaded())
+        self.assertEqual(generation + 1, indexed.get_generation())
+
+        node = indexed.add_node(defs.Standard(name="NewStandard", section="1"))
+        indexed.add_link(cre=cre, node=node, ltype=defs.LinkTypes.LinkedTo)
+        self.assertEqual(generation + 3, indexed.get_generation())
+
+        found = indexed.get_CREs(name="NewCRE")
+        self.assertEqual(1, len(found))
+        self.assertEqual("NewStandard", found[0].links[0].document.name)
+        self.assertIn("NewStandard", indexed.standards())
+
+        # an unchanged entry does not bump the generation
+        indexed.add_cre(defs.CRE(id="222-222", name="NewCRE"))
+        self.assertEqual(generation + 3, indexed.get_generation())
+
+        indexed.delete_nodes("NewStandard")
+        self.assertNotIn("NewStandard", indexed.standards())
+
     @patch.object(db.NEO_DB, "gap_analysis")
     def test_gap_analysis_disconnected(self, gap_mock):
         collection = db.Node_collection()
@@ -1341,6 +1669,300 @@ class TestDB(unittest.TestCase):
             db.gap_analysis(collection.neo_db, ["788-788", "788-789"]), expected
         )
 
+    def test_gap_analysis_inmemory(self) -> None:
+        collection = self.collection
+        top, a, b, c, denied = [
+            collection.add_cre(defs.CRE(id=f"900-00{i}", name=name))
+            for i, name in enumerate(["top", "a", "b", "c", "Cross-cutting concerns"])
+        ]
+        collection.add_internal_link(top, a, ltype=defs.LinkTypes.Contains)
+        collection.add_internal_link(top, b, ltype=defs.LinkTypes.Contains)
+        collection.add_internal_link(a, c, ltype=defs.LinkTypes.Related)
+        sections = {}
+        for name, section, cres in [
+            ("sa", "a1", [a, denied]),
+            ("sa", "a2", [c]),
+            ("sb", "b1", [a]),
+            ("sb", "b2", [b]),
+            ("sb", "b3", [denied]),
+        ]:
+            sections[section] = defs.Standard(name=name, section=section)
+            dbnode = collection.add_node(sections[section])
+            for cre in cres:
+                collection.add_link(cre=cre, node=dbnode, ltype=defs.LinkTypes.LinkedTo)
+
+        base_standard, paths = collection.gap_analysis_graph().gap_analysis("sa", "sb")
+        self.assertCountEqual(
+            [s.id for s in base_standard], [sections["a1"].id, sections["a2"].id]
+        )
+        self.assertCountEqual(
+            [(p["start"].section, p["end"].section, get_path_score(p)) for p in paths],
+            [("a1", "b1", 0), ("a1", "b2", 3), ("a2", "b1", 2), ("a2", "b2", 5)],
+        )
+        a1_b2 = [
+            p for p in paths if (p["start"].section, p["end"].section) == ("a1", "b2")
+        ][0]
+        self.assertEqual(
+            [
+                (s["start"].name, s["end"].name, s["relationship"])
+                for s in a1_b2["path"]
+            ],
+            [
+                ("a", "sa", "LINKED_TO"),
+                ("top", "a", "CONTAINS"),
+                ("top", "b", "CONTAINS"),
+                ("b", "sb", "LINKED_TO"),
+            ],
+        )
+
+        with patch.dict(os.environ, {"CRE_GAP_ANALYSIS_BACKEND": "inmemory"}):
+            _, grouped_paths, extra_paths = db.gap_analysis(None, ["sa", "sb"])
+        a1 = sections["a1"].id
+        self.assertEqual(list(grouped_paths[a1]["paths"]), [sections["b1"].id])
+        self.assertEqual(list(extra_paths[a1]["paths"]), [sections["b2"].id])
+        self.assertTrue(
+            collection.gap_analysis_exists(make_resources_key(["sa", "sb"]))
+        )
+
+        # the graph is rebuilt once the database changes
+        graph = collection.gap_analysis_graph()
+        with patch.object(db.Node_collection, "content_hash") as content_hash:
+            # the content is not checked again before INDEX_GENERATION_CHECK_INTERVAL
+            self.assertIs(graph, collection.gap_analysis_graph())
+            content_hash.assert_not_called()
+        collection.add_link(
+            cre=b,
+            node=collection.add_node(sections["a2"]),
+            ltype=defs.LinkTypes.LinkedTo,
+        )
+        self.assertIsNot(graph, collection.gap_analysis_graph())
+
+        # changes made by other processes are noticed once the interval passed
+        graph = collection.gap_analysis_graph()
+        collection.session.add(db.CRE(external_id="910-009", name="other process"))
+        collection.session.commit()
+        self.assertIs(graph, collection.gap_analysis_graph())
+        with patch.object(db, "INDEX_GENERATION_CHECK_INTERVAL", 0):
+            self.assertIsNot(graph, collection.gap_analysis_graph())
+
+    def test_gap_analysis_batch(self) -> None:
+        collection = self.collection
+        top, a, b = [
+            collection.add_cre(defs.CRE(id=f"910-00{i}", name=name))
+            for i, name in enumerate(["top", "a", "b"])
+        ]
+        collection.add_internal_link(top, a, ltype=defs.LinkTypes.Contains)
+        collection.add_internal_link(top, b, ltype=defs.LinkTypes.Contains)
+        for name, section, cre in [
+            ("s1", "1", a),
+            ("s1", "2", b),
+            ("s2", "1", a),
+            ("s3", "1", b),
+        ]:
+            collection.add_link(
+                cre=cre,
+                node=collection.add_node(defs.Standard(name=name, section=section)),
+                ltype=defs.LinkTypes.LinkedTo,
+            )
+
+        standards = ["s1", "s2", "s3"]
+        self.assertEqual(
+            db.gap_analysis_batch(
+                sources=standards, targets=standards, cre_db=collection
+            ),
+            6,
+        )
+        batch_results = {
+            r.cache_key: r.ga_object
+            for r in collection.session.query(db.GapAnalysisResults).all()
+        }
+        self.assertIn(make_subresources_key(["s2", "s3"], "s2:1"), batch_results)
+
+        # same results as one gap analysis per pair
+        collection.session.query(db.GapAnalysisResults).delete()
+        with patch.dict(os.environ, {"CRE_GAP_ANALYSIS_BACKEND": "inmemory"}):
+            for source in standards:
+                for target in standards:
+                    if source != target:
+                        db.gap_analysis(None, [source, target])
+        self.assertEqual(
+            batch_results,
+            {
+                r.cache_key: r.ga_object
+                for r in collection.session.query(db.GapAnalysisResults).all()
+            },
+        )
+
+        self.assertEqual(
+            db.gap_analysis_batch(
+                sources=standards, targets=standards, cre_db=collection
+            ),
+            0,
+        )
+        self.assertEqual(
+            db.gap_analysis_batch(
+                sources=standards, targets=["s3"], overwrite=True, cre_db=collection
+            ),
+            2,
+        )
+
+    def test_gap_analysis_invalidation(self) -> None:
+        collection = self.collection
+        top, a, b, c = [
+            collection.add_cre(defs.CRE(id=f"920-00{i}", name=name))
+            for i, name in enumerate(["top", "a", "b", "c"])
+        ]
+        collection.add_internal_link(top, a, ltype=defs.LinkTypes.Contains)
+        collection.add_internal_link(top, b, ltype=defs.LinkTypes.Contains)
+        for name, cre in [("s1", a), ("s2", a), ("s3", b), ("s11", c)]:
+            collection.add_link(
+                cre=cre,
+                node=collection.add_node(defs.Standard(name=name, section="1")),
+                ltype=defs.LinkTypes.LinkedTo,
+            )
+        standards = ["s1", "s2", "s3", "s11"]
+
+        def main_keys():
+            return sorted(
+                r.cache_key
+                for r in collection.session.query(db.GapAnalysisResults).all()
+                if "->" not in r.cache_key
+            )
+
+        self.assertEqual(
+            db.gap_analysis_batch(
+                sources=standards, targets=standards, cre_db=collection
+            ),
+            12,
+        )
+
+        # only the results that start from or reach c
+        d = collection.add_cre(defs.CRE(id="920-004", name="d"))
+        collection.add_internal_link(c, d, ltype=defs.LinkTypes.Contains)
+        self.assertEqual(
+            main_keys(),
+            sorted(
+                make_resources_key([x, y])
+                for x in ["s1", "s2", "s3"]
+                for y in ["s1", "s2", "s3"]
+                if x != y
+            ),
+        )
+
+        # "s11" contains "s1" but is a different standard
+        self.assertEqual(
+            db.gap_analysis_batch(
+                sources=standards, targets=standards, cre_db=collection
+            ),
+            6,
+        )
+        collection.delete_gapanalysis_results_for("s1")
+        self.assertEqual(
+            main_keys(),
+            sorted(
+                make_resources_key([x, y])
+                for x in ["s2", "s3", "s11"]
+                for y in ["s2", "s3", "s11"]
+                if x != y
+            ),
+        )
+        for r in collection.session.query(db.GapAnalysisResults).all():
+            self.assertIn(r.cache_key.split("->")[0], main_keys())
+        self.assertEqual(
+            collection.session.query(db.GapAnalysisDependencies)
+            .filter(db.GapAnalysisDependencies.cache_key.startswith("s1 >> "))
+            .count(),
+            0,
+        )
+
+    def test_gap_analysis_invalidated_by_new_cre_link(self) -> None:
+        """Given: standard x linked to CRE a1, part of a, y linked to b1, part of b, u and v linked to unconnected CREs,
+        results for x <-> y stored without path dependencies
+        linking a and b invalidates the x <-> y results, which had no path before, but not u <-> v
+        """
+        collection = self.collection
+        for i, add in enumerate(
+            [
+                lambda higher, lower: collection.add_internal_link(
+                    higher, lower, ltype=defs.LinkTypes.Related
+                ),
+                lambda higher, lower: collection.add_internal_links(
+                    [(higher, lower, defs.LinkTypes.Related)]
+                ),
+            ]
+        ):
+            x, y, u, v = f"x{i}", f"y{i}", f"u{i}", f"v{i}"
+            a, a1, b, b1, c, d = [
+                collection.add_cre(defs.CRE(id=f"93{i}-00{j}", name=f"{name}{i}"))
+                for j, name in enumerate(["a", "a1", "b", "b1", "c", "d"])
+            ]
+            collection.add_internal_link(a, a1, ltype=defs.LinkTypes.Contains)
+            collection.add_internal_link(b, b1, ltype=defs.LinkTypes.Contains)
+            for name, cre in [(x, a1), (y, b1), (u, c), (v, d)]:
+                collection.add_link(
+                    cre=cre,
+                    node=collection.add_node(defs.Standard(name=name, section="1")),
+                    ltype=defs.LinkTypes.LinkedTo,
+                )
+            keys = [
+                make_resources_key(pair) for pair in ([x, y], [y, x], [u, v], [v, u])
+            ]
+            for key in keys:
+                collection.add_gap_analysis_result(
+                    cache_key=key, ga_object='{"result": {}}'
+                )
+            collection.pop_invalidated_gap_analyses()
+
+            add(a, b)
+            collection.session.commit()
+            self.assertEqual(
+                [collection.gap_analysis_exists(key) for key in keys],
+                [False, False, True, True],
+            )
+            self.assertEqual(collection.pop_invalidated_gap_analyses(), keys[:2])
+            self.assertEqual(collection.pop_invalidated_gap_analyses(), [])
+
+    def test_add_nodes_updates_nodes_added_meanwhile(self) -> None:
+        """Given: a section another process adds between add_nodes looking it up and inserting it,
+        and a stored gap analysis result of its standard
+        add_nodes updates its hyperlink like add_node and drops the result"""
+        collection = self.collection
+        for name in ["sa", "sb"]:
+            collection.add_node(
+                defs.Standard(name=name, section="s1", hyperlink="https://old")
+            )
+        key = make_resources_key(["sa", "sb"])
+        collection.add_gap_analysis_result(cache_key=key, ga_object="{}")
+
+        select_nodes = db.Node_collection._Node_collection__select_nodes
+        lookups = []
+
+        def select_nodes_meanwhile(self, dbnodes):
+            lookups.append(dbnodes)
+            # the first lookup is done before the other process added "sa"
+            return {} if len(lookups) == 1 else select_nodes(self, dbnodes)
+
+        with patch.object(
+            db.Node_collection,
+            "_Node_collection__select_nodes",
+            autospec=True,
+            side_effect=select_nodes_meanwhile,
+        ):
+            (dbnode,) = collection.add_nodes(
+                [defs.Standard(name="sa", section="s1", hyperlink="https://new")]
+            )
+        collection.session.commit()
+
+        self.assertEqual(dbnode.link, "https://new")
+        self.assertEqual(
+            [
+                (n.section, n.link)
+                for n in collection.session.query(db.Node).filter(db.Node.name == "sa")
+            ],
+            [("s1", "https://new")],
+        )
+        self.assertFalse(collection.gap_analysis_exists(key))
+
     @patch.object(db.NEO_DB, "gap_analysis")
     def test_gap_analysis_one_weak_link(self, gap_mock):
         collection = db.Node_collection()
@@ -2147,6 +2769,302 @@ class TestDB(unittest.TestCase):
         )
         self.assertEqual(tool_emb, {})
 
+        self.assertCountEqual(
+            self.collection.get_embedding_ids_by_doc_type(defs.Credoctypes.CRE.value),
+            cre_emb.keys(),
+        )
+        self.assertCountEqual(
+            self.collection.get_embedding_ids_by_doc_type(
+                defs.Credoctypes.Standard.value
+            ),
+            node_emb.keys(),
+        )
+
+    def test_get_embeddings_matrix_by_doc_type(self):
+        """Given: a CRE embedding stored as a float32 blob and one stored as a legacy comma separated string
+        when called with doc_type CRE return both as rows of one float32 matrix"""
+        new = db.CRE(external_id="1", description="C1", name="C1")
+        legacy = db.CRE(external_id="2", description="C2", name="C2")
+        self.collection.session.add(new)
+        self.collection.session.add(legacy)
+        self.collection.session.commit()
+
+        self.collection.add_embedding(
+            db_object=new,
+            doctype=defs.Credoctypes.CRE,
+            embeddings=[3.0, 4.0, 0.5],
+            embedding_text="new",
+        )
+        emb = self.collection.get_embedding(new.id)[0]
+        self.assertEqual(emb.embeddings, "")
+        self.assertEqual(emb.embeddings_dimensions, 3)
+        self.assertAlmostEqual(emb.embeddings_norm, 25.25**0.5, places=5)
+        self.assertEqual(len(emb.embeddings_vector), 12)
+
+        self.collection.session.add(
+            db.Embeddings(
+                embeddings="0.25,-1.5,2",
+                doc_type=defs.Credoctypes.CRE.value,
+                cre_id=legacy.id,
+                embeddings_content="legacy",
+            )
+        )
+        self.collection.session.commit()
+
+        ids, matrix = self.collection.get_embeddings_matrix_by_doc_type(
+            defs.Credoctypes.CRE.value
+        )
+        self.assertEqual(matrix.dtype, db.EMBEDDINGS_DTYPE)
+        self.assertEqual(matrix.shape, (2, 3))
+        self.assertTrue(matrix.flags["C_CONTIGUOUS"])
+        rows = dict(zip(ids, matrix.tolist()))
+        self.assertEqual(rows[new.id], [3.0, 4.0, 0.5])
+        self.assertEqual(rows[legacy.id], [0.25, -1.5, 2.0])
+
+        embeddings, _, _ = self.collection.get_embeddings_by_doc_type_paginated(
+            defs.Credoctypes.CRE.value
+        )
+        self.assertEqual(list(embeddings[legacy.id]), [0.25, -1.5, 2.0])
+
+        ids, matrix = self.collection.get_embeddings_matrix_by_doc_type(
+            defs.Credoctypes.Tool.value
+        )
+        self.assertEqual((ids, matrix.shape), ([], (0, 0)))
+
+    def test_embeddings_content_hash(self):
+        """Given: a CRE embedded by a model
+        the stored embedding records the hash of its text and its model,
+        it is current for the same text by the same model and can be reused for other documents with that text
+        """
+        cre = db.CRE(external_id="1", description="C1", name="C1")
+        other = db.CRE(external_id="2", description="C2", name="C2")
+        self.collection.session.add(cre)
+        self.collection.session.add(other)
+        self.collection.session.commit()
+        self.collection.add_embedding(
+            db_object=cre,
+            doctype=defs.Credoctypes.CRE,
+            embeddings=[0.5, 1.0],
+            embedding_text="some text",
+            model="model-a",
+        )
+
+        emb = self.collection.get_embeddings_by_ids([cre.id, other.id])
+        self.assertEqual(list(emb.keys()), [cre.id])
+        emb = emb[cre.id]
+        self.assertEqual(
+            emb.embeddings_content_hash, db.embeddings_content_hash("some text")
+        )
+        self.assertEqual(emb.embeddings_model, "model-a")
+        self.assertTrue(db.is_embedding_current(emb, "some text", "model-a"))
+        self.assertFalse(db.is_embedding_current(emb, "other text", "model-a"))
+        self.assertFalse(db.is_embedding_current(emb, "some text", "model-b"))
+        self.assertFalse(db.is_embedding_current(None, "some text", "model-a"))
+
+        self.assertEqual(
+            self.collection.get_embedding_of_text("some text", "model-a").tolist(),
+            [0.5, 1.0],
+        )
+        self.assertIsNone(self.collection.get_embedding_of_text("some text", "model-b"))
+        self.assertIsNone(self.collection.get_embedding_of_text("other text", ""))
+
+        # the model of embeddings stored before it was recorded is unknown
+        emb.embeddings_model = None
+        self.collection.session.commit()
+        self.assertFalse(db.is_embedding_current(emb, "some text", "model-a"))
+        self.assertIsNone(self.collection.get_embedding_of_text("some text", "model-a"))
+
+    def test_iter_embeddings_by_doc_type(self):
+        """Given: 25 node embeddings
+        when streamed in chunks of 10, every embedding is returned exactly once"""
+        expected = {}
+        for i in range(25):
+            dbnode = db.Node(
+                name="BarStand",
+                section=f"Section {i}",
+                ntype=defs.Credoctypes.Standard.value,
+                link="https://example.com",
+            )
+            self.collection.session.add(dbnode)
+            self.collection.session.commit()
+            expected[dbnode.id] = [float(i), 1.0]
+            self.collection.add_embedding(
+                db_object=dbnode,
+                doctype=defs.Credoctypes.Standard,
+                embeddings=expected[dbnode.id],
+                embedding_text=dbnode.section,
+            )
+
+        chunks = list(
+            self.collection.iter_embeddings_by_doc_type(
+                defs.Credoctypes.Standard.value, chunk_size=10
+            )
+        )
+        self.assertEqual([len(ids) for ids, _ in chunks], [10, 10, 5])
+        found = {}
+        for ids, matrix in chunks:
+            self.assertEqual(matrix.shape, (len(ids), 2))
+            found.update(zip(ids, matrix.tolist()))
+        self.assertEqual(found, expected)
+        self.assertEqual(
+            list(
+                self.collection.iter_embeddings_by_doc_type(defs.Credoctypes.Tool.value)
+            ),
+            [],
+        )
+
+    def test_embeddings_index(self):
+        """Given: CRE embeddings and a directory to persist the embeddings index in
+        the index is built from the database and saved, kept up to date by add_embedding
+        and loaded back from disk by a process that did not build it"""
+        cres = []
+        for i in range(3):
+            dbcre = db.CRE(external_id=f"{i}", description=f"C{i}", name=f"C{i}")
+            self.collection.session.add(dbcre)
+            cres.append(dbcre)
+        self.collection.session.commit()
+        for i, dbcre in enumerate(cres[:2]):
+            self.collection.add_embedding(
+                db_object=dbcre,
+                doctype=defs.Credoctypes.CRE,
+                embeddings=[1.0 if d == i else 0.0 for d in range(3)],
+                embedding_text=dbcre.name,
+            )
+
+        with tempfile.TemporaryDirectory() as index_dir:
+            with patch.dict(os.environ, {"CRE_EMBEDDINGS_INDEX_DIR": index_dir}):
+                index = self.collection.embeddings_index(defs.Credoctypes.CRE.value)
+                self.assertEqual(len(index), 2)
+                self.assertEqual(index.most_similar([0.9, 0.1, 0.0])[0], cres[0].id)
+                (index_path,) = os.listdir(index_dir)
+
+                self.collection.add_embedding(
+                    db_object=cres[2],
+                    doctype=defs.Credoctypes.CRE,
+                    embeddings=[0.0, 0.0, 1.0],
+                    embedding_text=cres[2].name,
+                )
+                self.collection.add_embedding(
+                    db_object=cres[0],
+                    doctype=defs.Credoctypes.CRE,
+                    embeddings=[0.0, -1.0, 0.0],
+                    embedding_text=cres[0].name,
+                )
+                self.assertIs(
+                    self.collection.embeddings_index(defs.Credoctypes.CRE.value),
+                    index,
+                )
+                self.assertEqual(
+                    index.generation,
+                    self.collection.get_embeddings_generation(
+                        defs.Credoctypes.CRE.value
+                    ),
+                )
+                self.assertEqual(len(index), 3)
+                self.assertEqual(index.most_similar([0.0, 0.1, 0.9])[0], cres[2].id)
+                self.assertEqual(index.most_similar([0.0, -0.9, 0.1])[0], cres[0].id)
+
+                loaded = embedding_index.IVF_Index.load(
+                    os.path.join(index_dir, index_path)
+                )
+                self.assertEqual(sorted(loaded.ids), sorted(c.id for c in cres))
+                self.assertEqual(loaded.most_similar([0.0, -0.9, 0.1])[0], cres[0].id)
+                self.assertEqual(loaded.generation, index.generation)
+
+    @patch.object(db, "INDEX_GENERATION_CHECK_INTERVAL", 0)
+    def test_embeddings_index_changed_elsewhere(self):
+        """Given: an embeddings index and an embedding changed by another process, same number of embeddings
+        the index is built again once the embeddings generation moved"""
+        cres = []
+        for i in range(2):
+            dbcre = db.CRE(external_id=f"{i}", description=f"C{i}", name=f"C{i}")
+            self.collection.session.add(dbcre)
+            cres.append(dbcre)
+        self.collection.session.commit()
+        for i, dbcre in enumerate(cres):
+            self.collection.add_embedding(
+                db_object=dbcre,
+                doctype=defs.Credoctypes.CRE,
+                embeddings=[1.0 if d == i else 0.0 for d in range(3)],
+                embedding_text=dbcre.name,
+            )
+        index = self.collection.embeddings_index(defs.Credoctypes.CRE.value)
+        self.assertEqual(index.most_similar([0.0, 0.0, 1.0])[1], 0.0)
+
+        vector, dimensions, norm = db.encode_embeddings([0.0, 0.0, 1.0])
+        self.collection.session.query(db.Embeddings).filter(
+            db.Embeddings.cre_id == cres[1].id
+        ).update(
+            {
+                db.Embeddings.embeddings_vector: vector,
+                db.Embeddings.embeddings_content: "changed",
+                db.Embeddings.embeddings_content_hash: db.embeddings_content_hash(
+                    "changed"
+                ),
+            }
+        )
+        self.collection.session.commit()
+        self.assertIs(
+            self.collection.embeddings_index(defs.Credoctypes.CRE.value), index
+        )
+
+        # what add_embedding in the other process does along with the change
+        self.collection.session.query(db.EmbeddingsGeneration).filter(
+            db.EmbeddingsGeneration.doc_type == defs.Credoctypes.CRE.value
+        ).update(
+            {db.EmbeddingsGeneration.generation: db.EmbeddingsGeneration.generation + 1}
+        )
+        self.collection.session.commit()
+
+        rebuilt = self.collection.embeddings_index(defs.Credoctypes.CRE.value)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.most_similar([0.0, 0.0, 1.0])[0], cres[1].id)
+        self.assertIs(
+            self.collection.embeddings_index(defs.Credoctypes.CRE.value), rebuilt
+        )
+
+    def test_add_embeddings_bumps_generations(self):
+        """Given: embeddings of CREs and of a standard added in one call, some of them listed twice
+        the generation of every doc_type moves once and the loaded index follows it"""
+        cres = []
+        for i in range(2):
+            dbcre = db.CRE(external_id=f"{i}", description=f"C{i}", name=f"C{i}")
+            self.collection.session.add(dbcre)
+            cres.append(dbcre)
+        dbstandard = db.Node(name="sa", section="s1", ntype=defs.Standard.__name__)
+        self.collection.session.add(dbstandard)
+        self.collection.session.commit()
+        self.collection.add_embedding(
+            db_object=cres[0],
+            doctype=defs.Credoctypes.CRE,
+            embeddings=[1.0, 0.0],
+            embedding_text=cres[0].name,
+        )
+        index = self.collection.embeddings_index(defs.Credoctypes.CRE.value)
+        self.assertEqual(index.generation, 1)
+
+        self.collection.add_embeddings(
+            [
+                (cres[0], defs.Credoctypes.CRE, [0.0, -1.0], cres[0].name),
+                (cres[1], defs.Credoctypes.CRE, [0.0, 1.0], cres[1].name),
+                (cres[1], defs.Credoctypes.CRE, [0.0, 1.0], cres[1].name),
+                (dbstandard, defs.Credoctypes.Standard, [1.0, 1.0], "sa"),
+            ]
+        )
+        self.assertEqual(
+            self.collection.get_embeddings_generation(defs.Credoctypes.CRE.value), 2
+        )
+        self.assertEqual(
+            self.collection.get_embeddings_generation(defs.Credoctypes.Standard.value),
+            1,
+        )
+        self.assertIs(
+            self.collection.embeddings_index(defs.Credoctypes.CRE.value), index
+        )
+        self.assertEqual(index.generation, 2)
+        self.assertEqual(index.most_similar([0.0, -0.9])[0], cres[0].id)
+        self.assertEqual(index.most_similar([0.1, 0.9])[0], cres[1].id)
+
     def test_get_standard_names(self):
         for s in ["sa", "sb", "sc", "sd"]:
             for sub in ["suba", "subb", "subc", "subd"]:
@@ -2287,3 +3205,34 @@ class TestDB(unittest.TestCase):
         self.assertEqual(collection.get_cre_hierarchy(c7), 0)
         c8 = [c for c in cres if c.name == "C8"][0]
         self.assertEqual(collection.get_cre_hierarchy(c8), 0)
+
+    def test_get_cre_path(self) -> None:
+        collection = self.collection
+        cres = [defs.CRE(name=f"path{i}", id=f"555-00{i}") for i in range(4)]
+        dbcres = [collection.add_cre(c) for c in cres]
+        collection.add_internal_link(
+            dbcres[0], dbcres[1], ltype=defs.LinkTypes.Contains
+        )
+        collection.add_internal_link(
+            dbcres[1], dbcres[2], ltype=defs.LinkTypes.Contains
+        )
+        collection.add_internal_link(dbcres[2], dbcres[3], ltype=defs.LinkTypes.Related)
+
+        self.assertEqual(
+            collection.get_cre_ancestry(cres[2].id), ["555-000", "555-001", "555-002"]
+        )
+        self.assertEqual(
+            [c.id for c in collection.get_cre_path(cres[0].id, cres[2].id)],
+            ["555-000", "555-001", "555-002"],
+        )
+        # paths always go from the higher cre to the lower one
+        self.assertEqual(
+            [c.id for c in collection.get_cre_path(cres[2].id, cres[0].id)],
+            ["555-000", "555-001", "555-002"],
+        )
+        # not in the same branch of the hierarchy
+        self.assertEqual(
+            [c.id for c in collection.get_cre_path(cres[1].id, cres[3].id)],
+            ["555-001", "555-002", "555-003"],
+        )
+        self.assertEqual(collection.get_cre_hierarchy(cres[3]), 0)
@@ -0,0 +1,186 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from application.database.embedding_index import (
+    Embedding_Index,
+    IVF_Index,
+    STALE_GENERATION,
+    append_log,
+    top_k_of_chunks,
+)
+
+
+class TestEmbeddingIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index = Embedding_Index(
+            ["a", "b", "c", "d"],
+            np.array(
+                [
+                    [1.0, 0.0, 0.0],
+                    [10.0, 10.0, 0.0],
+                    [0.0, 0.0, 3.0],
+                    [-1.0, 0.0, 0.0],
+                ]
+            ),
+        )
+
+    def test_top_k(self) -> None:
+        best = self.index.top_k([2.0, 0.1, 0.0], k=3)
+        self.assertEqual([id for id, _ in best], ["a", "b", "c"])
+        self.assertAlmostEqual(best[0][1], 2.0 / np.hypot(2.0, 0.1), places=5)
+        self.assertAlmostEqual(best[1][1], 2.1 / np.hypot(2.0, 0.1) / 2**0.5, places=5)
+        self.assertAlmostEqual(best[2][1], 0.0, places=5)
+
+        self.assertEqual(len(self.index.top_k([1.0, 0.0, 0.0], k=10)), 4)
+        self.assertEqual(self.index.most_similar([0.0, 0.0, 0.5]), ("c", 1.0))
+
+    def test_top_k_batch(self) -> None:
+        queries = [[0.0, 1.0, 0.0], [-5.0, 0.0, 0.1], [0.0, 0.0, 0.0]]
+        results = self.index.top_k_batch(queries, k=2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual([id for id, _ in results[0]], ["b", "a"])
+        self.assertEqual(results[1][0][0], "d")
+        # a query of zeros is not similar to anything
+        self.assertEqual([s for _, s in results[2]], [0.0, 0.0])
+        self.assertEqual(results[0], self.index.top_k(queries[0], k=2))
+
+    def test_top_k_of_chunks(self) -> None:
+        rand = np.random.default_rng(0)
+        ids = [f"id-{i}" for i in range(95)]
+        embeddings = rand.normal(size=(95, 8))
+        query = rand.normal(size=8)
+        chunks = [(ids[i : i + 10], embeddings[i : i + 10]) for i in range(0, 95, 10)]
+        best = top_k_of_chunks(chunks, query, k=4)
+        expected = Embedding_Index(ids, embeddings).top_k(query, k=4)
+        self.assertEqual([id for id, _ in best], [id for id, _ in expected])
+        for (_, similarity), (_, expected_similarity) in zip(best, expected):
+            self.assertAlmostEqual(similarity, expected_similarity, places=5)
+        self.assertEqual(top_k_of_chunks([], query), [])
+        # embeddings of another model
+        mismatched = [(["other"], rand.normal(size=(1, 4)))] + chunks
+        with self.assertLogs("application.database.embedding_index", "WARNING"):
+            self.assertEqual(top_k_of_chunks(mismatched, query, k=4), best)
+
+    def test_empty_and_mismatched(self) -> None:
+        empty = Embedding_Index([], np.array([]))
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty.top_k([1.0, 2.0]), [])
+        self.assertEqual(empty.most_similar([1.0, 2.0]), (None, -1))
+
+        with self.assertRaises(ValueError):
+            self.index.top_k([1.0, 2.0])
+        with self.assertRaises(ValueError):
+            Embedding_Index(["a"], np.zeros((2, 3)))
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        rand = np.random.default_rng(0)
+        self.ids = [f"id-{i}" for i in range(400)]
+        self.embeddings = rand.normal(size=(400, 16)).astype(np.float32)
+        self.queries = rand.normal(size=(20, 16)).astype(np.float32)
+
+    def test_all_probes_is_exact(self) -> None:
+        index = IVF_Index(self.ids, self.embeddings, probes=1000)
+        self.assertEqual(len(index.centroids), 20)
+        self.assertEqual(sum(len(l) for l in index.lists), 400)
+        exact = Embedding_Index(self.ids, self.embeddings)
+        for approximate, expected in zip(
+            index.top_k_batch(self.queries, k=5), exact.top_k_batch(self.queries, k=5)
+        ):
+            self.assertEqual([id for id, _ in approximate], [id for id, _ in expected])
+
+    def test_recall(self) -> None:
+        exact = [
+            best[0][0]
+            for best in Embedding_Index(self.ids, self.embeddings).top_k_batch(
+                self.queries
+            )
+        ]
+        recall = []
+        for probes in (1, 5):
+            index = IVF_Index(self.ids, self.embeddings, probes=probes)
+            found = [best[0][0] for best in index.top_k_batch(self.queries)]
+            recall.append(sum(a == b for a, b in zip(found, exact)) / len(exact))
+        self.assertLess(recall[0], recall[1])
+        self.assertGreaterEqual(recall[1], 0.9)
+
+    def test_add(self) -> None:
+        index = IVF_Index([], np.array([]))
+        self.assertEqual(index.most_similar([1.0, 0.0]), (None, -1))
+
+        index.add("a", [1.0, 0.0])
+        index.add("b", [0.0, 1.0])
+        self.assertEqual(index.most_similar([0.1, 1.0])[0], "b")
+        # replacing an embedding
+        index.add("b", [-1.0, 0.0])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.most_similar([0.1, 1.0])[0], "a")
+        self.assertEqual(index.most_similar([-1.0, 0.1])[0], "b")
+
+        index = IVF_Index(self.ids, self.embeddings, probes=1000)
+        for i in range(500):
+            index.add(f"new-{i}", self.queries[i % 20] + i)
+        self.assertEqual(len(index), 900)
+        # trained again when it doubled in size
+        self.assertEqual(index.trained_size, 801)
+        self.assertEqual(sum(len(l) for l in index.lists), 900)
+        self.assertEqual(index.most_similar(self.embeddings[7])[0], "id-7")
+
+        with self.assertRaises(ValueError):
+            index.add("c", [1.0, 2.0])
+
+    def test_save_and_load(self) -> None:
+        index = IVF_Index(self.ids, self.embeddings)
+        index.generation = 3
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index.npz")
+            index.save(path)
+            append_log(path, "id-3", self.queries[0], generation=4)
+            append_log(path, "new", self.queries[1], generation=4)
+            # a partially written record is ignored
+            with open(f"{path}.log", "ab") as f:
+                f.write(b"\x05\x00\x00\x00\x10")
+
+            loaded = IVF_Index.load(path, probes=1000)
+            self.assertEqual(len(loaded), 401)
+            self.assertEqual(loaded.generation, 4)
+            self.assertEqual(loaded.most_similar(self.queries[0])[0], "id-3")
+            self.assertEqual(loaded.most_similar(self.queries[1])[0], "new")
+            self.assertEqual(
+                loaded.most_similar(self.embeddings[10])[0],
+                "id-10",
+            )
+
+            loaded.save(path)
+            self.assertEqual(os.listdir(tmpdir), ["index.npz"])
+            self.assertEqual(len(IVF_Index.load(path)), 401)
+            self.assertEqual(IVF_Index.load(path).generation, 4)
+
+            # a change logged by another process at a generation this one did not see
+            append_log(path, "other", self.queries[2], generation=6)
+            self.assertEqual(IVF_Index.load(path).generation, STALE_GENERATION)
+
+    def test_save_keeps_records_logged_meanwhile(self) -> None:
+        index = IVF_Index(self.ids, self.embeddings)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "index.npz")
+            index.save(path)
+            append_log(path, "saved", self.queries[0])
+
+            savez = np.savez
+
+            def log_while_saving(*args, **kwargs):
+                append_log(path, "new", self.queries[1])
+                savez(*args, **kwargs)
+
+            with patch.object(np, "savez", log_while_saving):
+                index.save(path)
+
+            loaded = IVF_Index.load(path, probes=1000)
+            self.assertEqual(len(loaded), 401)
+            self.assertEqual(loaded.most_similar(self.queries[1])[0], "new")
@@ -1,7 +1,8 @@
 import unittest
+from unittest.mock import patch
 import networkx as nx
 from application.defs import cre_defs as defs
-from application.database.inmemory_graph import CRE_Graph
+from application.database.inmemory_graph import CRE_Graph, CycleDetectedError
 
 
 class TestCreDefs(unittest.TestCase):
@@ -154,3 +155,104 @@ class TestCreDefs(unittest.TestCase):
                 defs.Link(document=node1, ltype=defs.LinkTypes.AutomaticallyLinkedTo),
             )
         )
+
+    def test_add_link_rejects_cycles_without_copying(self) -> None:
+        cres = [defs.CRE(name=f"c{i}", id=f"222-{i:03}") for i in range(50)]
+        g = CRE_Graph()
+        g.with_graph(graph=nx.DiGraph(), graph_data=[])
+        with patch.object(nx.DiGraph, "copy") as copy_mock:
+            for i in range(1, len(cres)):
+                g.add_link(
+                    cres[i - 1],
+                    defs.Link(document=cres[i], ltype=defs.LinkTypes.Contains),
+                )
+            g.add_link(
+                cres[10], defs.Link(document=cres[20], ltype=defs.LinkTypes.Related)
+            )
+
+            with self.assertRaises(CycleDetectedError):
+                g.add_link(
+                    cres[49], defs.Link(document=cres[0], ltype=defs.LinkTypes.Contains)
+                )
+            with self.assertRaises(CycleDetectedError):
+                g.add_link(
+                    cres[0], defs.Link(document=cres[49], ltype=defs.LinkTypes.PartOf)
+                )
+            # a related link closing a loop is a cycle too
+            with self.assertRaises(CycleDetectedError):
+                g.add_link(
+                    cres[30], defs.Link(document=cres[5], ltype=defs.LinkTypes.Related)
+                )
+            # the opposite of an existing related link is already represented
+            g.add_link(
+                cres[20], defs.Link(document=cres[10], ltype=defs.LinkTypes.Related)
+            )
+            copy_mock.assert_not_called()
+
+        self.assertIsNone(g.has_cycle())
+        self.assertEqual(49 + 1, len(g.get_raw_graph().edges))
+        cycle = g.introduces_cycle(
+            cres[3], defs.Link(document=cres[1], ltype=defs.LinkTypes.Contains)
+        )
+        self.assertEqual(
+            [
+                ("CRE: 222-003", "CRE: 222-001"),
+                ("CRE: 222-001", "CRE: 222-002"),
+                ("CRE: 222-002", "CRE: 222-003"),
+            ],
+            cycle,
+        )
+
+    def test_add_link_existing_cycle(self) -> None:
+        cre1 = defs.CRE(name="c1", id="111-111")
+        cre2 = defs.CRE(name="c2", id="111-112")
+        cre3 = defs.CRE(name="c3", id="111-113")
+        graph = nx.DiGraph()
+        graph.add_edge("CRE: 111-111", "CRE: 111-112", ltype="Contains")
+        graph.add_edge("CRE: 111-112", "CRE: 111-111", ltype="Contains")
+
+        g = CRE_Graph()
+        g.with_graph(graph=graph, graph_data=[])
+        with self.assertRaises(ValueError):
+            g.add_link(cre2, defs.Link(document=cre3, ltype=defs.LinkTypes.Contains))
+
+    def test_hierarchy_updated_on_add_link(self) -> None:
+        cres = [defs.CRE(name=f"c{i}", id=f"333-00{i}") for i in range(5)]
+        g = CRE_Graph()
+        g.with_graph(graph=nx.DiGraph(), graph_data=[])
+        for cre in cres:
+            g.add_cre(cre)
+        g.add_link(cres[1], defs.Link(document=cres[2], ltype=defs.LinkTypes.Contains))
+        g.add_link(cres[2], defs.Link(document=cres[3], ltype=defs.LinkTypes.Contains))
+        self.assertEqual(g.get_hierarchy(cres[3].id), 2)
+
+        # a root becomes a child, its whole subtree moves down
+        g.add_link(cres[0], defs.Link(document=cres[1], ltype=defs.LinkTypes.Contains))
+        self.assertEqual(
+            [g.get_hierarchy(c.id) for c in cres[:4]],
+            [0, 1, 2, 3],
+        )
+        self.assertEqual(
+            g.get_ancestry(cres[3].id),
+            ["CRE: 333-000", "CRE: 333-001", "CRE: 333-002", "CRE: 333-003"],
+        )
+
+        # a closer parent moves the subtree up, related links don't count
+        g.add_link(cres[4], defs.Link(document=cres[3], ltype=defs.LinkTypes.Related))
+        g.add_link(cres[0], defs.Link(document=cres[2], ltype=defs.LinkTypes.Contains))
+        self.assertEqual(g.get_hierarchy(cres[3].id), 2)
+        self.assertEqual(g.get_hierarchy(cres[4].id), 0)
+        self.assertEqual(
+            g.get_ancestry(cres[3].id),
+            ["CRE: 333-000", "CRE: 333-002", "CRE: 333-003"],
+        )
+
+        # the table matches a fresh build over the same graph
+        fresh = CRE_Graph()
+        fresh.with_graph(graph=g.get_raw_graph().copy(), graph_data=[])
+        self.assertEqual(
+            [fresh.get_hierarchy(c.id) for c in cres],
+            [g.get_hierarchy(c.id) for c in cres],
+        )
+        with self.assertRaises(ValueError):
+            g.get_hierarchy("999-999")
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from application.prompt_client.page_cache import (
+    Page_Cache,
+    content_hash,
+    normalise_url,
+)
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = Page_Cache(self.directory.name)
+
+    def test_normalise_url(self) -> None:
+        self.assertEqual(
+            normalise_url("HTTPS://CWE.Mitre.org:443/data/definitions/79.html#Demo"),
+            "https://cwe.mitre.org/data/definitions/79.html",
+        )
+        self.assertEqual(
+            normalise_url("http://example.com:8080/a/?b=c#d"),
+            "http://example.com:8080/a?b=c",
+        )
+
+    def test_get_put(self) -> None:
+        url = "https://example.com/page#anchor"
+        self.assertIsNone(self.cache.get(url))
+
+        cached = self.cache.put(
+            url, "cleaned text", source="Cleaned   text", etag='"v1"'
+        )
+        self.assertEqual(cached.url, "https://example.com/page")
+        self.assertEqual(cached.content_hash, content_hash("cleaned text"))
+        self.assertEqual(self.cache.get("https://example.com/page#other"), cached)
+        self.assertEqual(cached.conditional_headers(), {"If-None-Match": '"v1"'})
+
+        cached = self.cache.put(url, "new text", last_modified="today")
+        self.assertEqual(self.cache.get(url).text, "new text")
+        self.assertEqual(cached.conditional_headers(), {"If-Modified-Since": "today"})
+
+    def test_corrupt_entry(self) -> None:
+        self.cache.put("https://example.com/", "text")
+        for root, _, files in os.walk(self.directory.name):
+            for name in files:
+                with open(os.path.join(root, name), "w") as f:
+                    f.write("{not json")
+        self.assertIsNone(self.cache.get("https://example.com/"))
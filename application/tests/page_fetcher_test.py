@@ -0,0 +1,103 @@
+import asyncio
+import time
+import unittest
+from collections import Counter
+from typing import Dict
+
+from application.prompt_client.page_fetcher import Page, Page_Fetcher
+
+
+class TestPageFetcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.loading = Counter()
+        self.peak = Counter()
+        self.attempts = Counter()
+
+    async def fake_fetch(self, url: str, headers: Dict[str, str]) -> Page:
+        host = url.split("/")[2]
+        self.attempts[url] += 1
+        self.loading[host] += 1
+        self.loading["total"] += 1
+        for key in (host, "total"):
+            self.peak[key] = max(self.peak[key], self.loading[key])
+        try:
+            if "slow" in url and self.attempts[url] == 1:
+                await asyncio.sleep(10)
+            if "broken" in url:
+                raise ValueError("404")
+            await asyncio.sleep(0.02)
+            if headers.get("If-None-Match") == "v1":
+                return Page("", not_modified=True)
+            return Page(f"text of {url}", etag="v1")
+        finally:
+            self.loading[host] -= 1
+            self.loading["total"] -= 1
+
+    def test_fetch_all(self) -> None:
+        urls = [(i, f"https://host{i % 3}.example.com/page/{i}") for i in range(30)] + [
+            ("slow", "https://slow.example.com/"),
+            ("broken", "https://broken.example.com/"),
+        ]
+        fetcher = Page_Fetcher(
+            concurrency=4, per_host=2, timeout=0.5, retries=1, fetch=self.fake_fetch
+        )
+        t0 = time.perf_counter()
+        results = dict(fetcher.fetch_all(urls))
+
+        self.assertEqual(len(results), 32)
+        self.assertEqual(
+            results[7], Page("text of https://host1.example.com/page/7", etag="v1")
+        )
+        # timed out once, then loaded
+        self.assertEqual(results["slow"].text, "text of https://slow.example.com/")
+        self.assertEqual(self.attempts["https://slow.example.com/"], 2)
+        # could not be loaded at all
+        self.assertEqual(results["broken"], Page(""))
+        self.assertEqual(self.attempts["https://broken.example.com/"], 2)
+
+        self.assertEqual(self.peak["total"], 4)
+        self.assertEqual(max(self.peak[f"host{i}.example.com"] for i in range(3)), 2)
+        self.assertLess(time.perf_counter() - t0, 5)
+
+    def test_results_as_they_load(self) -> None:
+        fetcher = Page_Fetcher(concurrency=2, fetch=self.fake_fetch)
+        pages = fetcher.fetch_all(
+            [(i, f"https://host{i}.example.com/") for i in range(20)]
+        )
+        next(pages)
+        # the rest is still loading
+        self.assertGreater(sum(self.attempts.values()), 0)
+        self.assertLess(sum(self.attempts.values()), 20)
+        self.assertEqual(len(list(pages)), 19)
+
+        self.assertEqual(list(fetcher.fetch_all([])), [])
+
+    def test_consumer_stops_early(self) -> None:
+        fetcher = Page_Fetcher(concurrency=2, fetch=self.fake_fetch)
+        pages = fetcher.fetch_all(
+            [("fast", "https://fast.example.com/")]
+            + [(i, f"https://slow{i}.example.com/") for i in range(20)]
+        )
+        self.assertEqual(next(pages)[0], "fast")
+        t0 = time.perf_counter()
+        pages.close()
+
+        # the pages being loaded were cancelled and no other page was started
+        self.assertLess(time.perf_counter() - t0, 2)
+        self.assertEqual(self.loading["total"], 0)
+        attempts = sum(self.attempts.values())
+        self.assertLess(attempts, 21)
+        time.sleep(0.1)
+        self.assertEqual(sum(self.attempts.values()), attempts)
+
+    def test_conditional_headers(self) -> None:
+        fetcher = Page_Fetcher(fetch=self.fake_fetch)
+        url = "https://host.example.com/"
+        pages = dict(
+            fetcher.fetch_all(
+                [("cached", url), ("new", url + "new")],
+                headers={url: {"If-None-Match": "v1"}},
+            )
+        )
+        self.assertTrue(pages["cached"].not_modified)
+        self.assertFalse(pages["new"].not_modified)
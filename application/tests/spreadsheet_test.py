@@ -3,6 +3,8 @@ import io
 import csv
 from pprint import pprint
 
+import networkx as nx
+
 from application import create_app, sqla  # type: ignore
 from application.database import db
 from application.defs import cre_defs as defs
@@ -22,6 +24,9 @@ class TestDB(unittest.TestCase):
         self.app_context.push()
         sqla.create_all()
         self.collection = db.Node_collection().with_graph()
+        self.collection.graph.with_graph(
+            graph=nx.DiGraph(), graph_data=[]
+        )  # initialize the graph singleton for the tests to be unique
 
     def test_prepare_spreadsheet_one_cre(self) -> None:
         collection = self.collection
@@ -57,6 +62,27 @@ class TestDB(unittest.TestCase):
 
         self.assertCountEqual(result, expected)
 
+    def test_prepare_spreadsheet_processed_ancestor_off_the_shortest_chain(
+        self,
+    ) -> None:
+        """Given: r1 contains a contains b contains c and r2 contains c
+        c is written under the already exported a, not under r2 which is closer"""
+        collection = self.collection
+        r1, r2, a, b, c = [
+            defs.CRE(name=name, description=name, id=f"666-00{i}")
+            for i, name in enumerate(["R1", "R2", "A", "B", "C"])
+        ]
+        dbcres = {cre.id: collection.add_cre(cre) for cre in [r1, r2, a, b, c]}
+        for higher, lower in [(r1, a), (a, b), (b, c), (r2, c)]:
+            collection.add_internal_link(
+                dbcres[higher.id], dbcres[lower.id], ltype=defs.LinkTypes.Contains
+            )
+
+        result = ExportSheet().prepare_spreadsheet(storage=collection, docs=[a, c])
+
+        self.assertNotIn({"CRE 0": "666-001|R2"}, result)
+        self.assertIn({"CRE 3": "666-004|C"}, result)
+
     def test_prepare_spreadsheet_empty(self) -> None:
         collection = self.collection
         expected = []
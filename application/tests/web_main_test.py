@@ -13,6 +13,7 @@ import redis
 import rq
 import os
 import networkx as nx
+from flask import make_response
 
 from application import create_app, sqla  # type: ignore
 from application.tests.utils import data_gen
@@ -20,6 +21,8 @@ from application.database import db
 from application.utils import spreadsheet
 from application.defs import cre_defs as defs
 from application.web import web_main
+from application.prompt_client import prompt_client
+from application.prompt_client.fake_prompt_client import FakePromptClient
 from application.utils.gap_analysis import GAP_ANALYSIS_TIMEOUT
 
 
@@ -485,6 +488,70 @@ class TestMain(unittest.TestCase):
             self.assertEqual(json.loads(response.data.decode()), expected)
             self.assertEqual(200, response.status_code)
 
+    def test_cached_response_etag(self) -> None:
+        collection = db.Node_collection().with_graph()
+        dbcre = collection.add_cre(defs.CRE(id="111-115", description="CA", name="CA"))
+        with self.app.test_client() as client:
+            response = client.get("/rest/v1/id/111-115")
+            self.assertEqual(200, response.status_code)
+            etag, weak = response.get_etag()
+            self.assertFalse(weak)
+            self.assertTrue(response.cache_control.no_cache)
+
+            # same generation and query, revalidation does not run the endpoint
+            with patch.object(db.Node_collection, "get_CREs") as get_cres_mock:
+                response = client.get(
+                    "/rest/v1/id/111-115", headers={"If-None-Match": f'"{etag}"'}
+                )
+                self.assertEqual(304, response.status_code)
+                response = client.get("/rest/v1/id/111-115")
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(etag, response.get_etag()[0])
+                get_cres_mock.assert_not_called()
+
+            # the query string is part of the key
+            response = client.get("/rest/v1/id/111-115?format=md")
+            self.assertNotEqual(etag, response.get_etag()[0])
+            self.assertTrue(response.data.decode().startswith("<pre>"))
+
+            # writes bump the content generation
+            dbnode = collection.add_node(defs.Standard(name="SA", section="1"))
+            collection.add_link(cre=dbcre, node=dbnode, ltype=defs.LinkTypes.LinkedTo)
+            response = client.get(
+                "/rest/v1/id/111-115", headers={"If-None-Match": f'"{etag}"'}
+            )
+            self.assertEqual(200, response.status_code)
+            self.assertNotEqual(etag, response.get_etag()[0])
+            self.assertEqual(
+                "SA", json.loads(response.data)["data"]["links"][0]["document"]["name"]
+            )
+
+    def test_cached_response_headers(self) -> None:
+        calls = []
+
+        def endpoint():
+            calls.append(1)
+            response = make_response("data")
+            response.headers["Content-Disposition"] = "attachment; filename=a.csv"
+            response.mimetype = "text/csv"
+            return response
+
+        cached_endpoint = web_main.cached_response(endpoint)
+        with self.app.test_request_context("/rest/v1/headers"):
+            web_main.cache.set("unrelated", "value")
+            first = cached_endpoint()
+            web_main.invalidate_response_cache()
+            second = cached_endpoint()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual("value", web_main.cache.get("unrelated"))
+        for response in (first, second):
+            self.assertEqual(b"data", response.get_data())
+            self.assertEqual("text/csv", response.mimetype)
+            self.assertEqual(
+                "attachment; filename=a.csv", response.headers["Content-Disposition"]
+            )
+
     def test_smartlink(self) -> None:
         self.maxDiff = None
         collection = db.Node_collection().with_graph()
@@ -952,3 +1019,125 @@ class TestMain(unittest.TestCase):
                 data.getvalue(),
                 response.data.decode(),
             )
+
+    @patch.object(db, "INDEX_GENERATION_CHECK_INTERVAL", 0)
+    @patch.object(rq.job.Job, "fetch")
+    @patch.object(rq.Queue, "enqueue_call")
+    @patch.object(redis, "from_url")
+    def test_chat_cre_stream(
+        self, redis_conn_mock, enqueue_call_mock, fetch_mock
+    ) -> None:
+        prompt_client.PromptHandler.answers.clear()
+        client = FakePromptClient()
+        dbnode = self.collection.add_node(
+            defs.Standard(name="ASVS", section="passwords", sectionID="V2.1")
+        )
+        self.collection.add_embedding(
+            dbnode,
+            defs.Credoctypes.Standard,
+            client.get_text_embeddings("how long should passwords be"),
+            "passwords",
+        )
+        lists = {}
+        redis_conn_mock.return_value.rpush.side_effect = (
+            lambda key, value: lists.setdefault(key, []).append(value)
+        )
+        redis_conn_mock.return_value.lrange.side_effect = (
+            lambda key, start, end: lists.get(key, [])[start:]
+        )
+        fetch_mock.return_value = MockJob()
+
+        def read_events(response):
+            self.assertEqual(200, response.status_code)
+            self.assertEqual("text/event-stream", response.mimetype)
+            return [
+                (
+                    int(re.search("^id: (.*)$", e, re.M).group(1)),
+                    re.search("^event: (.*)$", e, re.M).group(1),
+                    json.loads(re.search("^data: (.*)$", e, re.M).group(1)),
+                )
+                for e in response.data.decode().split("\n\n")
+                if e.startswith("id: ")
+            ]
+
+        with patch.dict(
+            os.environ, {"NO_LOGIN": "True", "OPENAI_API_KEY": "key"}
+        ), patch.object(
+            prompt_client.openai_prompt_client,
+            "OpenAIPromptClient",
+            return_value=client,
+        ), self.app.test_client() as test_client:
+            response = test_client.post(
+                "/rest/v1/completion/stream",
+                json={"prompt": "how long should passwords be"},
+            )
+            self.assertEqual(200, response.status_code)
+            job_id = json.loads(response.data)["job_id"]
+            self.assertEqual(
+                enqueue_call_mock.call_args.kwargs["kwargs"],
+                {"prompt": "how long should passwords be", "stream_id": job_id},
+            )
+            self.assertEqual(
+                enqueue_call_mock.call_args.args, (prompt_client.stream_completion,)
+            )
+            # no worker ran the job yet
+            self.assertEqual(
+                read_events(test_client.get(f"/rest/v1/completion/stream/{job_id}")),
+                [],
+            )
+
+            # what the worker does
+            prompt_client.stream_completion(
+                **enqueue_call_mock.call_args.kwargs["kwargs"]
+            )
+            events = read_events(
+                test_client.get(f"/rest/v1/completion/stream/{job_id}")
+            )
+            # the client comes back with the id of the last event it got
+            self.assertEqual(
+                read_events(
+                    test_client.get(
+                        f"/rest/v1/completion/stream/{job_id}",
+                        headers={"Last-Event-ID": "2"},
+                    )
+                ),
+                events[2:],
+            )
+            self.assertEqual(
+                read_events(
+                    test_client.get(
+                        f"/rest/v1/completion/stream/{job_id}",
+                        headers={"Last-Event-ID": str(len(events))},
+                    )
+                ),
+                [],
+            )
+
+            fetch_mock.side_effect = rq.exceptions.NoSuchJobError()
+            self.assertEqual(
+                404, test_client.get("/rest/v1/completion/stream/unknown").status_code
+            )
+
+        self.assertEqual([e[0] for e in events], list(range(1, len(events) + 1)))
+        events = [(event, data) for _, event, data in events]
+        self.assertEqual(events[0][0], "table")
+        self.assertTrue(events[0][1]["accurate"])
+        self.assertEqual(events[0][1]["table"][0]["section"], "passwords")
+        self.assertEqual(events[-1], ("done", {}))
+        answer = "".join(data for event, data in events if event == "answer")
+        self.assertTrue(answer.startswith("Answer: an answer to `how long should"))
+        self.assertGreater(len(events), 4)
+
+    @patch.object(rq.job.Job, "fetch")
+    @patch.object(redis, "from_url")
+    def test_chat_cre_stream_failed_job(self, redis_conn_mock, fetch_mock) -> None:
+        redis_conn_mock.return_value.lrange.return_value = []
+        fetch_mock.return_value.get_status.return_value = rq.job.JobStatus.FAILED
+        with patch.dict(os.environ, {"NO_LOGIN": "True"}):
+            with self.app.test_client() as client:
+                response = client.get("/rest/v1/completion/stream/abc")
+        self.assertEqual(200, response.status_code)
+        self.assertIn(
+            'id: 1\nevent: error\ndata: "could not generate an answer"',
+            response.data.decode(),
+        )
@@ -1,5 +1,7 @@
 from application.utils.external_project_parsers import base_parser_defs
+import networkx as nx
 from rq import Queue
+from rq.job import Dependency
 from application.utils import redis
 from application.prompt_client import prompt_client as prompt_client
 import logging
@@ -8,11 +10,22 @@ from alive_progress import alive_bar
 from application.utils.external_project_parsers.parsers import *
 from application.utils import gap_analysis
 import os, json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Type
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# how many processes parse external projects at once, by default one per cpu
+PARSER_PROCESSES = int(os.environ.get("CRE_PARSER_PROCESSES", "0")) or None
+
+
+def parse_documents(
+    sclass: Type[base_parser_defs.ParserInterface],
+) -> base_parser_defs.ParseResult:
+    return sclass().parse_documents()
+
 
 class BaseParser:
     @classmethod
@@ -20,7 +33,12 @@ class BaseParser:
         self,
         sclass: base_parser_defs.ParserInterface,
         db_connection_str: str,
+        parsed: Optional[base_parser_defs.ParseResult] = None,
     ):
+        """
+        parses and registers the resource of sclass,
+        parsed is the result of sclass' parse_documents if it already ran, only its references are resolved then
+        """
         from application.cmd import cre_main
 
         db = cre_main.db_connect(db_connection_str)
@@ -36,7 +54,10 @@ class BaseParser:
             )
             return
 
-        resultObj = sclass_instance.parse(db, ph)
+        if parsed:
+            resultObj = sclass_instance.resolve(parsed, db)
+        else:
+            resultObj = sclass_instance.parse(db, ph)
         try:
             for _, documents in resultObj.results.items():
                 cre_main.register_standard(
@@ -50,10 +71,74 @@ class BaseParser:
             err_str = f"error importing {sclass.name}, err: {ve}"
             raise ValueError(err_str)
 
+    @staticmethod
+    def parses_documents(sclass: Type[base_parser_defs.ParserInterface]) -> bool:
+        """whether the parser can parse without the database"""
+        return (
+            sclass.parse_documents
+            is not base_parser_defs.ParserInterface.parse_documents
+        )
+
+    @classmethod
+    def parse_all_documents(
+        cls, importers: List[Type[base_parser_defs.ParserInterface]]
+    ) -> Dict[str, base_parser_defs.ParseResult]:
+        """
+        runs parse_documents of the importers that can parse without the database in a process pool,
+        returns their results by name, importers that failed are left out
+        """
+        results = {}
+        importers = [sclass for sclass in importers if cls.parses_documents(sclass)]
+        if not importers:
+            return results
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=PARSER_PROCESSES) as pool:
+            futures = {
+                pool.submit(parse_documents, sclass): sclass for sclass in importers
+            }
+            for future in as_completed(futures):
+                sclass = futures[future]
+                try:
+                    results[sclass.name] = future.result()
+                except Exception as e:
+                    logger.error(
+                        f"could not parse {sclass.name} ahead of its import, it will be parsed by its import job, err: {e}"
+                    )
+        logger.info(
+            f"parsed {len(results)} projects in {time.perf_counter()-t0} seconds"
+        )
+        return results
+
+    @staticmethod
+    def dependency_order(
+        importers: List[Type[base_parser_defs.ParserInterface]],
+    ) -> List[Type[base_parser_defs.ParserInterface]]:
+        """
+        the importers ordered so that each comes after the importers of the resources it depends on,
+        dependencies no importer provides are left out
+        """
+        graph = nx.DiGraph()
+        providers = {importer.name: importer for importer in importers}
+        for importer in importers:
+            graph.add_node(importer.name)
+            for dependency in importer.depends_on:
+                if dependency in providers:
+                    graph.add_edge(dependency, importer.name)
+        try:
+            return [
+                providers[name] for name in nx.lexicographical_topological_sort(graph)
+            ]
+        except nx.NetworkXUnfeasible:
+            raise ValueError(
+                f"importer dependencies form a cycle {nx.find_cycle(graph)}, cannot schedule them"
+            )
+
     def call_importers(self, db_connection_str: str):
         """
-        somehow finds all the importers that have been registered (either reflection for implementing classes or an explicit method that registers all available importers)
-        and schedules jobs to call those importers, monitors the jobs and alerts when done same as cre_main
+        finds all the importers that implement ParserInterface and schedules a job per importer, after the importers it depends on,
+        monitors the jobs and alerts when done same as cre_main.
+        The documents of every importer are parsed in parallel beforehand, the jobs run one at a time
+        because they all write to the SQLite database at db_connection_str, which takes one writer at a time
         """
         importers = []
         jobs = []
@@ -66,21 +151,38 @@ class BaseParser:
         for subclass in base_parser_defs.ParserInterface.__subclasses__():
             if import_only and subclass.name not in import_only:
                 continue
-
             importers.append(subclass)
-            sclass = subclass
-
-            jobs.append(
-                q.enqueue_call(
-                    description=sclass.name,
-                    func=BaseParser.register_resource,
-                    kwargs={
-                        "sclass": sclass,
-                        "db_connection_str": db_connection_str,
-                    },
-                    timeout=gap_analysis.GAP_ANALYSIS_TIMEOUT,
+
+        # parsing needs no other project, only resolving the links of what was parsed does
+        parsed = self.parse_all_documents(importers)
+        scheduled = {}
+        for sclass in self.dependency_order(importers):
+            dependencies = [
+                scheduled[name] for name in sclass.depends_on if name in scheduled
+            ]
+            if dependencies:
+                logger.info(
+                    f"{sclass.name} will be imported after {', '.join(job.description for job in dependencies)}"
                 )
+            if jobs and jobs[-1] not in dependencies:
+                dependencies.append(jobs[-1])
+            scheduled[sclass.name] = q.enqueue_call(
+                description=sclass.name,
+                func=BaseParser.register_resource,
+                kwargs={
+                    "sclass": sclass,
+                    "db_connection_str": db_connection_str,
+                    "parsed": parsed.get(sclass.name),
+                },
+                timeout=gap_analysis.GAP_ANALYSIS_TIMEOUT,
+                # a failed dependency leaves the importer with fewer links, not without a run
+                depends_on=(
+                    Dependency(jobs=dependencies, allow_failure=True)
+                    if dependencies
+                    else None
+                ),
             )
+            jobs.append(scheduled[sclass.name])
         t0 = time.perf_counter()
         total_resources = len(jobs)
         with alive_bar(theme="classic", total=total_resources) as bar:
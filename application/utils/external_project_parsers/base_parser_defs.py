@@ -1,26 +1,50 @@
-from typing import List, Dict, Optional
+import logging
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from dataclasses import dataclass
 from application.defs import cre_defs as defs
 from application.prompt_client import prompt_client as prompt_client
 from application.database import db
 
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
 # abstract class/interface that shows how to import a project that is not cre or its core resources
 
 
+class Reference(NamedTuple):
+    """
+    A link that needs the database, e.g. "CWE:79" stands for the CREs the CWE with section id 79 links to
+    """
+
+    resource: str
+    section_id: str
+    ltype: defs.LinkTypes = defs.LinkTypes.AutomaticallyLinkedTo
+
+    def __str__(self) -> str:
+        return f"{self.resource}:{self.section_id}"
+
+
 @dataclass
 class ParseResult(object):
     results: Dict[str, List[defs.Document]] = None
     calculate_gap_analysis: bool = True
     calculate_embeddings: bool = True
+    # the references of documents in results that have not been resolved yet
+    references: List[Tuple[defs.Document, Reference]] = None
 
 
 class ParserInterface(object):
     # The name of the resource being parsed
     name: str
+    # The names of the resources the parser links through, a parser runs after the parsers of its dependencies
+    # when they are imported together, resources no parser provides (e.g. from the core spreadsheet) should already exist
+    depends_on: List[str] = []
 
     def parse(
-        database: db.Node_collection,
-        prompt_client: Optional[prompt_client.PromptHandler],
+        self,
+        cache: db.Node_collection,
+        ph: Optional[prompt_client.PromptHandler],
     ) -> ParseResult:
         """
         Parses the resources of a project,
@@ -29,4 +53,36 @@ class ParserInterface(object):
         then calls cre_main.register_node
         Returns a dict with a key of the resource for importing and a value of list of documents with CRE links, optionally with their embeddings filled in
         """
+        return self.resolve(self.parse_documents(), cache)
+
+    def parse_documents(self) -> ParseResult:
+        """
+        Parses the resources of a project without touching the database so that it can run in another process,
+        links that need the database are returned as references for resolve()
+        """
         raise NotImplementedError
+
+    def resolve(self, result: ParseResult, cache: db.Node_collection) -> ParseResult:
+        """
+        Links the documents of the result of parse_documents to the CREs their references stand for,
+        with a query per referenced resource (and IN_QUERY_BATCH_SIZE section ids) instead of one per reference
+        """
+        references = result.references or []
+        section_ids: Dict[str, List[str]] = {}
+        for _, reference in references:
+            section_ids.setdefault(reference.resource, []).append(reference.section_id)
+        cres = {
+            resource: cache.get_CREs_of_nodes(name=resource, section_ids=ids)
+            for resource, ids in section_ids.items()
+        }
+        for document, reference in references:
+            linked = cres[reference.resource].get(reference.section_id)
+            if not linked:
+                logger.debug(f"{document.id} references {reference}, it has no CREs")
+                continue
+            for cre in linked:
+                if any(link.document.id == cre.id for link in document.links):
+                    continue
+                document.add_link(defs.Link(document=cre, ltype=reference.ltype))
+        result.references = None
+        return result
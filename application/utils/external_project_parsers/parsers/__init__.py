@@ -0,0 +1,15 @@
+# imported by base_parser so that call_importers finds every ParserInterface implementation
+__all__ = [
+    "capec_parser",
+    "ccmv4",
+    "cheatsheets_parser",
+    "cloud_native_security_controls",
+    "cwe",
+    "dsomm",
+    "iso27001",
+    "juiceshop",
+    "misc_tools_parser",
+    "pci_dss",
+    "secure_headers",
+    "zap_alerts_parser",
+]
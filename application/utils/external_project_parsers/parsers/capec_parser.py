@@ -2,7 +2,7 @@ import logging
 import os
 import tempfile
 import requests
-from typing import Dict
+from typing import Dict, List, Tuple
 from application.database import db
 from application.defs import cre_defs as defs
 import xmltodict
@@ -14,21 +14,27 @@ logger.setLevel(logging.INFO)
 from application.utils.external_project_parsers.base_parser_defs import (
     ParserInterface,
     ParseResult,
+    Reference,
 )
 from application.prompt_client import prompt_client as prompt_client
 
 
 class Capec(ParserInterface):
     name = "CAPEC"
+    depends_on = ["CWE"]
     capec_xml = "https://capec.mitre.org/data/xml/capec_latest.xml"
 
-    def parse(self, cache: db.Node_collection, ph: prompt_client.PromptHandler):
+    def parse_documents(self) -> ParseResult:
         xml = requests.get(self.capec_xml)
         if xml.status_code == 200:
+            references = []
             return ParseResult(
                 results={
-                    self.name: self.register_capec(xml_contents=xml.text, cache=cache)
-                }
+                    self.name: self.register_capec(
+                        xml_contents=xml.text, references=references
+                    )
+                },
+                references=references,
             )
         else:
             logger.fatal(f"Could not get CAPEC's XML data, error was {xml.text}")
@@ -36,25 +42,10 @@ class Capec(ParserInterface):
     def make_hyperlink(self, capec_id: int):
         return f"https://capec.mitre.org/data/definitions/{capec_id}.html"
 
-    def link_capec_to_cwe_cre(
-        self, cache: db.Node_collection, capec: defs.Standard, cwe_id: str
-    ) -> defs.Standard:
-        cwes = cache.get_nodes(name="CWE", sectionID=cwe_id)
-        if cwes:
-            for cre in [
-                c.document
-                for c in cwes[0].links
-                if c.document.doctype == defs.Credoctypes.CRE
-            ]:
-                logger.debug(
-                    f"linked CAPEC with id {capec.section} to CRE with ID {cre.id}"
-                )
-                capec = capec.add_link(
-                    defs.Link(document=cre, ltype=defs.LinkTypes.AutomaticallyLinkedTo)
-                )
-        return capec
-
-    def register_capec(self, cache: db.Node_collection, xml_contents: str):
+    def register_capec(
+        self, xml_contents: str, references: List[Tuple[defs.Standard, Reference]]
+    ):
+        """the CAPEC entries of the xml, appends the CWEs each links through to references"""
         attack_pattern_catalogue = {}
 
         attack_pattern_catalogue = xmltodict.parse(xml_contents).get(
@@ -80,14 +71,12 @@ class Capec(ParserInterface):
                             for cwe_entry in lst:
                                 if isinstance(cwe_entry, Dict):
                                     for _, cwe_id in cwe_entry.items():
-                                        capec = self.link_capec_to_cwe_cre(
-                                            capec=capec, cache=cache, cwe_id=cwe_id
+                                        references.append(
+                                            (capec, Reference("CWE", cwe_id))
                                         )
                                 else:
                                     id = lst["@CWE_ID"]
-                                    capec = self.link_capec_to_cwe_cre(
-                                        capec=capec, cache=cache, cwe_id=id
-                                    )
+                                    references.append((capec, Reference("CWE", id)))
                     else:
                         logger.error(
                             f"CAPEC {capec.section} does not have any related CWE weaknesses, skipping automated linking"
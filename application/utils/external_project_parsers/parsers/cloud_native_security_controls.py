@@ -47,16 +47,15 @@ class CloudNativeSecurityControls(ParserInterface):
             existing = cache.get_nodes(
                 name=cnsc.name, section=cnsc.section, sectionID=cnsc.sectionID
             )
-            if existing:
-                embeddings = cache.get_embeddings_for_doc(existing[0])
-                if embeddings:
-                    logger.info(
-                        f"Node {cnsc.todict()} already exists and has embeddings, skipping"
-                    )
-                    continue
+            if existing and ph.has_current_embedding(existing[0], cnsc.subsection):
+                logger.info(
+                    f"Node {cnsc.todict()} already exists and its embeddings are up to date, skipping"
+                )
+                continue
             cnsc_embeddings = ph.get_text_embeddings(cnsc.subsection)
             cnsc.embeddings = cnsc_embeddings
             cnsc.embeddings_text = cnsc.subsection
+            cnsc.embeddings_model = ph.embeddings_model()
             cre_id = ph.get_id_of_most_similar_cre(cnsc_embeddings)
             if not cre_id:
                 logger.info(
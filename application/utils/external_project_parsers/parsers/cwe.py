@@ -2,7 +2,7 @@ import logging
 import os
 import tempfile
 import requests
-from typing import Dict
+from typing import Dict, List, Tuple
 from application.database import db
 from application.defs import cre_defs as defs
 import shutil
@@ -11,6 +11,7 @@ from application.prompt_client import prompt_client
 from application.utils.external_project_parsers.base_parser_defs import (
     ParserInterface,
     ParseResult,
+    Reference,
 )
 
 logging.basicConfig()
@@ -20,9 +21,12 @@ logger.setLevel(logging.INFO)
 
 class CWE(ParserInterface):
     name = "CWE"
+    # CRE_LINK_CWE_THROUGH_CAPEC links through the CAPEC of a previous import,
+    # CAPEC itself links through CWE so it cannot be a dependency
+    depends_on: List[str] = []
     cwe_zip = "https://cwe.mitre.org/data/xml/cwec_latest.xml.zip"
 
-    def parse(self, cache: db.Node_collection, ph: prompt_client.PromptHandler):
+    def parse_documents(self) -> ParseResult:
         response = requests.get(self.cwe_zip, stream=True)
         tmp_dir = tempfile.mkdtemp()
         handle, fname = tempfile.mkstemp(suffix=".zip", dir=tmp_dir)
@@ -36,59 +40,67 @@ class CWE(ParserInterface):
         for _, _, files in os.walk(tmp_dir, topdown=False):
             for file in files:
                 if file.startswith("cwe") and file.endswith(".xml"):
+                    references = []
                     return ParseResult(
                         results={
                             self.name: self.register_cwe(
-                                xml_file=os.path.join(tmp_dir, file), cache=cache
+                                xml_file=os.path.join(tmp_dir, file),
+                                references=references,
                             ),
                         },
                         calculate_gap_analysis=False,
+                        references=references,
                     )
         raise RuntimeError("there is no file named cwe.xml in the target zip")
 
+    def resolve(self, result: ParseResult, cache: db.Node_collection) -> ParseResult:
+        """
+        cwe is a special case because it already partially exists in our spreadsheet,
+        the CWEs we know of are updated with the name and hyperlink of the catalog and keep their links
+        """
+        known: Dict[str, defs.Standard] = {}
+        for node in cache.get_nodes(name=self.name) or []:
+            known.setdefault(node.sectionID, node)
+        entries = []
+        replaced: Dict[int, defs.Standard] = {}
+        for cwe in result.results[self.name]:
+            existing = known.get(cwe.sectionID)
+            if existing:
+                if (existing.section, existing.hyperlink) != (
+                    cwe.section,
+                    cwe.hyperlink,
+                ):
+                    existing.section = cwe.section
+                    existing.hyperlink = cwe.hyperlink
+                    cache.add_node(
+                        existing,
+                        comparison_skip_attributes=[
+                            "link",
+                            "section",
+                            "version",
+                            "subsection",
+                            "tags",
+                            "description",
+                        ],
+                    )
+                replaced[id(cwe)] = existing
+                cwe = existing
+            entries.append(cwe)
+        result.results[self.name] = entries
+        result.references = [
+            (replaced.get(id(cwe), cwe), reference)
+            for cwe, reference in result.references or []
+        ]
+        return super().resolve(result, cache)
+
     def make_hyperlink(self, cwe_id: int):
         return f"https://cwe.mitre.org/data/definitions/{cwe_id}.html"
 
-    def link_cwe_to_capec_cre(
-        self, cwe: defs.Standard, cache: db.Node_collection, capec_id: str
-    ) -> defs.Standard:
-        capecs = cache.get_nodes(name="CAPEC", sectionID=capec_id)
-        if capecs:
-            for cre in [
-                c.document
-                for c in capecs[0].links
-                if c.document.doctype == defs.Credoctypes.CRE
-            ]:
-                logger.debug(
-                    f"linked CWE with id {cwe.sectionID} to CRE with ID {cre.id}"
-                )
-                cwe.add_link(
-                    defs.Link(document=cre, ltype=defs.LinkTypes.AutomaticallyLinkedTo)
-                )
-        return cwe
-
-    def link_to_related_cwe(
-        self, cwe: defs.Standard, cache: db.Node_collection, related_id: str
-    ) -> defs.Standard:
-        related_cwes = cache.get_nodes(name="CWE", sectionID=related_id)
-        if related_cwes:
-            for cre in [
-                c.document
-                for c in related_cwes[0].links
-                if c.document.doctype == defs.Credoctypes.CRE
-            ]:
-                logger.debug(
-                    f"linked CWE with id {cwe.sectionID} to CRE with ID {cre.id}"
-                )
-                cwe.add_link(
-                    defs.Link(document=cre, ltype=defs.LinkTypes.AutomaticallyLinkedTo)
-                )
-        return cwe
-
-    # cwe is a special case because it already partially exists in our spreadsheet
-    # register should, instead of linking Just find the existing CWEs, update them with relevant info and update the relationships between CRE and CWE
     # let's make CAPEC optional and by default off for now
-    def register_cwe(self, cache: db.Node_collection, xml_file: str):
+    def register_cwe(
+        self, xml_file: str, references: List[Tuple[defs.Standard, Reference]]
+    ):
+        """the CWE entries of the xml, appends the CAPECs and related CWEs each links through to references"""
         statuses = {}
         entries = []
         with open(xml_file, "r") as xml:
@@ -103,29 +115,12 @@ class CWE(ParserInterface):
                     "Draft",
                     "PROHIBITED",
                 ]:
-                    cwes = cache.get_nodes(self.name, sectionID=weakness["@ID"])
-                    if cwes:  # update the CWE in the database
-                        cwe = cwes[0]
-                        cwe.section = weakness["@Name"]
-                        cwe.hyperlink = self.make_hyperlink(weakness["@ID"])
-                        cache.add_node(
-                            cwe,
-                            comparison_skip_attributes=[
-                                "link",
-                                "section",
-                                "version",
-                                "subsection",
-                                "tags",
-                                "description",
-                            ],
-                        )
-                    else:  # we found something new
-                        cwe = defs.Standard(
-                            name="CWE",
-                            sectionID=weakness["@ID"],
-                            section=weakness["@Name"],
-                            hyperlink=self.make_hyperlink(weakness["@ID"]),
-                        )
+                    cwe = defs.Standard(
+                        name="CWE",
+                        sectionID=weakness["@ID"],
+                        section=weakness["@Name"],
+                        hyperlink=self.make_hyperlink(weakness["@ID"]),
+                    )
                     logger.debug(f"Registered CWE with id {cwe.sectionID}")
 
                     if weakness.get("Related_Attack_Patterns") and os.environ.get(
@@ -135,14 +130,12 @@ class CWE(ParserInterface):
                             for capec_entry in lst:
                                 if isinstance(capec_entry, Dict):
                                     for _, capec_id in capec_entry.items():
-                                        cwe = self.link_cwe_to_capec_cre(
-                                            cwe=cwe, cache=cache, capec_id=capec_id
+                                        references.append(
+                                            (cwe, Reference("CAPEC", capec_id))
                                         )
                                 else:
                                     id = lst["@CAPEC_ID"]
-                                    cwe = self.link_cwe_to_capec_cre(
-                                        cwe=cwe, cache=cache, capec_id=id
-                                    )
+                                    references.append((cwe, Reference("CAPEC", id)))
                     else:
                         logger.info(
                             f"CWE '{cwe.sectionID}-{cwe.section}' does not have any related CAPEC attack patterns, skipping automated linking"
@@ -150,20 +143,22 @@ class CWE(ParserInterface):
                     if weakness.get("Related_Weaknesses"):
                         if isinstance(weakness.get("Related_Weaknesses"), list):
                             for related_weakness in weakness.get("Related_Weaknesses"):
-                                cwe = self.parse_related_weakness(
-                                    cache, related_weakness, cwe
+                                self.parse_related_weakness(
+                                    related_weakness, cwe, references
                                 )
                         else:
-                            cwe = self.parse_related_weakness(
-                                cache, weakness.get("Related_Weaknesses"), cwe
+                            self.parse_related_weakness(
+                                weakness.get("Related_Weaknesses"), cwe, references
                             )
                     entries.append(cwe)
         return entries
 
     def parse_related_weakness(
-        self, cache: db.Node_collection, rw: Dict[str, Dict], cwe: defs.Standard
-    ) -> defs.Standard:
+        self,
+        rw: Dict[str, Dict],
+        cwe: defs.Standard,
+        references: List[Tuple[defs.Standard, Reference]],
+    ) -> None:
         cwe_entry = rw.get("Related_Weakness")
         if isinstance(cwe_entry, Dict):
-            id = cwe_entry["@CWE_ID"]
-            return self.link_to_related_cwe(cwe=cwe, cache=cache, related_id=id)
+            references.append((cwe, Reference("CWE", cwe_entry["@CWE_ID"])))
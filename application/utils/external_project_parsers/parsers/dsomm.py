@@ -17,6 +17,7 @@ logger.setLevel(logging.INFO)
 
 class DSOMM(ParserInterface):
     name = "DevSecOps Maturity Model (DSOMM)"
+    depends_on = ["SAMM", "ISO 27001"]
     means_none = [
         "Not explicitly covered by ISO 27001 - too specific",
         "Not explicitly covered by ISO 27001",
@@ -58,16 +58,16 @@ class JuiceShop(ParserInterface):
             existing = cache.get_nodes(
                 name=chal.name, section=chal.section, sectionID=chal.sectionID
             )
-            if existing:
-                embeddings = cache.get_embeddings_for_doc(existing[0])
-                if embeddings:
-                    logger.info(
-                        f"Node {chal.todict()} already exists and has embeddings, skipping"
-                    )
-                    continue
-            challenge_embeddings = ph.get_text_embeddings(",".join(chal.tags))
+            embeddings_text = ",".join(chal.tags)
+            if existing and ph.has_current_embedding(existing[0], embeddings_text):
+                logger.info(
+                    f"Node {chal.todict()} already exists and its embeddings are up to date, skipping"
+                )
+                continue
+            challenge_embeddings = ph.get_text_embeddings(embeddings_text)
             chal.embeddings = challenge_embeddings
-            chal.embeddings_text = ",".join(chal.tags)
+            chal.embeddings_text = embeddings_text
+            chal.embeddings_model = ph.embeddings_model()
             if not challenge_embeddings:
                 logger.fatal(f"Cannot get embeddings for challenge {chal.section}")
                 return
@@ -62,16 +62,18 @@ class PciDss(ParserInterface):
                 section=pci_control.section,
                 sectionID=pci_control.sectionID,
             )
-            if existing:
-                embeddings = cache.get_embeddings_for_doc(existing[0])
-                if embeddings:
-                    logger.info(
-                        f"Node {pci_control.todict()} already exists and has embeddings, skipping"
-                    )
+            # the text is taken before the embeddings are set, they are part of the repr
+            embeddings_text = pci_control.__repr__()
+            if existing and prompt.has_current_embedding(existing[0], embeddings_text):
+                logger.info(
+                    f"Node {pci_control.todict()} already exists and its embeddings are up to date, skipping"
+                )
+                continue
 
-            control_embeddings = prompt.get_text_embeddings(pci_control.__repr__())
+            control_embeddings = prompt.get_text_embeddings(embeddings_text)
             pci_control.embeddings = control_embeddings
-            pci_control.embeddings_text = pci_control.__repr__()
+            pci_control.embeddings_text = embeddings_text
+            pci_control.embeddings_model = prompt.embeddings_model()
             # these embeddings are different to the ones generated from --generate embeddings, this is because we want these embedding to include the optional "description" field, it is not a big difference and cosine similarity works reasonably accurately without it but good to have
             cre_id = prompt.get_id_of_most_similar_cre(control_embeddings)
             if not cre_id:
@@ -22,6 +22,7 @@ from application.utils.external_project_parsers.base_parser_defs import (
 
 class ZAP(ParserInterface):
     name = "ZAP Rule"
+    depends_on = ["CWE", "Top10 2017", "Top10 2021"]
     zap_md_cwe_regexp = r"cwe: ?(?P<cweId>\d+)"
     zap_md_title_regexp = r"title: ?(?P<title>\".+\")"
     zap_md_alert_id_regexp = r"alertid: ?(?P<id>\d+(-\d+)?)"
@@ -2,7 +2,7 @@ import requests
 import time
 import logging
 from rq import Queue, job, exceptions
-from typing import List, Dict
+from typing import Any, Dict, List, Set
 from application.utils import redis
 from application.database import db
 from flask import json as flask_json
@@ -33,6 +33,34 @@ def make_subresources_key(standards: List[str], key: str) -> str:
     return str(make_resources_key(standards)) + "->" + key
 
 
+def make_cre_dependency(cre_id: str) -> str:
+    """the dependency of a gap analysis result on a CRE (by external id)"""
+    return f"{defs.Credoctypes.CRE.value}: {cre_id}"
+
+
+def make_standard_dependency(name: str) -> str:
+    """the dependency of a gap analysis result on every section of a standard"""
+    return f"Node: {name}"
+
+
+def get_key_dependencies(cache_key: str) -> Set[str]:
+    """the standards a gap analysis result is keyed on, subresources go with their result"""
+    if "->" in cache_key:
+        return set()
+    return {make_standard_dependency(name) for name in cache_key.split(" >> ")}
+
+
+def get_paths_dependencies(paths: List[Dict[str, Any]]) -> Set[str]:
+    """the CREs the paths of a gap analysis go through"""
+    dependencies = set()
+    for path in paths:
+        for step in path["path"]:
+            for doc in (step["start"], step["end"]):
+                if doc.doctype == defs.Credoctypes.CRE:
+                    dependencies.add(make_cre_dependency(doc.id))
+    return dependencies
+
+
 def get_path_score(path):
     score = 0
     previous_id = path["start"].id
@@ -107,6 +135,22 @@ def schedule(standards: List[str], database):
     return {"job_id": gap_analysis_job.id}
 
 
+def reschedule(cache_keys: List[str], database) -> List[str]:
+    """
+    Schedules the gap analyses of cache_keys again, for results that were invalidated,
+    returns the ids of the jobs scheduled
+    """
+    conn = redis.connect()
+    job_ids = []
+    for cache_key in cache_keys:
+        # the job that calculated the invalidated result has finished, schedule() would return it
+        conn.delete(cache_key)
+        scheduled = schedule(standards=cache_key.split(" >> "), database=database)
+        if scheduled.get("job_id"):
+            job_ids.append(scheduled.get("job_id"))
+    return job_ids
+
+
 def preload(target_url: str):
     waiting = []
     standards_request = requests.get(f"{target_url}/rest/v1/standards")
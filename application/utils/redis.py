@@ -79,6 +79,10 @@ def wait_for_jobs(jobs: List[rq.job.Job], callback: Callable = None):
                 )
                 jobs.pop(jobs.index(job))
                 callback()
+            elif job.is_deferred:
+                logger.info(
+                    f"job {job.description} is waiting for the jobs it depends on"
+                )
             elif job.is_queued:
                 logger.info(
                     f"job {job.description} is {job.get_status()}, if your system allows it, try starting a worker to pick it up"
@@ -230,6 +230,7 @@ class ExportSheet:
             self.input_cres.values(), key=lambda x: cre_id_to_depth[x.id]
         )
 
+        root = None
         for cre in sorted_cres:
             processed = False
             depth = cre_id_to_depth[cre.id]
@@ -243,7 +244,10 @@ class ExportSheet:
                 continue
 
             # not so happy path second, find if there is a processed cre that has a path to this cre
+            connected = storage.get_connected_cre_ids(cre.id)
             for id in self.processed_ids:
+                if id not in connected:
+                    continue
                 path = storage.get_cre_path(fromID=cre.id, toID=id)
                 if path:
                     # we skip the last element as it is the cre we are looking for
@@ -254,9 +258,12 @@ class ExportSheet:
                 continue
             # if we still have the cre, it means it needs a path to a root cre and we need to append it to the body
             # find the root this cre is linked to
-            root = storage.get_root_cres()
+            if root is None:
+                root = storage.get_root_cres()
 
             for r in root:
+                if r.id not in connected:
+                    continue
                 path = storage.get_cre_path(fromID=r.id, toID=cre.id)
                 if path:
                     pathIndex = 0
@@ -3,20 +3,23 @@
 # silence mypy for the routes file
 import csv
 from functools import wraps
+import hashlib
 import json
 import logging
 import os
 import io
 import pathlib
 import urllib.parse
+import uuid
 from alive_progress import alive_bar
 from typing import Any
 from application.utils import oscal_utils, redis
 
-from rq import job, exceptions
+from rq import Queue, job, exceptions
 
 from application.utils import spreadsheet_parsers
 from application.utils import oscal_utils, redis
+from application import cache
 from application.database import db
 from application.cmd import cre_main
 from application.defs import cre_defs as defs
@@ -29,8 +32,11 @@ from enum import Enum
 from flask import json as flask_json
 from flask import (
     Blueprint,
+    Response,
     abort,
+    current_app,
     jsonify,
+    make_response,
     redirect,
     request,
     send_from_directory,
@@ -46,6 +52,10 @@ import google.auth.transport.requests
 
 
 ITEMS_PER_PAGE = 20
+CONTENT_GENERATION_CACHE_KEY = "content_generation"
+COMPLETION_STREAM_TIMEOUT = "300s"
+# how soon a client reading a completion stream asks for the next events, see chat_cre_stream_events
+COMPLETION_STREAM_RETRY_MS = 250
 
 app = Blueprint(
     "web",
@@ -106,8 +116,72 @@ if os.environ.get("POSTHOG_API_KEY") and os.environ.get("POSTHOG_HOST"):
     )
 
 
+def content_generation() -> int:
+    """
+    The database content generation, kept in the response cache for
+    CONTENT_GENERATION_CACHE_SECONDS so that revalidating a response does not hit the database
+    """
+    timeout = current_app.config.get("CONTENT_GENERATION_CACHE_SECONDS", 0)
+    generation = cache.get(CONTENT_GENERATION_CACHE_KEY) if timeout else None
+    if generation is None:
+        generation = int(db.Node_collection().get_generation())
+        if timeout:
+            cache.set(CONTENT_GENERATION_CACHE_KEY, generation, timeout=timeout)
+    return generation
+
+
+def invalidate_response_cache() -> None:
+    """
+    Forgets the cached content generation, the cached responses are keyed by generation
+    so the next request after a write made by this process gets the new content
+    """
+    cache.delete(CONTENT_GENERATION_CACHE_KEY)
+
+
+def cached_response(f):
+    """
+    Memoises a read endpoint on its full path and query string for the current content generation.
+    Responses carry a strong ETag derived from the same key, a matching If-None-Match gets a 304
+    """
+
+    @wraps(f)
+    def cached(*args, **kwargs):
+        etag = hashlib.sha1(
+            f"{content_generation()}:{request.full_path}".encode()
+        ).hexdigest()
+        # flask-compress suffixes strong etags with the compression algorithm
+        if any(tag.split(":")[0] == etag for tag in request.if_none_match):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        key = f"response:{etag}"
+        cached_value = cache.get(key)
+        if cached_value is None:
+            response = make_response(f(*args, **kwargs))
+            cached_value = (
+                response.get_data(),
+                response.status_code,
+                [
+                    (name, value)
+                    for name, value in response.headers.items()
+                    if name.lower() not in ("content-length", "etag")
+                ],
+            )
+            if response.status_code == 200:
+                cache.set(key, cached_value)
+
+        data, status, headers = cached_value
+        response = Response(data, status=status, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    return cached
+
+
 @app.route("/rest/v1/id/<creid>", methods=["GET"])
 @app.route("/rest/v1/name/<crename>", methods=["GET"])
+@cached_response
 def find_cre(creid: str = None, crename: str = None) -> Any:  # refer
     if posthog:
         posthog.capture(f"find_cre", f"id:{creid};name{crename}")
@@ -144,6 +218,7 @@ def find_cre(creid: str = None, crename: str = None) -> Any:  # refer
 
 @app.route("/rest/v1/<ntype>/<name>", methods=["GET"])
 @app.route("/rest/v1/standard/<name>", methods=["GET"])
+@cached_response
 def find_node_by_name(name: str, ntype: str = defs.Credoctypes.Standard.value) -> Any:
     if posthog:
         posthog.capture(f"find_node_by_name", f"hame:{name};nodeType{ntype}")
@@ -355,6 +430,7 @@ def fetch_job() -> Any:
 
 
 @app.route("/rest/v1/standards", methods=["GET"])
+@cached_response
 def standards() -> Any:
     if posthog:
         posthog.capture(f"standards", "")
@@ -365,6 +441,7 @@ def standards() -> Any:
 
 
 @app.route("/rest/v1/text_search", methods=["GET"])
+@cached_response
 def text_search() -> Any:
     """
     Performs arbitrary text search among all known documents.
@@ -375,7 +452,8 @@ def text_search() -> Any:
               all entries of <name> and optionally, section/subsection
         * '\d\d\d-\d\d\d' (two sets of 3 digits) will first try to match
                            CRE ids before it performs a free text search
-        Anything else will be a case insensitive LIKE query in the database
+        Anything else will be a ranked full text search in the database,
+        paginated with the optional page and items_per_page arguments
     """
     database = db.Node_collection()
     text = request.args.get("text")
@@ -383,7 +461,17 @@ def text_search() -> Any:
         posthog.capture(f"text_search", f"text:{text}")
 
     opt_format = request.args.get("format")
-    documents = database.text_search(text)
+    page = 1
+    if request.args.get("page") is not None and int(request.args.get("page")) > 0:
+        page = int(request.args.get("page"))
+    items_per_page = None
+    if (
+        request.args.get("items_per_page") is not None
+        and int(request.args.get("items_per_page")) > 0
+    ):
+        items_per_page = int(request.args.get("items_per_page"))
+
+    documents = database.text_search(text, page=page, items_per_page=items_per_page)
     if documents:
         if opt_format == SupportedFormats.Markdown.value:
             return f"<pre>{mdutils.cre_to_md(documents)}</pre>"
@@ -402,6 +490,7 @@ def text_search() -> Any:
 
 
 @app.route("/rest/v1/root_cres", methods=["GET"])
+@cached_response
 def find_root_cres() -> Any:
     """
     Useful for fast browsing the graph from the top
@@ -565,7 +654,11 @@ def before_request():
 
 @app.after_request
 def add_header(response):
-    response.cache_control.max_age = 300
+    if response.get_etag()[0]:
+        # clients revalidate with If-None-Match, which is answered from the response cache
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = 300
     return response
 
 
@@ -599,6 +692,72 @@ def chat_cre() -> Any:
     return jsonify(response)
 
 
+@app.route("/rest/v1/completion/stream", methods=["POST"])
+@login_required
+def chat_cre_stream() -> Any:
+    """
+    chat_cre with the answer sent as the llm generates it instead of once it is complete.
+    The completion runs as a background job (prompt_client.stream_completion) so no web worker waits on the llm,
+    the client reads its events from chat_cre_stream_events with the returned job id
+    """
+    message = request.get_json(force=True)
+    if posthog:
+        posthog.capture(f"chat_cre_stream", "")
+
+    stream_id = str(uuid.uuid4())
+    q = Queue(connection=redis.connect())
+    q.enqueue_call(
+        prompt_client.stream_completion,
+        kwargs={"prompt": message.get("prompt"), "stream_id": stream_id},
+        timeout=COMPLETION_STREAM_TIMEOUT,
+        job_id=stream_id,
+    )
+    return jsonify({"job_id": stream_id})
+
+
+@app.route("/rest/v1/completion/stream/<job_id>", methods=["GET"])
+@login_required
+def chat_cre_stream_events(job_id: str) -> Any:
+    """
+    The events of the completion job_id the client has not read yet, as server-sent events,
+    see PromptHandler.generate_text_stream for the events.
+    It answers at once with the events there are, an EventSource comes back after COMPLETION_STREAM_RETRY_MS
+    with the id of the last event it got in Last-Event-ID, so reading a stream never holds a web worker either
+    """
+    start = request.headers.get("Last-Event-ID") or request.args.get("from") or "0"
+    if not start.isdigit():
+        abort(400, "the last event id should be a number")
+    start = int(start)
+    conn = redis.connect()
+    events = [
+        flask_json.loads(e)
+        for e in conn.lrange(prompt_client.completion_stream_key(job_id), start, -1)
+    ]
+    if not events:
+        try:
+            res = job.Job.fetch(id=job_id, connection=conn)
+        except exceptions.NoSuchJobError:
+            abort(404, "No such completion")
+        if res.get_status() in (
+            job.JobStatus.FAILED,
+            job.JobStatus.STOPPED,
+            job.JobStatus.CANCELED,
+        ):
+            # e.g. timed out, stream_completion did not get to record the error
+            events = [("error", "could not generate an answer")]
+
+    body = [f"retry: {COMPLETION_STREAM_RETRY_MS}\n\n"]
+    for event_id, (event, data) in enumerate(events, start + 1):
+        body.append(
+            f"id: {event_id}\nevent: {event}\ndata: {flask_json.dumps(data)}\n\n"
+        )
+    return Response(
+        "".join(body),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 class CREFlow:
     """ "This class handles authentication with google's oauth"""
 
@@ -707,6 +866,7 @@ def logout():
 
 
 @app.route("/rest/v1/all_cres", methods=["GET"])
+@cached_response
 def all_cres() -> Any:
     database = db.Node_collection()
     if posthog:
@@ -802,6 +962,9 @@ def import_from_cre_csv() -> Any:
             generate_embeddings=calculate_embeddings,
             calculate_gap_analysis=calculate_gap_analysis,
         )
+    if calculate_gap_analysis:
+        cre_main.recalculate_gap_analyses(database)
+    invalidate_response_cache()
     return jsonify(
         {
             "status": "success",
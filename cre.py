@@ -211,6 +211,11 @@ def main() -> None:
         default="",
         help="preload map analysis for all possible 2 standards combinations, use target url as an OpenCRE base",
     )
+    parser.add_argument(
+        "--recalculate_map_analysis",
+        action="store_true",
+        help="calculate the map analysis of every 2 standards combination in one batch with the in memory engine, replacing stored results",
+    )
     parser.add_argument(
         "--delete_map_analysis_for",
         default="",
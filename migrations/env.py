@@ -7,6 +7,7 @@ from alembic import context
 from flask import current_app  # type: ignore
 
 from application.database.db import BaseModel
+from application.database import text_index
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -26,6 +27,16 @@ config.set_main_option(
 )
 target_metadata = current_app.extensions["migrate"].db.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # the free text index tables are maintained by application.database.text_index, not the ORM
+    if type_ == "table" and reflected and compare_to is None:
+        return not any(
+            name.startswith(f"{table}_search") for table in text_index.INDEXED_COLUMNS
+        )
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -45,7 +56,12 @@ def run_migrations_offline():
 
     """
     url = config.get_main_option("sqlalchemy.url")
-    context.configure(url=url, target_metadata=target_metadata, literal_binds=True)
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        include_object=include_object,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
@@ -76,7 +92,8 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
-            **current_app.extensions["migrate"].configure_args
+            include_object=include_object,
+            **current_app.extensions["migrate"].configure_args,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,33 @@
+"""free text search index
+
+Revision ID: 9a3c51f2e7d4
+Revises: 0d1e6b2c8a41
+Create Date: 2026-10-18 12:40:05.118923
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from application.database import text_index
+
+
+# revision identifiers, used by Alembic.
+revision = "9a3c51f2e7d4"
+down_revision = "0d1e6b2c8a41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # not autogenerated, the index (fts5 tables on sqlite, gin indexes on postgres) is invisible to the ORM
+    bind = op.get_bind()
+    for table in text_index.INDEXED_COLUMNS:
+        text_index.create(bind, table)
+        text_index.rebuild(bind, table)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table in text_index.INDEXED_COLUMNS:
+        text_index.drop(bind, table)
@@ -0,0 +1,132 @@
+"""store embeddings as float32 blobs
+
+Revision ID: e5b8d2f04a17
+Revises: c41f7a9e2b6d
+Create Date: 2026-10-18 16:41:09.218734
+
+"""
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e5b8d2f04a17"
+down_revision = "c41f7a9e2b6d"
+branch_labels = None
+depends_on = None
+
+# the same encoding as db.encode_embeddings, migrations do not import the application
+EMBEDDINGS_DTYPE = np.dtype("<f4")
+BATCH_SIZE = 500
+
+embeddings = sa.table(
+    "embeddings",
+    sa.column("embeddings", sa.String),
+    sa.column("doc_type", sa.String),
+    sa.column("cre_id", sa.String),
+    sa.column("node_id", sa.String),
+    sa.column("embeddings_vector", sa.LargeBinary),
+    sa.column("embeddings_dimensions", sa.Integer),
+    sa.column("embeddings_norm", sa.Float),
+)
+
+
+def converted(rows, convert):
+    """executemany parameters for the rows of a batch, keyed on the primary key"""
+    return [
+        {
+            "b_doc_type": row.doc_type,
+            "b_cre_id": row.cre_id,
+            "b_node_id": row.node_id,
+            **convert(row),
+        }
+        for row in rows
+    ]
+
+
+def update_by_key():
+    return embeddings.update().where(
+        sa.and_(
+            embeddings.c.doc_type == sa.bindparam("b_doc_type"),
+            embeddings.c.cre_id == sa.bindparam("b_cre_id"),
+            embeddings.c.node_id == sa.bindparam("b_node_id"),
+        )
+    )
+
+
+def to_vector(row):
+    vector = np.array(row.embeddings.split(","), dtype=EMBEDDINGS_DTYPE)
+    return {
+        "embeddings": "",
+        "embeddings_vector": vector.tobytes(),
+        "embeddings_dimensions": len(vector),
+        "embeddings_norm": float(np.linalg.norm(vector)),
+    }
+
+
+def to_string(row):
+    vector = np.frombuffer(row.embeddings_vector, dtype=EMBEDDINGS_DTYPE)
+    return {
+        "embeddings": ",".join(str(e) for e in vector.tolist()),
+        "embeddings_vector": None,
+        "embeddings_dimensions": None,
+        "embeddings_norm": None,
+    }
+
+
+def upgrade():
+    with op.batch_alter_table("embeddings", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("embeddings_vector", sa.LargeBinary(), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("embeddings_dimensions", sa.Integer(), nullable=True)
+        )
+        batch_op.add_column(sa.Column("embeddings_norm", sa.Float(), nullable=True))
+        # the embeddings string is emptied once converted, it cannot be part of the key
+        # (fffdc0652e27 keys the table on these columns already, the model did not)
+        batch_op.drop_constraint("uq_entry", type_="primary")
+        batch_op.create_primary_key("uq_entry", ["doc_type", "cre_id", "node_id"])
+
+    # a batch at a time, converted rows leave the selection
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(
+            sa.select(
+                embeddings.c.embeddings,
+                embeddings.c.doc_type,
+                embeddings.c.cre_id,
+                embeddings.c.node_id,
+            )
+            .where(embeddings.c.embeddings_vector.is_(None))
+            .where(embeddings.c.embeddings != "")
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(update_by_key(), converted(rows, to_vector))
+
+
+def downgrade():
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(
+            sa.select(
+                embeddings.c.embeddings_vector,
+                embeddings.c.doc_type,
+                embeddings.c.cre_id,
+                embeddings.c.node_id,
+            )
+            .where(embeddings.c.embeddings_vector.is_not(None))
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(update_by_key(), converted(rows, to_string))
+
+    with op.batch_alter_table("embeddings", schema=None) as batch_op:
+        batch_op.drop_column("embeddings_norm")
+        batch_op.drop_column("embeddings_dimensions")
+        batch_op.drop_column("embeddings_vector")
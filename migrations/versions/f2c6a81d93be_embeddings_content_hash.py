@@ -0,0 +1,96 @@
+"""record the hash of the embedded text and the embedding model
+
+Revision ID: f2c6a81d93be
+Revises: e5b8d2f04a17
+Create Date: 2026-10-18 19:12:44.503127
+
+"""
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f2c6a81d93be"
+down_revision = "e5b8d2f04a17"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+# the models that made embeddings before the model was recorded, told apart by the dimensions of their embeddings
+MODELS_BY_DIMENSIONS = {
+    1536: "text-embedding-ada-002",
+    3072: "gemini-embedding-exp-03-07",
+}
+
+embeddings = sa.table(
+    "embeddings",
+    sa.column("doc_type", sa.String),
+    sa.column("cre_id", sa.String),
+    sa.column("node_id", sa.String),
+    sa.column("embeddings_content", sa.String),
+    sa.column("embeddings_content_hash", sa.String),
+    sa.column("embeddings_dimensions", sa.Integer),
+    sa.column("embeddings_model", sa.String),
+)
+
+
+def upgrade():
+    with op.batch_alter_table("embeddings", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("embeddings_content_hash", sa.String(), nullable=True)
+        )
+        batch_op.add_column(sa.Column("embeddings_model", sa.String(), nullable=True))
+        batch_op.create_index(
+            "ix_embeddings_embeddings_content_hash", ["embeddings_content_hash"]
+        )
+
+    # the same hash as db.embeddings_content_hash
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(
+            sa.select(
+                embeddings.c.doc_type,
+                embeddings.c.cre_id,
+                embeddings.c.node_id,
+                embeddings.c.embeddings_content,
+            )
+            .where(embeddings.c.embeddings_content_hash.is_(None))
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            connection.execute(
+                embeddings.update()
+                .where(
+                    sa.and_(
+                        embeddings.c.doc_type == row.doc_type,
+                        embeddings.c.cre_id == row.cre_id,
+                        embeddings.c.node_id == row.node_id,
+                    )
+                )
+                .values(
+                    embeddings_content_hash=hashlib.sha256(
+                        (row.embeddings_content or "").encode()
+                    ).hexdigest()
+                )
+            )
+
+    # embeddings of other dimensions keep no model and are made again
+    for dimensions, model in MODELS_BY_DIMENSIONS.items():
+        connection.execute(
+            embeddings.update()
+            .where(embeddings.c.embeddings_model.is_(None))
+            .where(embeddings.c.embeddings_dimensions == dimensions)
+            .values(embeddings_model=model)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("embeddings", schema=None) as batch_op:
+        batch_op.drop_index("ix_embeddings_embeddings_content_hash")
+        batch_op.drop_column("embeddings_model")
+        batch_op.drop_column("embeddings_content_hash")
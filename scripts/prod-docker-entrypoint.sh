@@ -5,4 +5,4 @@ export FLASK_CONFIG="production"
 export FLASK_APP=`pwd`/cre.py 
 flask db upgrade
 python /code/cre.py --upstream_sync
-gunicorn cre:app -b :5000 --timeout 90
+gunicorn cre:app -b :5000 --timeout 90 --worker-class gthread --threads 8